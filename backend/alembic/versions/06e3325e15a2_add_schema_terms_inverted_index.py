@@ -0,0 +1,45 @@
+"""Add schema terms inverted index
+
+Revision ID: 06e3325e15a2
+Revises: a12c605c47bc
+Create Date: 2026-01-09 11:02:54.917230
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '06e3325e15a2'
+down_revision: Union[str, Sequence[str], None] = 'a12c605c47bc'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('schema_terms',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('field', sa.String(length=32), nullable=False),
+    sa.Column('term', sa.String(length=255), nullable=False),
+    sa.Column('version_id', sa.String(length=36), nullable=False),
+    sa.Column('session_id', sa.String(length=36), nullable=False),
+    sa.ForeignKeyConstraint(['session_id'], ['sessions.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['version_id'], ['versions.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_schema_terms_field_term', 'schema_terms', ['field', 'term'], unique=False)
+    op.create_index('idx_schema_terms_version', 'schema_terms', ['version_id'], unique=False)
+    op.create_index('idx_schema_terms_session', 'schema_terms', ['session_id'], unique=False)
+
+    # 已有数据的索引需执行：python -m app.cli.reindex
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_schema_terms_session', table_name='schema_terms')
+    op.drop_index('idx_schema_terms_version', table_name='schema_terms')
+    op.drop_index('idx_schema_terms_field_term', table_name='schema_terms')
+    op.drop_table('schema_terms')
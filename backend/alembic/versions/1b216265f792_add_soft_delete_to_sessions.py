@@ -0,0 +1,30 @@
+"""Add soft delete to sessions
+
+Revision ID: 1b216265f792
+Revises: 0ce629caf52d
+Create Date: 2026-01-06 10:12:31.204518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1b216265f792'
+down_revision: Union[str, Sequence[str], None] = '0ce629caf52d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('sessions', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.create_index('idx_sessions_deleted_at', 'sessions', ['deleted_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_sessions_deleted_at', table_name='sessions')
+    op.drop_column('sessions', 'deleted_at')
@@ -0,0 +1,56 @@
+"""Keep search and schema index rows for archived versions
+
+Revision ID: 3b8d0f6a2c17
+Revises: c7f2e91a4d58
+Create Date: 2026-01-19 10:18:52.604137
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b8d0f6a2c17'
+down_revision: Union[str, Sequence[str], None] = 'c7f2e91a4d58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# SQLite 中的外键没有名称，批量模式下按命名约定引用
+NAMING_CONVENTION = {"fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s"}
+TABLES = ('search_documents', 'schema_terms')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 归档会话的版本行会被删除，但其检索索引需要保留：去掉 version_id 上的级联外键，
+    # 索引行改为由 SessionPurger 按会话显式清理
+    if op.get_bind().dialect.name == 'sqlite':
+        for table in TABLES:
+            with op.batch_alter_table(table, naming_convention=NAMING_CONVENTION) as batch_op:
+                batch_op.drop_constraint(f'fk_{table}_version_id_versions', type_='foreignkey')
+    else:
+        for table in TABLES:
+            op.drop_constraint(f'{table}_version_id_fkey', table, type_='foreignkey')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # 已归档版本的索引行没有对应的版本行，恢复外键前先删除
+    for table in TABLES:
+        op.execute(
+            f"DELETE FROM {table} WHERE version_id IS NOT NULL "
+            f"AND version_id NOT IN (SELECT id FROM versions)"
+        )
+    if op.get_bind().dialect.name == 'sqlite':
+        for table in TABLES:
+            with op.batch_alter_table(table, naming_convention=NAMING_CONVENTION) as batch_op:
+                batch_op.create_foreign_key(
+                    f'fk_{table}_version_id_versions', 'versions', ['version_id'], ['id'], ondelete='CASCADE'
+                )
+    else:
+        for table in TABLES:
+            op.create_foreign_key(
+                f'{table}_version_id_fkey', table, 'versions', ['version_id'], ['id'], ondelete='CASCADE'
+            )
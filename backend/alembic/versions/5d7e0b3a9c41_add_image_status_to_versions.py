@@ -0,0 +1,28 @@
+"""Add image_status to versions
+
+Revision ID: 5d7e0b3a9c41
+Revises: 98ce2e8efbd9
+Create Date: 2026-01-14 10:12:31.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d7e0b3a9c41'
+down_revision: Union[str, Sequence[str], None] = '98ce2e8efbd9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('versions', sa.Column('image_status', sa.String(length=20), server_default='final', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('versions', 'image_status')
@@ -0,0 +1,32 @@
+"""Add archive columns to sessions
+
+Revision ID: 98ce2e8efbd9
+Revises: 06e3325e15a2
+Create Date: 2026-01-12 09:27:45.662018
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '98ce2e8efbd9'
+down_revision: Union[str, Sequence[str], None] = '06e3325e15a2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('sessions', sa.Column('archived_at', sa.DateTime(), nullable=True))
+    op.add_column('sessions', sa.Column('archive_path', sa.String(length=500), nullable=True))
+    op.add_column('sessions', sa.Column('summary', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('sessions', 'summary')
+    op.drop_column('sessions', 'archive_path')
+    op.drop_column('sessions', 'archived_at')
@@ -0,0 +1,58 @@
+"""Add full text search index
+
+Revision ID: a12c605c47bc
+Revises: 1b216265f792
+Create Date: 2026-01-08 15:41:07.381904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a12c605c47bc'
+down_revision: Union[str, Sequence[str], None] = '1b216265f792'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('search_documents',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('doc_key', sa.String(length=40), nullable=False),
+    sa.Column('session_id', sa.String(length=36), nullable=False),
+    sa.Column('version_id', sa.String(length=36), nullable=True),
+    sa.ForeignKeyConstraint(['session_id'], ['sessions.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['version_id'], ['versions.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('doc_key')
+    )
+    op.create_index('idx_search_documents_session', 'search_documents', ['session_id'], unique=False)
+
+    # 方言相关的倒排索引（SQLite FTS5 / PostgreSQL tsvector + GIN）
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE search_fts "
+            "USING fts5(content, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+    elif dialect == 'postgresql':
+        op.add_column('search_documents', sa.Column('tsv', postgresql.TSVECTOR(), nullable=True))
+        op.create_index('idx_search_documents_tsv', 'search_documents', ['tsv'], unique=False, postgresql_using='gin')
+
+    # 已有数据的索引需执行：python -m app.cli.reindex
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute("DROP TABLE IF EXISTS search_fts")
+    elif dialect == 'postgresql':
+        op.drop_index('idx_search_documents_tsv', table_name='search_documents')
+    op.drop_index('idx_search_documents_session', table_name='search_documents')
+    op.drop_table('search_documents')
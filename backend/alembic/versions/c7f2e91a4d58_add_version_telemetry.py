@@ -0,0 +1,71 @@
+"""Add version telemetry and hourly rollups
+
+Revision ID: c7f2e91a4d58
+Revises: 5d7e0b3a9c41
+Create Date: 2026-01-16 15:40:07.362915
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7f2e91a4d58'
+down_revision: Union[str, Sequence[str], None] = '5d7e0b3a9c41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('version_telemetry',
+    sa.Column('version_id', sa.String(length=36), nullable=False),
+    sa.Column('session_id', sa.String(length=36), nullable=False),
+    sa.Column('kind', sa.String(length=16), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('llm_model', sa.String(length=64), nullable=True),
+    sa.Column('llm_ms', sa.Integer(), nullable=False),
+    sa.Column('llm_calls', sa.Integer(), nullable=False),
+    sa.Column('retries', sa.Integer(), nullable=False),
+    sa.Column('prompt_tokens', sa.Integer(), nullable=False),
+    sa.Column('completion_tokens', sa.Integer(), nullable=False),
+    sa.Column('image_model', sa.String(length=64), nullable=True),
+    sa.Column('image_ms', sa.Integer(), nullable=False),
+    sa.Column('image_bytes', sa.Integer(), nullable=False),
+    sa.Column('fallback', sa.Boolean(), nullable=False),
+    sa.PrimaryKeyConstraint('version_id')
+    )
+    op.create_index('idx_version_telemetry_session', 'version_telemetry', ['session_id', 'created_at'], unique=False)
+    op.create_index('idx_version_telemetry_created_at', 'version_telemetry', ['created_at'], unique=False)
+
+    op.create_table('telemetry_rollups',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('bucket_start', sa.DateTime(), nullable=False),
+    sa.Column('kind', sa.String(length=16), nullable=False),
+    sa.Column('llm_model', sa.String(length=64), nullable=False),
+    sa.Column('image_model', sa.String(length=64), nullable=False),
+    sa.Column('versions', sa.Integer(), nullable=False),
+    sa.Column('fallbacks', sa.Integer(), nullable=False),
+    sa.Column('llm_calls', sa.Integer(), nullable=False),
+    sa.Column('retries', sa.Integer(), nullable=False),
+    sa.Column('prompt_tokens', sa.BigInteger(), nullable=False),
+    sa.Column('completion_tokens', sa.BigInteger(), nullable=False),
+    sa.Column('image_bytes', sa.BigInteger(), nullable=False),
+    sa.Column('llm_histogram', sa.JSON(), nullable=False),
+    sa.Column('image_histogram', sa.JSON(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_telemetry_rollups_bucket', 'telemetry_rollups', ['bucket_start', 'kind', 'llm_model', 'image_model'], unique=True)
+
+    # 遥测从升级后创建的版本开始记录，历史版本没有对应数据
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_telemetry_rollups_bucket', table_name='telemetry_rollups')
+    op.drop_table('telemetry_rollups')
+    op.drop_index('idx_version_telemetry_created_at', table_name='version_telemetry')
+    op.drop_index('idx_version_telemetry_session', table_name='version_telemetry')
+    op.drop_table('version_telemetry')
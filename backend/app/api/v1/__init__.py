@@ -5,6 +5,9 @@ from fastapi import APIRouter
 from .generate import router as generate_router
 from .feedback import router as feedback_router
 from .sessions import router as sessions_router
+from .search import router as search_router
+from .transfer import router as transfer_router
+from .telemetry import router as telemetry_router
 
 api_router = APIRouter()
 
@@ -12,4 +15,7 @@ api_router = APIRouter()
 api_router.include_router(generate_router, tags=["generate"])
 api_router.include_router(feedback_router, tags=["feedback"])
 api_router.include_router(sessions_router, tags=["sessions"])
+api_router.include_router(search_router, tags=["search"])
+api_router.include_router(transfer_router, tags=["transfer"])
+api_router.include_router(telemetry_router, tags=["telemetry"])
 
@@ -3,24 +3,51 @@
 阶段 1: Mock 服务
 阶段 2: 真实 API
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 from sqlalchemy.orm import Session as SQLSession
+from typing import Any, Dict, Optional
+from uuid import uuid4
 
-from app.schemas.requests import FeedbackRequest
-from app.schemas.responses import FeedbackResponse
+from app.models import Version
+from app.schemas.requests import (
+    EditRequest, FeedbackBatchRequest, FeedbackCandidatesRequest, FeedbackPreviewRequest, FeedbackRequest
+)
+from app.schemas.responses import FeedbackCandidatesResponse, FeedbackPreviewResponse, FeedbackResponse
 from app.core.database import get_db
+from app.core.metrics import RequestTrace, combine_traces, current_trace, isolated_trace
 from app.services.feedback_engine import FeedbackEngine, ConflictError
+from app.services.feedback_rules import fast_path_stats
+from app.services.schema_compactor import compaction_stats
+from app.services.cache import TTLCache
 from app.services.image_adapter import ImageAdapter
 from app.services.session_manager import SessionManager
+from app.services.progressive import IMAGE_STATUS_DRAFT, IMAGE_STATUS_FINAL, announce_draft, render_final_image
 from app.config import settings
 
 router = APIRouter()
 
+# 反馈预览结果：token -> (session_id, version_id, feedback, result, trace)
+# trace 为预览时 LLM 调用的记录，采用时计入新版本的遥测
+_preview_cache = TTLCache(maxsize=1024, ttl=settings.feedback_preview_ttl_seconds)
+
+
+@router.get("/feedback/fast-path/stats")
+async def fast_path_statistics():
+    """本地规则快速通道的命中统计（进程启动以来）"""
+    return fast_path_stats.snapshot()
+
+
+@router.get("/feedback/compaction/stats")
+async def compaction_statistics():
+    """Schema 压缩的累计节省量（进程启动以来）"""
+    return compaction_stats.snapshot()
+
 
 @router.post("/sessions/{session_id}/feedback", response_model=FeedbackResponse)
 async def feedback(
     session_id: str,
     request: FeedbackRequest,
+    background_tasks: BackgroundTasks,
     db: SQLSession = Depends(get_db)
 ):
     """
@@ -28,16 +55,19 @@ async def feedback(
 
     流程：
     1. 获取当前版本的 Schema
-    2. 调用 FeedbackEngine 生成 Diff（阶段1用Mock）
-    3. 调用 ImageAdapter 生成新图片（阶段1下载picsum图片）
+    2. 调用 FeedbackEngine 生成 Diff（阶段1用Mock）；
+       传入 /feedback/preview 返回的 preview_token 时直接采用预览结果
+    3. 调用 ImageAdapter 生成新图片（阶段1本地生成 mock 图片）
     4. 存储新版本到数据库
     5. 返回结果
+
+    progressive=true 时第 3 步只生成草图，正式图在响应返回后于后台渲染并替换
     """
     try:
         # 初始化服务（从配置读取 use_real_api）
         feedback_engine = FeedbackEngine(use_real_api=settings.use_real_api)
-        image_adapter = ImageAdapter(use_real_api=settings.use_real_api)
         session_manager = SessionManager(db)
+        await session_manager.restore_if_archived(session_id)
 
         # 1. 获取当前版本
         current_version = session_manager.get_version(
@@ -47,49 +77,249 @@ async def feedback(
         if not current_version:
             raise HTTPException(status_code=404, detail="版本不存在")
 
-        # 2. 分析反馈并生成 Diff
-        result = feedback_engine.analyze_feedback(
-            feedback=request.feedback,
-            current_schema=current_version.schema
+        # 2. 分析反馈并生成 Diff（有预览 token 时直接采用预览结果）
+        feedback_text = request.feedback
+        result = None
+        preview_trace = None
+        if request.preview_token:
+            cached = _preview_cache.pop(request.preview_token)
+            if cached and cached[0] == session_id and cached[1] == current_version.id:
+                _, _, feedback_text, result, preview_trace = cached
+            elif not request.feedback:
+                raise HTTPException(status_code=410, detail="反馈预览已过期或与当前版本不匹配，请重新提交反馈")
+
+        if result is None:
+            if not feedback_text:
+                raise HTTPException(status_code=400, detail="feedback 和 preview_token 至少提供一个")
+            result = feedback_engine.analyze_feedback(
+                feedback=feedback_text,
+                current_schema=current_version.schema
+            )
+
+        # 3-5. 生成新图片、存储新版本并返回
+        return await _create_version(
+            session_id, current_version, result, feedback_text,
+            request.progressive, session_manager, background_tasks,
+            kind="feedback", preview_trace=preview_trace
         )
 
-        diff = result["diff"]
-        new_schema = result["new_schema"]
-        prompt = result["prompt"]
+    except HTTPException:
+        raise
+    except ConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"内部错误: {str(e)}")
+
+
+@router.post("/sessions/{session_id}/feedback/preview", response_model=FeedbackPreviewResponse)
+async def feedback_preview(
+    session_id: str,
+    request: FeedbackPreviewRequest,
+    db: SQLSession = Depends(get_db)
+):
+    """
+    反馈预览（只生成 Diff、新 Schema 和 Prompt，不生成图片）
+
+    结果在服务端保留 FEEDBACK_PREVIEW_TTL_SECONDS 秒，
+    之后调用 /feedback 时传入 preview_token 即可直接采用，无需再次调用 LLM。
+    """
+    try:
+        feedback_engine = FeedbackEngine(use_real_api=settings.use_real_api)
+        session_manager = SessionManager(db)
+        await session_manager.restore_if_archived(session_id)
+
+        current_version = session_manager.get_version(
+            session_id=session_id,
+            version_number=request.version
+        )
+        if not current_version:
+            raise HTTPException(status_code=404, detail="版本不存在")
+
+        with isolated_trace() as preview_trace:
+            result = feedback_engine.analyze_feedback(
+                feedback=request.feedback,
+                current_schema=current_version.schema
+            )
+
+        preview_token = uuid4().hex
+        _preview_cache.set(preview_token, (session_id, current_version.id, request.feedback, result, preview_trace))
+
+        return FeedbackPreviewResponse(
+            session_id=session_id,
+            version=current_version.version_number,
+            preview_token=preview_token,
+            diff=result["diff"],
+            schema=result["new_schema"],
+            prompt=result["prompt"]
+        )
+
+    except HTTPException:
+        raise
+    except ConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"内部错误: {str(e)}")
+
+
+@router.post("/sessions/{session_id}/feedback/candidates", response_model=FeedbackCandidatesResponse)
+async def feedback_candidates(
+    session_id: str,
+    request: FeedbackCandidatesRequest,
+    db: SQLSession = Depends(get_db)
+):
+    """
+    多候选反馈（反馈含义模糊时，一次 LLM 调用返回多个候选，不生成图片）
+
+    每个候选都有自己的 preview_token，用户选定后调用 /feedback 传入即可提交，
+    无需再次调用 LLM。最多返回 count 个候选，规范化后重复或不合法的候选会被丢弃，
+    因此 candidates 可能少于 requested。
+    """
+    try:
+        feedback_engine = FeedbackEngine(use_real_api=settings.use_real_api)
+        session_manager = SessionManager(db)
+        await session_manager.restore_if_archived(session_id)
+
+        current_version = session_manager.get_version(
+            session_id=session_id,
+            version_number=request.version
+        )
+        if not current_version:
+            raise HTTPException(status_code=404, detail="版本不存在")
+
+        with isolated_trace() as preview_trace:
+            results = feedback_engine.analyze_feedback_candidates(
+                feedback=request.feedback,
+                current_schema=current_version.schema,
+                count=request.count
+            )
+
+        candidates = []
+        for result in results:
+            # 候选来自同一次 LLM 调用，最多只有一个被采用，共用同一个 trace
+            preview_token = uuid4().hex
+            _preview_cache.set(preview_token, (session_id, current_version.id, request.feedback, result, preview_trace))
+            candidates.append(FeedbackPreviewResponse(
+                session_id=session_id,
+                version=current_version.version_number,
+                preview_token=preview_token,
+                diff=result["diff"],
+                schema=result["new_schema"],
+                prompt=result["prompt"]
+            ))
 
-        # 3. 生成新图片（传入参考图片路径）
-        next_version_number = current_version.version_number + 1
-        image_result = await image_adapter.generate_image(
-            prompt=prompt,
+        return FeedbackCandidatesResponse(
             session_id=session_id,
-            version=next_version_number,
-            reference_image_path=current_version.image_path
+            version=current_version.version_number,
+            requested=request.count,
+            candidates=candidates
         )
 
-        # 4. 存储新版本
-        new_version = session_manager.create_version(
+    except HTTPException:
+        raise
+    except ConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"内部错误: {str(e)}")
+
+
+@router.post("/sessions/{session_id}/feedback/batch", response_model=FeedbackResponse)
+async def feedback_batch(
+    session_id: str,
+    request: FeedbackBatchRequest,
+    background_tasks: BackgroundTasks,
+    db: SQLSession = Depends(get_db)
+):
+    """
+    批量反馈（例如连续输入的 "太暗"、"背景太乱"、"风格更写实"）
+
+    全部反馈合并为一个 Diff（最多一次 LLM 调用），只生成一张图片、一个新版本；
+    合并后互相抵消（Schema 没有变化）时返回 400，不生成新版本
+    """
+    try:
+        feedback_engine = FeedbackEngine(use_real_api=settings.use_real_api)
+        session_manager = SessionManager(db)
+        await session_manager.restore_if_archived(session_id)
+
+        current_version = session_manager.get_version(
             session_id=session_id,
-            schema=new_schema,
-            prompt=prompt,
-            image_url=image_result["image_url"],
-            image_path=image_result["image_path"],
-            user_feedback=request.feedback,
-            diff=diff,
-            parent_version_id=current_version.id
+            version_number=request.version
+        )
+        if not current_version:
+            raise HTTPException(status_code=404, detail="版本不存在")
+
+        result = feedback_engine.analyze_feedback_batch(
+            feedbacks=request.feedbacks,
+            current_schema=current_version.schema
         )
 
-        # 5. 返回响应
-        return FeedbackResponse(
+        return await _create_version(
+            session_id, current_version, result, "；".join(result["feedbacks"]),
+            request.progressive, session_manager, background_tasks,
+            kind="feedback"
+        )
+
+    except HTTPException:
+        raise
+    except ConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"内部错误: {str(e)}")
+
+
+@router.post("/sessions/{session_id}/edit", response_model=FeedbackResponse)
+async def edit(
+    session_id: str,
+    request: EditRequest,
+    background_tasks: BackgroundTasks,
+    db: SQLSession = Depends(get_db)
+):
+    """
+    直接编辑 Schema（提交结构化 Prompt Diff，不调用 LLM）
+
+    适用于用户明确知道要改什么的场景，例如从 negative 中移除某个元素、
+    微调 weights.style。Diff 经过校验、应用、冲突检测和 Prompt 渲染后生成新版本。
+    """
+    try:
+        feedback_engine = FeedbackEngine(use_real_api=False)
+        session_manager = SessionManager(db)
+        await session_manager.restore_if_archived(session_id)
+
+        current_version = session_manager.get_version(
             session_id=session_id,
-            version=new_version.version_number,
-            parent_version=request.version,
-            diff=diff,
-            schema=new_schema,
-            prompt=prompt,
-            image_url=image_result["image_url"],
-            created_at=new_version.created_at.isoformat()
+            version_number=request.version
+        )
+        if not current_version:
+            raise HTTPException(status_code=404, detail="版本不存在")
+
+        result = feedback_engine.apply_edit(
+            diff={"operations": request.operations, "reasoning": request.reasoning},
+            current_schema=current_version.schema
+        )
+
+        return await _create_version(
+            session_id, current_version, result, None,
+            request.progressive, session_manager, background_tasks,
+            kind="edit"
         )
 
+    except HTTPException:
+        raise
     except ConflictError as e:
         raise HTTPException(status_code=409, detail=str(e))
     except ValueError as e:
@@ -98,3 +328,71 @@ async def feedback(
         raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"内部错误: {str(e)}")
+
+
+async def _create_version(
+    session_id: str,
+    current_version: Version,
+    result: Dict[str, Any],
+    user_feedback: Optional[str],
+    progressive: bool,
+    session_manager: SessionManager,
+    background_tasks: BackgroundTasks,
+    kind: str,
+    preview_trace: Optional[RequestTrace] = None
+) -> FeedbackResponse:
+    """
+    按 Diff 分析结果生成图片、存储新版本并构造响应
+
+    采用预览结果时，preview_trace（预览时的 LLM 调用）与本请求的图片生成一起计入版本遥测
+    """
+    image_adapter = ImageAdapter(use_real_api=settings.use_real_api)
+
+    diff = result["diff"]
+    new_schema = result["new_schema"]
+    prompt = result["prompt"]
+
+    # 生成新图片（传入参考图片路径）
+    next_version_number = current_version.version_number + 1
+    image_result = await image_adapter.generate_image(
+        prompt=prompt,
+        session_id=session_id,
+        version=next_version_number,
+        reference_image_path=current_version.image_path,
+        draft=progressive
+    )
+    image_status = IMAGE_STATUS_DRAFT if progressive else IMAGE_STATUS_FINAL
+
+    # 存储新版本
+    new_version = session_manager.create_version(
+        session_id=session_id,
+        schema=new_schema,
+        prompt=prompt,
+        image_url=image_result["image_url"],
+        image_path=image_result["image_path"],
+        user_feedback=user_feedback,
+        diff=diff,
+        parent_version_id=current_version.id,
+        image_status=image_status,
+        kind=kind,
+        trace=combine_traces(current_trace(), preview_trace) if preview_trace else None
+    )
+
+    if image_status == IMAGE_STATUS_DRAFT:
+        announce_draft(session_id, new_version.version_number, image_result["image_url"])
+        background_tasks.add_task(
+            render_final_image, session_id, new_version.id, next_version_number,
+            prompt, current_version.image_path
+        )
+
+    return FeedbackResponse(
+        session_id=session_id,
+        version=new_version.version_number,
+        parent_version=current_version.version_number,
+        diff=diff,
+        schema=new_schema,
+        prompt=prompt,
+        image_url=image_result["image_url"],
+        image_status=image_status,
+        created_at=new_version.created_at.isoformat()
+    )
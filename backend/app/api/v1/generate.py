@@ -3,15 +3,20 @@
 阶段 1: Mock 服务
 阶段 2: 真实 API
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session as SQLSession
 
 from app.schemas.requests import GenerateRequest, PreviewRequest
 from app.schemas.responses import GenerateResponse, PreviewResponse
 from app.core.database import get_db
+from app.core.metrics import combine_traces, current_trace, isolated_trace
+from app.core.sse import SSE_HEADERS, format_sse
 from app.services.prompt_engine import PromptEngine
-from app.services.image_adapter import ImageAdapter
+from app.services.image_adapter import ImageAdapter, image_stats
 from app.services.session_manager import SessionManager
+from app.services.speculation import speculation_manager
+from app.services.progressive import IMAGE_STATUS_DRAFT, IMAGE_STATUS_FINAL, announce_draft, render_final_image
 from app.config import settings
 
 router = APIRouter()
@@ -20,6 +25,7 @@ router = APIRouter()
 @router.post("/generate", response_model=GenerateResponse)
 async def generate(
     request: GenerateRequest,
+    background_tasks: BackgroundTasks,
     db: SQLSession = Depends(get_db)
 ):
     """
@@ -27,9 +33,11 @@ async def generate(
 
     流程：
     1. 调用 PromptEngine 生成 Schema（阶段1用Mock）
-    2. 调用 ImageAdapter 生成图片（阶段1下载picsum图片）
+    2. 调用 ImageAdapter 生成图片（阶段1本地生成 mock 图片）
     3. 存储到数据库
     4. 返回结果
+
+    progressive=true 时第 2 步只生成草图，正式图在响应返回后于后台渲染并替换
     """
     try:
         # 初始化服务（从配置读取 use_real_api）
@@ -38,11 +46,20 @@ async def generate(
         session_manager = SessionManager(db)
 
         # 1. 生成或使用已有 Schema
+        speculative_result = None
+        speculative_trace = None
         if request.schema and request.prompt:
             # 用户已确认的 Schema（来自 preview）
             schema = request.schema
             prompt = request.prompt
+            if request.preview_token:
+                # Schema 未修改时采用预览阶段的投机生成结果
+                adopted = await speculation_manager.adopt(request.preview_token, schema, prompt)
+                if adopted:
+                    speculative_result, speculative_trace = adopted
         else:
+            if request.preview_token:
+                speculation_manager.cancel(request.preview_token)
             # 重新生成 Schema
             result = prompt_engine.generate_schema(request.user_input)
             schema = result["schema"]
@@ -50,18 +67,26 @@ async def generate(
 
         # 2. 创建或获取 Session
         if request.session_id:
+            await session_manager.restore_if_archived(request.session_id)
             session = session_manager.get_session(request.session_id)
             if not session:
                 raise HTTPException(status_code=404, detail="会话不存在")
         else:
             session = session_manager.create_session()
 
-        # 3. 生成图片
-        image_result = await image_adapter.generate_image(
-            prompt=prompt,
-            session_id=session.id,
-            version=1
-        )
+        # 3. 生成图片（已有投机结果时直接使用；渐进式生成先出草图）
+        image_status = IMAGE_STATUS_FINAL
+        if speculative_result:
+            image_result = image_adapter.place_image(speculative_result["image_path"], session.id, 1)
+        else:
+            if request.progressive:
+                image_status = IMAGE_STATUS_DRAFT
+            image_result = await image_adapter.generate_image(
+                prompt=prompt,
+                session_id=session.id,
+                version=1,
+                draft=request.progressive
+            )
 
         # 4. 存储版本到数据库
         version = session_manager.create_version(
@@ -70,9 +95,19 @@ async def generate(
             prompt=prompt,
             image_url=image_result["image_url"],
             image_path=image_result["image_path"],
-            user_input=request.user_input
+            user_input=request.user_input,
+            image_status=image_status,
+            kind="generate",
+            # 采用投机结果时，预览阶段的 LLM 调用和后台图片生成计入该版本
+            trace=combine_traces(current_trace(), speculative_trace) if speculative_trace else None
         )
 
+        if image_status == IMAGE_STATUS_DRAFT:
+            announce_draft(session.id, version.version_number, image_result["image_url"])
+            background_tasks.add_task(
+                render_final_image, session.id, version.id, version.version_number, prompt
+            )
+
         # 5. 返回响应
         return GenerateResponse(
             session_id=session.id,
@@ -80,6 +115,7 @@ async def generate(
             schema=schema,
             prompt=prompt,
             image_url=image_result["image_url"],
+            image_status=image_status,
             created_at=version.created_at.isoformat()
         )
 
@@ -98,17 +134,26 @@ async def preview_prompt(request: PreviewRequest):
 
     流程：
     1. 调用 PromptEngine 生成 Schema
-    2. 返回 Schema 和 Prompt（不创建 Session/Version，不生成图片）
+    2. 返回 Schema 和 Prompt（不创建 Session/Version）
+    3. speculative=true 时在后台投机生成图片，返回 preview_token 供 /generate 采用
     """
     try:
         prompt_engine = PromptEngine(use_real_api=settings.use_real_api)
 
-        # 只生成 Schema，不调用 ImageAdapter
-        result = prompt_engine.generate_schema(request.user_input)
+        with isolated_trace() as preview_trace:
+            result = prompt_engine.generate_schema(request.user_input)
+
+        preview_token = None
+        if request.speculative and settings.speculative_generation_enabled:
+            image_adapter = ImageAdapter(use_real_api=settings.use_real_api)
+            preview_token = speculation_manager.start(
+                image_adapter, result["schema"], result["prompt"], trace=preview_trace
+            )
 
         return PreviewResponse(
             schema=result["schema"],
-            prompt=result["prompt"]
+            prompt=result["prompt"],
+            preview_token=preview_token
         )
 
     except ValueError as e:
@@ -117,3 +162,41 @@ async def preview_prompt(request: PreviewRequest):
         raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"内部错误: {str(e)}")
+
+
+@router.get("/preview/speculation/stats")
+async def speculation_statistics():
+    """投机生成统计（开始、采用、取消、过期、失败、跳过次数和采用率）"""
+    return speculation_manager.stats()
+
+
+@router.get("/images/stats")
+async def image_statistics():
+    """图片生成统计（各阶段耗时、参考图上传字节数和编码缓存命中）"""
+    return image_stats.snapshot()
+
+
+@router.post("/preview/stream")
+async def preview_prompt_stream(request: PreviewRequest):
+    """
+    流式预览 Prompt（Server-Sent Events）
+
+    事件：
+    - field：一个 Schema 字段生成完毕 {"field": "subject", "value": [...]}
+    - done：全部完成 {"schema": {...}, "prompt": "..."}
+    - error：生成失败 {"detail": "..."}
+    """
+    if not request.user_input or not request.user_input.strip():
+        raise HTTPException(status_code=400, detail="用户输入不能为空")
+
+    prompt_engine = PromptEngine(use_real_api=settings.use_real_api)
+
+    def event_stream():
+        try:
+            for event in prompt_engine.generate_schema_stream(request.user_input):
+                yield format_sse(event["event"], event["data"])
+        except Exception as e:
+            yield format_sse("error", {"detail": str(e)})
+
+    # 同步生成器由 Starlette 在线程池中迭代，不阻塞事件循环
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
@@ -0,0 +1,97 @@
+"""
+检索 API
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session as SQLSession
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+
+from app.core.database import get_db
+from app.services.search_index import SearchIndex
+from app.services.schema_index import SchemaIndex
+from app.services.session_manager import SessionManager
+
+router = APIRouter()
+
+
+# 响应模型
+class SearchHit(BaseModel):
+    session_id: str
+    name: Optional[str]
+    description: Optional[str]
+    score: float
+    matched_versions: List[int]
+
+class SearchResponse(BaseModel):
+    query: str
+    results: List[SearchHit]
+
+class SimilarRequest(BaseModel):
+    schema: Dict[str, Any]
+    limit: int = 10
+    exclude_session_id: Optional[str] = None
+
+class SimilarHit(BaseModel):
+    session_id: str
+    name: Optional[str]
+    score: float
+    matched: Dict[str, List[str]]
+
+class SimilarResponse(BaseModel):
+    results: List[SimilarHit]
+
+
+@router.get("/search", response_model=SearchResponse)
+async def search(
+    q: str = Query(..., min_length=1, description="检索关键词"),
+    limit: int = Query(20, ge=1, le=100),
+    db: SQLSession = Depends(get_db)
+):
+    """全文检索项目名称、描述、用户输入、反馈和 Prompt"""
+    try:
+        results = SearchIndex(db).search(q, limit=limit)
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return SearchResponse(
+        query=q,
+        results=[SearchHit(**hit) for hit in results]
+    )
+
+
+@router.post("/search/similar", response_model=SimilarResponse)
+async def search_similar(
+    request: SimilarRequest,
+    db: SQLSession = Depends(get_db)
+):
+    """按 Schema 元素加权重合度检索相似项目"""
+    results = SchemaIndex(db).similar_sessions(
+        request.schema,
+        limit=max(1, min(request.limit, 100)),
+        exclude_session_id=request.exclude_session_id
+    )
+    return SimilarResponse(results=[SimilarHit(**hit) for hit in results])
+
+
+@router.get("/sessions/{session_id}/similar", response_model=SimilarResponse)
+async def session_similar(
+    session_id: str,
+    limit: int = Query(10, ge=1, le=100),
+    db: SQLSession = Depends(get_db)
+):
+    """检索与指定项目最新版本相似的其他项目"""
+    manager = SessionManager(db)
+    await manager.restore_if_archived(session_id)
+
+    session = manager.get_session(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="会话不存在")
+    if not session.versions:
+        return SimilarResponse(results=[])
+
+    results = SchemaIndex(db).similar_sessions(
+        session.versions[-1].schema,
+        limit=limit,
+        exclude_session_id=session_id
+    )
+    return SimilarResponse(results=[SimilarHit(**hit) for hit in results])
@@ -1,18 +1,29 @@
 """
 会话和版本管理 API
 """
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session as SQLSession
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 
+from app.config import settings
 from app.core.database import get_db
+from app.core.sse import SSE_HEADERS, format_sse
 from app.services.session_manager import SessionManager
 from app.services.feedback_engine import FeedbackEngine
 from app.services.image_adapter import ImageAdapter
+from app.services.session_purger import purge_sessions_in_background
+from app.services.cache import LRUCache
+from app.services.event_bus import event_bus
+from app.services.diff_algebra import changed_fields, diff_schemas
 
 router = APIRouter()
 
+# 版本不可变，比较结果可以按 (from_id, to_id) 长期缓存
+_compare_cache = LRUCache(maxsize=settings.compare_cache_size)
+
 
 # 响应模型
 class SessionListItem(BaseModel):
@@ -21,6 +32,7 @@ class SessionListItem(BaseModel):
     description: Optional[str]
     thumbnail_url: Optional[str]
     version_count: int
+    archived: bool = False
     created_at: str
     updated_at: str
 
@@ -32,6 +44,9 @@ class UpdateSessionRequest(BaseModel):
     name: Optional[str] = None
     description: Optional[str] = None
 
+class BulkDeleteRequest(BaseModel):
+    session_ids: List[str]
+
 class VersionDetail(BaseModel):
     id: str
     session_id: str
@@ -43,6 +58,7 @@ class VersionDetail(BaseModel):
     prompt: str
     diff: Optional[Dict[str, Any]]
     image_url: str
+    image_status: str
     created_at: str
 
 
@@ -56,6 +72,15 @@ class VersionTreeResponse(BaseModel):
     tree: Dict[str, Any]
 
 
+class CompareResponse(BaseModel):
+    session_id: str
+    from_version: int
+    to_version: int
+    diff: Dict[str, Any]
+    inverse: Dict[str, Any]
+    changed_fields: List[str]
+
+
 class RollbackRequest(BaseModel):
     target_version: int
     new_feedback: Optional[str] = None
@@ -68,6 +93,7 @@ async def get_versions(
 ):
     """获取会话的所有版本"""
     manager = SessionManager(db)
+    await manager.restore_if_archived(session_id)
 
     # 检查会话是否存在
     session = manager.get_session(session_id)
@@ -91,6 +117,7 @@ async def get_versions(
                 prompt=v.prompt,
                 diff=v.diff,
                 image_url=v.image_url,
+                image_status=v.image_status,
                 created_at=v.created_at.isoformat()
             )
             for v in versions
@@ -98,6 +125,45 @@ async def get_versions(
     )
 
 
+@router.get("/sessions/{session_id}/events")
+async def session_events(
+    session_id: str,
+    request: Request,
+    db: SQLSession = Depends(get_db)
+):
+    """
+    订阅会话事件（Server-Sent Events）
+
+    事件：
+    - ready：订阅成功
+    - image_draft：草图已就绪 {"version", "image_url", "image_status"}
+    - image_final：正式图已替换草图 {"version", "image_url", "image_status"}
+    - image_failed：正式图渲染失败（保留草图）{"version", "detail", "image_status"}
+    """
+    manager = SessionManager(db)
+    await manager.restore_if_archived(session_id)
+    if not manager.get_session(session_id):
+        raise HTTPException(status_code=404, detail="会话不存在")
+
+    queue = event_bus.subscribe(session_id)
+
+    async def event_stream():
+        try:
+            yield format_sse("ready", {"session_id": session_id})
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # 心跳注释，保持连接不被代理断开
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(message["event"], message["data"])
+        finally:
+            event_bus.unsubscribe(session_id, queue)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
 @router.get("/sessions/{session_id}/tree", response_model=VersionTreeResponse)
 async def get_version_tree(
     session_id: str,
@@ -105,6 +171,7 @@ async def get_version_tree(
 ):
     """获取版本树结构"""
     manager = SessionManager(db)
+    await manager.restore_if_archived(session_id)
 
     # 检查会话是否存在
     session = manager.get_session(session_id)
@@ -120,6 +187,46 @@ async def get_version_tree(
     )
 
 
+@router.get("/sessions/{session_id}/compare", response_model=CompareResponse)
+async def compare_versions(
+    session_id: str,
+    from_version: int = Query(..., alias="from", description="起始版本号"),
+    to_version: int = Query(..., alias="to", description="目标版本号"),
+    db: SQLSession = Depends(get_db)
+):
+    """
+    比较任意两个版本
+
+    直接对两个版本保存的 Schema 求规范化 Diff，
+    代价只与变化量有关，与中间隔了多少个版本无关
+    """
+    manager = SessionManager(db)
+    await manager.restore_if_archived(session_id)
+
+    source = manager.get_version(session_id, from_version)
+    target = manager.get_version(session_id, to_version)
+    if not source or not target:
+        raise HTTPException(status_code=404, detail="版本不存在")
+
+    cache_key = (source.id, target.id)
+    result = _compare_cache.get(cache_key)
+    if result is None:
+        diff = diff_schemas(source.schema, target.schema)
+        result = {
+            "diff": diff,
+            "inverse": diff_schemas(target.schema, source.schema),
+            "changed_fields": changed_fields(diff)
+        }
+        _compare_cache.set(cache_key, result)
+
+    return CompareResponse(
+        session_id=session_id,
+        from_version=from_version,
+        to_version=to_version,
+        **result
+    )
+
+
 @router.post("/sessions/{session_id}/rollback")
 async def rollback(
     session_id: str,
@@ -135,6 +242,7 @@ async def rollback(
         manager = SessionManager(db)
         feedback_engine = FeedbackEngine(use_real_api=False)
         image_adapter = ImageAdapter(use_real_api=False)
+        await manager.restore_if_archived(session_id)
 
         # 获取目标版本
         target_version = manager.get_version(
@@ -180,7 +288,8 @@ async def rollback(
             image_path=image_result["image_path"],
             user_feedback=request.new_feedback,
             diff=diff,
-            parent_version_id=target_version.id
+            parent_version_id=target_version.id,
+            kind="rollback"
         )
 
         return {
@@ -194,6 +303,8 @@ async def rollback(
             "created_at": new_version.created_at.isoformat()
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"回滚失败: {str(e)}")
 
@@ -212,6 +323,17 @@ async def list_sessions(
 
     return SessionsListResponse(
         sessions=[
+            SessionListItem(
+                id=s.id,
+                name=s.name or f"项目 {s.id[:8]}",
+                description=s.description,
+                thumbnail_url=s.summary.get("thumbnail_url"),
+                version_count=s.summary.get("version_count", 0),
+                archived=True,
+                created_at=s.created_at.isoformat(),
+                updated_at=s.updated_at.isoformat()
+            )
+            if s.archived_at and s.summary else
             SessionListItem(
                 id=s.id,
                 name=s.name or f"项目 {s.id[:8]}",
@@ -237,6 +359,7 @@ async def update_session(
     manager = SessionManager(db)
 
     try:
+        await manager.restore_if_archived(session_id)
         session = manager.update_session(
             session_id,
             name=request.name,
@@ -255,14 +378,37 @@ async def update_session(
 @router.delete("/sessions/{session_id}")
 async def delete_session(
     session_id: str,
+    background_tasks: BackgroundTasks,
     db: SQLSession = Depends(get_db)
 ):
-    """删除项目"""
+    """删除项目（立即返回，图片和版本记录在后台清理）"""
     manager = SessionManager(db)
     success = manager.delete_session(session_id)
 
     if not success:
         raise HTTPException(status_code=404, detail="项目不存在")
 
+    background_tasks.add_task(purge_sessions_in_background, [session_id])
+
     return {"status": "deleted", "session_id": session_id}
 
+
+@router.post("/sessions/bulk-delete")
+async def bulk_delete_sessions(
+    request: BulkDeleteRequest,
+    background_tasks: BackgroundTasks,
+    db: SQLSession = Depends(get_db)
+):
+    """批量删除项目（与单个删除走同一条后台清理路径）"""
+    manager = SessionManager(db)
+    deleted = manager.delete_sessions(request.session_ids)
+
+    if deleted:
+        background_tasks.add_task(purge_sessions_in_background, deleted)
+
+    deleted_set = set(deleted)
+    return {
+        "status": "deleted",
+        "session_ids": deleted,
+        "not_found": [sid for sid in request.session_ids if sid not in deleted_set]
+    }
@@ -0,0 +1,61 @@
+"""
+生成遥测 API
+"""
+from typing import Any, Dict, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session as SQLSession
+
+from app.core.database import get_db
+from app.models import Session
+from app.services.telemetry import TelemetryStore
+
+router = APIRouter()
+
+
+@router.get("/telemetry/summary")
+async def telemetry_summary(
+    hours: int = Query(24, ge=1, le=24 * 90, description="统计最近多少小时（含当前小时）"),
+    window_hours: int = Query(1, ge=1, le=24 * 90, description="每个窗口的小时数"),
+    kind: Optional[str] = Query(None, description="generate / feedback / edit / rollback"),
+    llm_model: Optional[str] = Query(None, description="LLM 模型（mock 表示回退）"),
+    image_model: Optional[str] = Query(None, description="图片模型（mock 表示本地生成）"),
+    db: SQLSession = Depends(get_db)
+) -> Dict[str, Any]:
+    """
+    生成耗时百分位和回退率（按时间窗口）
+
+    已汇总的小时读取 telemetry_rollups 的直方图，百分位数为桶内插值的近似值；
+    当前小时读取明细。
+    """
+    try:
+        return TelemetryStore(db).summarize(
+            hours=hours,
+            window_hours=window_hours,
+            kind=kind,
+            llm_model=llm_model,
+            image_model=image_model
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"内部错误: {str(e)}")
+
+
+@router.get("/sessions/{session_id}/telemetry")
+async def session_telemetry(
+    session_id: str,
+    limit: int = Query(100, ge=1, le=1000),
+    db: SQLSession = Depends(get_db)
+) -> Dict[str, Any]:
+    """会话最近 limit 个版本的生成遥测（不会恢复已归档的会话）"""
+    try:
+        exists = (
+            db.query(Session.id)
+            .filter(Session.id == session_id, Session.deleted_at.is_(None))
+            .first()
+        )
+        if not exists:
+            raise HTTPException(status_code=404, detail="会话不存在")
+        return TelemetryStore(db).session_telemetry(session_id, limit=limit)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"内部错误: {str(e)}")
@@ -0,0 +1,82 @@
+"""
+导出/导入 API
+"""
+import tempfile
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+
+from app.core.database import SessionLocal
+from app.services.session_transfer import SessionExporter, SessionImporter
+
+router = APIRouter()
+
+
+def _stream_export(format: str, session_ids: Optional[List[str]]):
+    """在独立的数据库会话中流式导出（响应发送期间保持会话打开）"""
+    db = SessionLocal()
+    try:
+        exporter = SessionExporter(db)
+        if format == "tar":
+            yield from exporter.iter_tar(session_ids)
+        else:
+            yield from exporter.iter_ndjson(session_ids)
+    finally:
+        db.close()
+
+
+@router.get("/export")
+async def export_sessions(
+    format: str = Query("tar", pattern="^(tar|ndjson)$", description="tar 包含图片，ndjson 仅包含记录"),
+    session_id: Optional[List[str]] = Query(None, description="只导出指定会话（可重复）")
+):
+    """流式导出会话和版本"""
+    if format == "tar":
+        media_type = "application/x-tar"
+        filename = "prism-export.tar"
+    else:
+        media_type = "application/x-ndjson"
+        filename = "prism-export.ndjson"
+
+    return StreamingResponse(
+        _stream_export(format, session_id),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.post("/import")
+async def import_sessions(request: Request):
+    """
+    导入会话和版本
+
+    请求体为 /export 导出的原始内容：
+    - Content-Type: application/x-ndjson → 仅导入记录
+    - 其他 → 按 TAR 包导入（包含图片，支持 gzip 压缩）
+    """
+    content_type = request.headers.get("content-type", "")
+
+    # 请求体先落盘（超过 16MB 自动转为临时文件），避免整体读入内存
+    with tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024) as body:
+        async for chunk in request.stream():
+            body.write(chunk)
+        body.seek(0)
+
+        def run_import():
+            db = SessionLocal()
+            try:
+                importer = SessionImporter(db)
+                if "ndjson" in content_type:
+                    lines = (line.decode("utf-8") for line in body)
+                    return importer.import_ndjson(lines)
+                return importer.import_archive(body)
+            finally:
+                db.close()
+
+        try:
+            stats = await run_in_threadpool(run_import)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"导入失败: {str(e)}")
+
+    return {"status": "imported", **stats}
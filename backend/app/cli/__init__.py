@@ -0,0 +1,3 @@
+"""
+命令行工具
+"""
@@ -0,0 +1,29 @@
+"""
+归档不活跃会话到冷存储
+
+用法（在 backend 目录下，可配置为定时任务）：
+    python -m app.cli.archive                 # 使用 ARCHIVE_AFTER_DAYS
+    python -m app.cli.archive --days 30 --limit 500
+"""
+import argparse
+
+from app.core.database import SessionLocal
+from app.services.session_archiver import SessionArchiver
+
+
+def main():
+    parser = argparse.ArgumentParser(description="归档不活跃会话")
+    parser.add_argument("--days", type=int, default=None, help="不活跃天数阈值（默认 ARCHIVE_AFTER_DAYS）")
+    parser.add_argument("--limit", type=int, default=100, help="本次最多归档的会话数")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        count = SessionArchiver(db).archive_inactive(days=args.days, limit=args.limit)
+        print(f"✅ 归档完成，共 {count} 个会话")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
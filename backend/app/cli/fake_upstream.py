@@ -0,0 +1,56 @@
+"""
+启动本地模拟上游（OpenAI 兼容 Chat Completions + 图片生成）
+
+用法（在 backend 目录下）：
+    python -m app.cli.fake_upstream --port 9100
+    python -m app.cli.fake_upstream --latency-ms 800 --jitter-ms 400 --distribution exponential \
+        --rate-429 0.05 --rate-5xx 0.02 --malformed-rate 0.05 --stream-chunk-delay-ms 30
+
+然后让后端指向模拟上游：
+    USE_REAL_API=true
+    OPENAI_API_BASE=http://127.0.0.1:9100/v1
+    GEMINI_API_BASE=http://127.0.0.1:9100/api/v3
+"""
+import argparse
+
+import uvicorn
+
+from app.testing.fake_upstream import LATENCY_DISTRIBUTIONS, FakeUpstream, FakeUpstreamConfig, create_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟上游")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=0, help="Chat 请求延迟均值")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="延迟抖动（uniform 为 ±范围，exponential 为均值）")
+    parser.add_argument("--distribution", choices=LATENCY_DISTRIBUTIONS, default="fixed", help="延迟分布")
+    parser.add_argument("--image-latency-ms", type=float, default=0, help="图片生成请求延迟均值")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="返回 429 的比例")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="返回 5xx 的比例")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="返回截断 JSON 的比例")
+    parser.add_argument("--stream-chunk-chars", type=int, default=16, help="流式输出每块字符数")
+    parser.add_argument("--stream-chunk-delay-ms", type=float, default=0, help="流式输出块间隔")
+    parser.add_argument("--image-size-cap", type=int, default=1024, help="生成图片的长边上限")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子（故障注入可复现）")
+    args = parser.parse_args()
+
+    config = FakeUpstreamConfig(
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.jitter_ms,
+        latency_distribution=args.distribution,
+        image_latency_ms=args.image_latency_ms,
+        rate_429=args.rate_429,
+        rate_5xx=args.rate_5xx,
+        malformed_rate=args.malformed_rate,
+        stream_chunk_chars=args.stream_chunk_chars,
+        stream_chunk_delay_ms=args.stream_chunk_delay_ms,
+        image_size_cap=args.image_size_cap,
+        seed=args.seed
+    )
+    print(f"🧪 模拟上游启动：http://{args.host}:{args.port}（{config.to_dict()}）")
+    uvicorn.run(create_app(FakeUpstream(config)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
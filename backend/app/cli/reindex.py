@@ -0,0 +1,27 @@
+"""
+重建检索索引
+
+用法（在 backend 目录下）：
+    python -m app.cli.reindex
+"""
+from app.core.database import SessionLocal
+from app.services.search_index import SearchIndex
+from app.services.schema_index import SchemaIndex
+
+
+def main():
+    db = SessionLocal()
+    try:
+        print("🔄 重建全文索引...")
+        count = SearchIndex(db).rebuild()
+        print(f"✅ 全文索引重建完成，共 {count} 个文档")
+
+        print("🔄 重建 Schema 倒排索引...")
+        count = SchemaIndex(db).rebuild()
+        print(f"✅ Schema 倒排索引重建完成，共 {count} 个版本")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+会话导出/导入命令行工具
+
+用法（在 backend 目录下）：
+    # 导出全部会话（含图片）
+    python -m app.cli.transfer export -o backup.tar
+
+    # 只导出指定会话的记录（NDJSON，可用作离线评测数据集）
+    python -m app.cli.transfer export -o dataset.ndjson --format ndjson --session <id>
+
+    # 导入
+    python -m app.cli.transfer import backup.tar
+    python -m app.cli.transfer import dataset.ndjson
+"""
+import argparse
+import sys
+
+from app.core.database import SessionLocal
+from app.services.session_transfer import SessionExporter, SessionImporter
+
+
+def export_command(args):
+    db = SessionLocal()
+    try:
+        exporter = SessionExporter(db, batch_size=args.batch_size)
+        stream = exporter.iter_tar(args.session) if args.format == "tar" else exporter.iter_ndjson(args.session)
+
+        out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+        try:
+            total = 0
+            for chunk in stream:
+                out.write(chunk)
+                total += len(chunk)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+        print(f"✅ 导出完成，共 {total} 字节", file=sys.stderr)
+    finally:
+        db.close()
+
+
+def import_command(args):
+    db = SessionLocal()
+    try:
+        importer = SessionImporter(db, batch_size=args.batch_size)
+        if args.input.endswith(".ndjson"):
+            with open(args.input, "r", encoding="utf-8") as f:
+                stats = importer.import_ndjson(f)
+        else:
+            with open(args.input, "rb") as f:
+                stats = importer.import_archive(f)
+        print(f"✅ 导入完成: {stats}", file=sys.stderr)
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PRISM 会话导出/导入")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="导出会话")
+    export_parser.add_argument("-o", "--output", default="-", help="输出文件（默认标准输出）")
+    export_parser.add_argument("--format", choices=["tar", "ndjson"], default="tar")
+    export_parser.add_argument("--session", action="append", help="只导出指定会话（可重复）")
+    export_parser.add_argument("--batch-size", type=int, default=None)
+    export_parser.set_defaults(func=export_command)
+
+    import_parser = subparsers.add_parser("import", help="导入会话")
+    import_parser.add_argument("input", help="导出的 .tar / .tar.gz / .ndjson 文件")
+    import_parser.add_argument("--batch-size", type=int, default=None)
+    import_parser.set_defaults(func=import_command)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@
 应用配置文件
 使用 Pydantic Settings 管理环境变量
 """
+from typing import Dict
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -27,6 +28,15 @@ class Settings(BaseSettings):
     # API 开关（开发时可设置为 False 使用 mock 数据）
     use_real_api: bool = False
 
+    # mock 模式图片：procedural 为本地确定性生成（离线、可复现），picsum 为下载随机图片
+    mock_image_source: str = "procedural"
+    mock_image_size: str = "1920x1080"  # 草图为一半尺寸
+    mock_image_format: str = "png"  # png / bmp
+    # 模拟上游的延迟（毫秒，均值 ± 抖动）和失败率（0~1）
+    mock_image_latency_ms: int = 0
+    mock_image_latency_jitter_ms: int = 0
+    mock_image_failure_rate: float = 0.0
+
     # 服务配置
     app_env: str = "development"
     debug: bool = True
@@ -37,9 +47,90 @@ class Settings(BaseSettings):
     # 格式：http://your-server-ip:port 或 https://your-domain.com
     public_base_url: str = "http://localhost:8000"
 
+    # 图片尺寸（火山引擎支持 "1K" / "2K" / "4K" 或像素值），渐进式生成时先生成草图
+    image_size: str = "2K"
+    draft_image_size: str = "1K"
+    # 草图被正式图替换后保留的秒数（进行中的反馈可能仍以草图为参考图，0 表示立即删除）
+    draft_retention_seconds: int = 300
+
+    # 参考图（图生图）：反馈迭代时把上一版本图片缩小后作为参考，编码结果按文件缓存
+    reference_image_enabled: bool = True
+    reference_image_max_side: int = 1024
+    reference_image_quality: int = 85
+    reference_cache_size: int = 64
+
     # 图片存储
     storage_path: str = "../storage/images"
 
+    # 冷存储归档：归档文件目录、不活跃天数阈值、缩略图长边像素
+    archive_path: str = "../storage/archives"
+    archive_after_days: int = 7
+    thumbnail_max_side: int = 320
+
+    # 后台清理已删除会话时每批处理的版本数
+    purge_batch_size: int = 200
+
+    # 导出/导入时每批处理的记录数
+    transfer_batch_size: int = 500
+
+    # 版本比较结果缓存条数
+    compare_cache_size: int = 1024
+
+    # 反馈本地规则快速通道：开关、置信度阈值、规则表路径（留空使用内置规则表）
+    feedback_fast_path_enabled: bool = False
+    feedback_fast_path_threshold: float = 0.8
+    feedback_rules_path: str = ""
+
+    # 投机生成：预览时后台提前生成图片（需请求方开启 speculative），
+    # 同时进行的任务上限、结果保留秒数、低于该采用率时暂停投机、过期任务和图片的清理间隔
+    speculative_generation_enabled: bool = True
+    speculative_max_inflight: int = 4
+    speculative_ttl_seconds: int = 300
+    speculative_min_adoption_rate: float = 0.3
+    speculative_sweep_interval_seconds: int = 60
+
+    # 反馈预览结果保留秒数（期间提交反馈可直接采用，无需再次调用 LLM）
+    feedback_preview_ttl_seconds: int = 600
+
+    # 单次 LLM 调用的 prompt token 预算（超出时改用精简 System Prompt 并截断输入，0 表示不限制）
+    llm_context_token_budget: int = 3000
+
+    # Schema 压缩（默认关闭）：近似去重阈值（字符二元组 Jaccard，0 表示关闭）、
+    # 各字段元素上限、渲染后 Prompt 的字符预算（0 表示不限制）
+    schema_compaction_enabled: bool = False
+    schema_similarity_threshold: float = 0.7
+    schema_field_caps: Dict[str, int] = {
+        "subject": 6,
+        "appearance": 8,
+        "style": 6,
+        "composition": 6,
+        "lighting": 6,
+        "background": 6,
+        "quality": 6,
+        "negative": 10,
+    }
+    prompt_char_budget: int = 300
+
+    # 冲突检测规则表路径（留空使用 app/prompts/conflict_rules.json）
+    conflict_rules_path: str = ""
+
+    # 相似项目检索：各 Schema 字段的权重（JSON 格式，未列出的字段权重为 1.0）
+    similarity_field_weights: Dict[str, float] = {
+        "subject": 3.0,
+        "style": 2.0,
+        "appearance": 1.5,
+        "lighting": 1.0,
+        "background": 1.0,
+        "composition": 1.0,
+        "quality": 0.5,
+        "negative": 0.25,
+    }
+
+    # 版本生成遥测：开关、每小时汇总的执行间隔（秒）、明细保留天数（汇总行长期保留）
+    telemetry_enabled: bool = True
+    telemetry_rollup_interval_seconds: int = 300
+    telemetry_retention_days: int = 30
+
     model_config = SettingsConfigDict(
         env_file=".env",
         env_file_encoding="utf-8",
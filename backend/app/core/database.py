@@ -4,6 +4,7 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, Session as SQLSession
 from app.config import settings
+from app.core.metrics import instrument_database
 from app.models import Base
 
 
@@ -19,6 +20,9 @@ engine = create_engine(
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 查询 / 提交计时和连接池指标（见 app/core/metrics.py）
+instrument_database(engine, SessionLocal)
+
 
 def get_db() -> SQLSession:
     """
@@ -43,4 +47,7 @@ def init_db():
     注意：仅在开发环境使用
     生产环境应使用 Alembic 迁移
     """
+    from app.services.search_index import ensure_search_schema
+
     Base.metadata.create_all(bind=engine)
+    ensure_search_schema(engine)
@@ -0,0 +1,535 @@
+"""
+指标与分阶段计时
+
+- span(name)：计时一个处理阶段（LLM 调用、图片生成、下载、写盘、数据库查询……），
+  记入当前请求的 trace（ContextVar，asyncio.to_thread 中同样可见）和阶段耗时直方图
+- upstream_call(upstream, stage)：上游调用的 span，同时维护进行中的调用数和成功 / 失败计数
+- record_fallback(component)：真实 API 失败后回退到 mock 的次数
+- ServerTimingMiddleware：把请求内所有 span 汇总为 Server-Timing 响应头，并记录请求耗时直方图
+- render_metrics()：Prometheus 文本格式，包含以上指标、数据库连接池使用情况，
+  以及 usage_stats / fast_path_stats / speculation / image_stats 的统计
+
+不依赖 prometheus_client，输出格式遵循 Prometheus text exposition 0.0.4。
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+# 默认直方图分桶（秒），覆盖数据库查询（毫秒级）到图片生成（数十秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} 的标签必须是 {self.labelnames}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 标签 → [各分桶计数（非累计）..., 总和, 总数]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            state = self._values.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0, 0])
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        lines = self.header()
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state):
+                cumulative += count
+                labels = _format_labels(self.labelnames + ("le",), key + (_format_value(float(bound)),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{labels} {state[-1]}")
+        return lines
+
+
+# 采集回调：产出 (名称, 类型, 说明, [(标签字典, 值), ...])
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, Any], float]]]]]
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Collector] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Collector):
+        """注册采集回调（在每次 render 时调用，用于汇报其他模块已有的统计）"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                print(f"⚠️ 指标采集失败: {e}")
+                continue
+            for name, kind, documentation, samples in families:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    "prism_stage_duration_seconds", "各处理阶段耗时（LLM、图片生成、下载、写盘、数据库等）", ("stage",)
+)
+HTTP_SECONDS = registry.histogram(
+    "prism_http_request_duration_seconds", "HTTP 请求耗时", ("method", "route", "status")
+)
+UPSTREAM_INFLIGHT = registry.gauge("prism_upstream_inflight", "进行中的上游调用数", ("upstream",))
+UPSTREAM_CALLS = registry.counter(
+    "prism_upstream_calls_total", "上游调用次数（每次重试单独计数）", ("upstream", "outcome")
+)
+FALLBACKS = registry.counter("prism_fallback_total", "真实 API 失败后回退到 mock 的次数", ("component",))
+FEEDBACK_BATCHES = registry.counter(
+    "prism_feedback_batch_total", "批量反馈合并次数（path: rules / llm，outcome: merged / no_change）",
+    ("path", "outcome")
+)
+FEEDBACK_BATCH_ITEMS = registry.counter("prism_feedback_batch_items_total", "批量反馈合并的反馈条数", ("path",))
+
+
+# ---------- 请求内计时 ----------
+
+class RequestTrace:
+    """
+    一个请求内的阶段耗时（同名阶段累加）
+
+    同时记录本次请求的 token 用量、上游重试次数、回退组件和实际调用的模型，
+    创建版本时据此写入版本遥测（app/services/telemetry.py）。
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        # 名称 → [总耗时（秒）, 次数]
+        self.spans: Dict[str, List[float]] = {}
+        self.tokens: Dict[str, int] = {"prompt": 0, "completion": 0}
+        self.retries = 0
+        self.fallbacks: List[str] = []
+        # 上游名称 → 模型名称
+        self.models: Dict[str, str] = {}
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            entry = self.spans.setdefault(name, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+
+    def add_tokens(self, prompt_tokens: int, completion_tokens: int):
+        with self._lock:
+            self.tokens["prompt"] += prompt_tokens
+            self.tokens["completion"] += completion_tokens
+
+    def merge(self, other: "RequestTrace"):
+        """把另一个 trace 的记录累加进来"""
+        with other._lock:
+            spans = {name: list(entry) for name, entry in other.spans.items()}
+            tokens = dict(other.tokens)
+        with self._lock:
+            for name, (seconds, count) in spans.items():
+                entry = self.spans.setdefault(name, [0.0, 0])
+                entry[0] += seconds
+                entry[1] += count
+            for key, value in tokens.items():
+                self.tokens[key] += value
+            self.retries += other.retries
+            self.fallbacks.extend(other.fallbacks)
+            self.models.update(other.models)
+
+    def server_timing(self) -> str:
+        """Server-Timing 头：stage;dur=毫秒;desc="xN"，最后附加 total"""
+        with self._lock:
+            items = list(self.spans.items())
+        parts = []
+        for name, (seconds, count) in items:
+            part = f"{name};dur={seconds * 1000:.1f}"
+            if count > 1:
+                part += f';desc="x{count}"'
+            parts.append(part)
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("prism_request_trace", default=None)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+def combine_traces(*traces: Optional[RequestTrace]) -> RequestTrace:
+    """合并多个 trace 为一个新 trace（不修改原 trace）"""
+    combined = RequestTrace()
+    for trace in traces:
+        if trace is not None:
+            combined.merge(trace)
+    return combined
+
+
+@contextmanager
+def isolated_trace(trace: Optional[RequestTrace] = None, merge: bool = True):
+    """
+    在独立的 trace 中执行一段代码
+
+    用于把一部分工作（预览的 LLM 调用、投机生成的图片）单独记录下来，随 preview_token
+    保存，之后由采用它的请求计入版本遥测。merge=True 时结束后同时累加到外层 trace。
+    """
+    outer = _current_trace.get()
+    trace = trace or RequestTrace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        if merge and outer is not None:
+            outer.merge(trace)
+
+
+def record_span(name: str, seconds: float):
+    """记录一个已完成阶段的耗时"""
+    STAGE_SECONDS.observe(seconds, stage=name)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, seconds)
+
+
+@contextmanager
+def span(name: str):
+    """计时一个处理阶段（异常时同样记录）"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start)
+
+
+@contextmanager
+def upstream_call(
+    upstream: str,
+    stage: Optional[str] = None,
+    model: Optional[str] = None,
+    attempt: int = 0
+):
+    """
+    跟踪一次上游调用（每次重试单独调用）
+
+    Args:
+        upstream: 上游名称（openai / seedream）
+        stage: span 名称（为空时不计时，由调用方自行记录）
+        model: 调用的模型名称（记录到当前请求的 trace）
+        attempt: 第几次尝试（从 0 开始，大于 0 时计为一次重试）
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        if model:
+            trace.models[upstream] = model
+        if attempt:
+            trace.retries += 1
+    UPSTREAM_INFLIGHT.inc(upstream=upstream)
+    outcome = "error"
+    try:
+        if stage:
+            with span(stage):
+                yield
+        else:
+            yield
+        outcome = "ok"
+    finally:
+        UPSTREAM_INFLIGHT.dec(upstream=upstream)
+        UPSTREAM_CALLS.inc(upstream=upstream, outcome=outcome)
+
+
+def record_fallback(component: str):
+    """记录一次回退到 mock"""
+    FALLBACKS.inc(component=component)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.fallbacks.append(component)
+
+
+def record_feedback_batch(path: str, items: int, changed: bool):
+    """记录一次批量反馈合并（changed=False 表示合并后互相抵消，没有净修改）"""
+    FEEDBACK_BATCHES.inc(path=path, outcome="merged" if changed else "no_change")
+    FEEDBACK_BATCH_ITEMS.inc(items, path=path)
+
+
+def record_tokens(prompt_tokens: int, completion_tokens: int):
+    """记录当前请求的 LLM token 用量"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_tokens(prompt_tokens, completion_tokens)
+
+
+# ---------- 中间件 ----------
+
+class ServerTimingMiddleware:
+    """
+    为每个 HTTP 请求建立 trace，响应头写入 Server-Timing，并记录请求耗时
+
+    纯 ASGI 中间件，不缓冲响应体（SSE 等流式响应不受影响）；
+    响应头发送时已完成的阶段才会出现在 Server-Timing 中。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace()
+        token = _current_trace.set(trace)
+        status = {"code": 500}
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_trace.reset(token)
+            HTTP_SECONDS.observe(
+                time.perf_counter() - trace.started,
+                method=scope["method"],
+                route=_route_template(scope),
+                status=status["code"]
+            )
+
+
+def _route_template(scope) -> str:
+    """
+    请求匹配到的路由模板（/api/v1/sessions/{session_id}/feedback）
+
+    使用模板而不是实际路径，避免标签基数过大。包含进来的路由器上
+    route.path 不带前缀（/api/v1），按段数从实际路径补回。
+    """
+    template = getattr(scope.get("route"), "path", None)
+    if not template:
+        return "unmatched"
+    path = scope.get("path", "")
+    extra = path.rstrip("/").count("/") - template.rstrip("/").count("/")
+    if extra > 0:
+        template = "/".join(path.split("/")[:extra + 1]) + template
+    return template
+
+
+# ---------- 数据库 ----------
+
+def instrument_database(engine, session_factory=None):
+    """
+    数据库计时：每条 SQL 记为 db.query，ORM 会话提交（含 flush）记为 db.commit；
+    并在 /metrics 中汇报连接池使用情况
+    """
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("prism_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("prism_query_start")
+        if starts:
+            record_span("db.query", time.perf_counter() - starts.pop())
+
+    if session_factory is not None:
+        @event.listens_for(session_factory, "before_commit")
+        def _before_commit(session):
+            session.info["prism_commit_start"] = time.perf_counter()
+
+        @event.listens_for(session_factory, "after_commit")
+        def _after_commit(session):
+            start = session.info.pop("prism_commit_start", None)
+            if start is not None:
+                record_span("db.commit", time.perf_counter() - start)
+
+    def pool_collector():
+        pool = engine.pool
+        samples = []
+        for metric, method in (("size", "size"), ("checked_out", "checkedout"), ("overflow", "overflow"),
+                               ("checked_in", "checkedin")):
+            reader = getattr(pool, method, None)
+            if callable(reader):
+                samples.append(({"state": metric}, reader()))
+        yield "prism_db_pool_connections", "gauge", "数据库连接池使用情况", samples
+
+    registry.add_collector(pool_collector)
+
+
+# ---------- 其他模块已有的统计 ----------
+
+def _service_collector():
+    from app.services.context_builder import usage_stats
+    from app.services.feedback_rules import fast_path_stats
+    from app.services.image_adapter import image_stats
+    from app.services.schema_compactor import compaction_stats
+    from app.services.speculation import speculation_manager
+    from app.services.token_counter import token_counter_mode
+
+    usage = usage_stats.snapshot()
+    yield "prism_llm_calls_total", "counter", "LLM 调用次数", [
+        ({"kind": kind}, totals["calls"]) for kind, totals in usage.items()
+    ]
+    yield "prism_llm_tokens_total", "counter", "LLM token 用量", [
+        ({"kind": kind, "type": token_type}, totals[f"{token_type}_tokens"])
+        for kind, totals in usage.items()
+        for token_type in ("prompt", "completion", "cached")
+    ]
+    yield "prism_llm_heuristic_budget_calls_total", "counter", "上下文预算按字符估算的 LLM 调用次数", [
+        ({"kind": kind}, totals["heuristic_calls"]) for kind, totals in usage.items()
+    ]
+    yield "prism_token_counter_exact", "gauge", "token 计数是否使用 tiktoken（0 表示按字符估算）", [
+        ({}, 1 if token_counter_mode() == "tiktoken" else 0)
+    ]
+
+    fast_path = fast_path_stats.snapshot()
+    yield "prism_feedback_fast_path_total", "counter", "反馈本地规则快速通道", [
+        ({"outcome": "hit"}, fast_path["hits"]),
+        ({"outcome": "escalated"}, fast_path["escalated"])
+    ]
+
+    compaction = compaction_stats.snapshot()
+    yield "prism_schema_compaction_removed_total", "counter", "Schema 压缩移除的元素数", [
+        ({"reason": reason}, count) for reason, count in compaction["removed"].items()
+    ]
+    yield "prism_schema_compaction_saved_total", "counter", "Schema 压缩节省量", [
+        ({"unit": "chars"}, compaction["chars_saved"]),
+        ({"unit": "tokens"}, compaction["tokens_saved"])
+    ]
+
+    speculation = speculation_manager.stats()
+    yield "prism_speculation_total", "counter", "投机生成结果", [
+        ({"outcome": outcome}, speculation[outcome])
+        for outcome in ("started", "adopted", "cancelled", "expired", "failed", "skipped")
+    ]
+    yield "prism_speculation_inflight", "gauge", "进行中的投机生成任务数", [({}, speculation["inflight"])]
+
+    reference = image_stats.snapshot()["reference"]
+    yield "prism_reference_image_uploads_total", "counter", "参考图上传次数", [
+        ({"cache": "hit"}, reference["cache_hits"]),
+        ({"cache": "miss"}, reference["cache_misses"])
+    ]
+    yield "prism_reference_image_upload_bytes_total", "counter", "参考图上传字节数", [
+        ({}, reference["upload_bytes"])
+    ]
+
+
+registry.add_collector(_service_collector)
+
+
+def render_metrics() -> str:
+    """Prometheus 文本格式的全部指标"""
+    return registry.render()
@@ -0,0 +1,17 @@
+"""
+Server-Sent Events 工具
+"""
+import json
+from typing import Any
+
+# SSE 响应头（禁用缓存和反向代理缓冲，保证事件即时送达）
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no"
+}
+
+
+def format_sse(event: str, data: Any) -> str:
+    """格式化一条 SSE 事件（data 序列化为单行 JSON）"""
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return f"event: {event}\ndata: {payload}\n\n"
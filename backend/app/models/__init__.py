@@ -2,5 +2,7 @@
 数据库模型导出
 """
 from .session import Base, Session, Version
+from .search import SearchDocument, SchemaTerm
+from .telemetry import VersionTelemetry, TelemetryRollup
 
-__all__ = ["Base", "Session", "Version"]
+__all__ = ["Base", "Session", "Version", "SearchDocument", "SchemaTerm", "VersionTelemetry", "TelemetryRollup"]
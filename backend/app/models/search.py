@@ -0,0 +1,58 @@
+"""
+数据库模型 - 全文检索文档
+"""
+from sqlalchemy import Column, String, Integer, ForeignKey, Index
+from .session import Base
+
+
+class SearchDocument(Base):
+    """
+    全文检索文档表
+
+    每个会话（名称 + 描述）和每个版本（用户输入 + 反馈 + Prompt）各对应一行。
+    version_id 不设外键：会话归档后版本行被移出，但索引行保留，归档项目仍可检索。
+    真正的倒排索引在数据库方言相关的结构中：
+    - SQLite: FTS5 虚拟表 search_fts（rowid = search_documents.id）
+    - PostgreSQL: 本表的 tsv 列（tsvector + GIN 索引）
+    """
+    __tablename__ = "search_documents"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    doc_key = Column(String(40), nullable=False, unique=True)
+    session_id = Column(String(36), ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False)
+    version_id = Column(String(36), nullable=True)
+
+    # 索引
+    __table_args__ = (
+        Index("idx_search_documents_session", "session_id"),
+    )
+
+    def __repr__(self):
+        return f"<SearchDocument(id={self.id}, key={self.doc_key})>"
+
+
+class SchemaTerm(Base):
+    """
+    Schema 元素倒排表
+
+    每行表示某个版本的 Schema 在 field 字段中包含元素 term（已归一化），
+    用于按 (field, term) 反查版本和会话，无需反序列化 Version.schema。
+    与 search_documents 相同，version_id 不设外键，归档会话的索引行保留。
+    """
+    __tablename__ = "schema_terms"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    field = Column(String(32), nullable=False)
+    term = Column(String(255), nullable=False)
+    version_id = Column(String(36), nullable=False)
+    session_id = Column(String(36), ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False)
+
+    # 索引
+    __table_args__ = (
+        Index("idx_schema_terms_field_term", "field", "term"),
+        Index("idx_schema_terms_version", "version_id"),
+        Index("idx_schema_terms_session", "session_id"),
+    )
+
+    def __repr__(self):
+        return f"<SchemaTerm(field={self.field}, term={self.term}, version={self.version_id})>"
@@ -24,9 +24,22 @@ class Session(Base):
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
+    # 软删除标记（非空表示已删除，等待后台清理）
+    deleted_at = Column(DateTime, nullable=True)
+
+    # 冷存储归档（非空表示版本和图片已移入 archive_path，summary 保留列表展示所需信息）
+    archived_at = Column(DateTime, nullable=True)
+    archive_path = Column(String(500), nullable=True)
+    summary = Column(JSON, nullable=True)
+
     # 关系
     versions = relationship("Version", back_populates="session", cascade="all, delete-orphan", order_by="Version.version_number")
 
+    # 索引
+    __table_args__ = (
+        Index("idx_sessions_deleted_at", "deleted_at"),
+    )
+
     def __repr__(self):
         return f"<Session(id={self.id}, name={self.name})>"
 
@@ -52,6 +65,8 @@ class Version(Base):
     # 图片数据
     image_url = Column(String(500), nullable=False)
     image_path = Column(String(500), nullable=False)
+    # 图片状态：draft（渐进式生成的草图，正式图渲染中）/ final / failed（正式图渲染失败，保留草图）
+    image_status = Column(String(20), nullable=False, default="final", server_default="final")
 
     # 元数据
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
@@ -0,0 +1,89 @@
+"""
+数据库模型 - 版本生成遥测
+"""
+from datetime import datetime
+from sqlalchemy import Column, String, Integer, BigInteger, Boolean, DateTime, JSON, Index
+from .session import Base
+
+
+class VersionTelemetry(Base):
+    """
+    版本生成遥测表（每个版本一行，创建版本时写入）
+
+    不设外键：会话删除或归档后仍保留，供每小时汇总使用；
+    超过保留期且已汇总的记录由 TelemetryStore.roll_up 清理。
+    耗时单位为毫秒，没有发生对应调用时为 0。
+    """
+    __tablename__ = "version_telemetry"
+
+    version_id = Column(String(36), primary_key=True)
+    session_id = Column(String(36), nullable=False)
+    # generate / feedback / edit / rollback
+    kind = Column(String(16), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    # LLM：实际调用的模型（回退时为 mock，未调用时为空）、总耗时、调用次数、重试次数、token
+    llm_model = Column(String(64), nullable=True)
+    llm_ms = Column(Integer, nullable=False, default=0)
+    llm_calls = Column(Integer, nullable=False, default=0)
+    retries = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+
+    # 图片：模型（本地生成时为 mock，沿用已有图片时为空）、耗时、文件大小
+    image_model = Column(String(64), nullable=True)
+    image_ms = Column(Integer, nullable=False, default=0)
+    image_bytes = Column(Integer, nullable=False, default=0)
+
+    # 是否有任一环节回退到 mock
+    fallback = Column(Boolean, nullable=False, default=False)
+
+    # 索引
+    __table_args__ = (
+        Index("idx_version_telemetry_session", "session_id", "created_at"),
+        Index("idx_version_telemetry_created_at", "created_at"),
+    )
+
+    def __repr__(self):
+        return f"<VersionTelemetry(version={self.version_id}, kind={self.kind})>"
+
+
+class TelemetryRollup(Base):
+    """
+    版本遥测的每小时汇总
+
+    每个 (小时, 类型, LLM 模型, 图片模型) 一行；耗时分布存为固定边界的直方图计数
+    （边界见 app/services/telemetry.py 的 LATENCY_BUCKETS_MS），查询百分位数时
+    只读取汇总行，不扫描 version_telemetry。
+    """
+    __tablename__ = "telemetry_rollups"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    bucket_start = Column(DateTime, nullable=False)
+    kind = Column(String(16), nullable=False)
+    # 空字符串表示未调用（便于唯一索引）
+    llm_model = Column(String(64), nullable=False, default="")
+    image_model = Column(String(64), nullable=False, default="")
+
+    versions = Column(Integer, nullable=False, default=0)
+    fallbacks = Column(Integer, nullable=False, default=0)
+    llm_calls = Column(Integer, nullable=False, default=0)
+    retries = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(BigInteger, nullable=False, default=0)
+    completion_tokens = Column(BigInteger, nullable=False, default=0)
+    image_bytes = Column(BigInteger, nullable=False, default=0)
+
+    # 直方图计数（长度为边界数 + 1，最后一项为超出最大边界的次数）
+    llm_histogram = Column(JSON, nullable=False)
+    image_histogram = Column(JSON, nullable=False)
+
+    # 索引
+    __table_args__ = (
+        Index(
+            "idx_telemetry_rollups_bucket", "bucket_start", "kind", "llm_model", "image_model",
+            unique=True
+        ),
+    )
+
+    def __repr__(self):
+        return f"<TelemetryRollup(bucket={self.bucket_start}, kind={self.kind}, versions={self.versions})>"
@@ -0,0 +1,246 @@
+"""
+不可变 Prompt Schema
+
+字段集合来自 responses.PromptSchema（单一来源），内部表示为：
+- 列表字段（subject / style / ...）：tuple[str, ...]
+- weights：tuple[(key, float), ...]（保持插入顺序）
+- extra：Schema 之外的额外字段（LLM 偶尔会新增字段），tuple[(key, value), ...]
+
+应用 Diff 操作时只复制被修改的字段，其余字段与原 Schema 共享，
+长 Diff 链的重放不再需要 deepcopy 整个字典。
+"""
+from typing import Any, Dict, Iterator, Optional, Tuple, Union
+
+from app.schemas.responses import PromptSchema
+
+
+# 字段定义（模块加载时确定一次）
+SCHEMA_FIELDS: Tuple[str, ...] = tuple(PromptSchema.model_fields)
+LIST_FIELDS: Tuple[str, ...] = tuple(name for name in SCHEMA_FIELDS if name != "weights")
+
+# 权重取值范围和缺省值（与原 _apply_diff 行为一致）
+WEIGHT_MIN = 0.1
+WEIGHT_MAX = 1.5
+WEIGHT_DEFAULT = 0.5
+
+
+def _compile_validator():
+    """
+    编译 Schema 校验函数（只在模块加载时执行一次）
+
+    校验规则：必要字段齐全、列表字段为字符串数组、weights 为数值字典
+    """
+    required = SCHEMA_FIELDS
+    list_fields = frozenset(LIST_FIELDS)
+
+    def validate(data: Dict[str, Any], strict: bool = True):
+        if not isinstance(data, dict):
+            raise ValueError("Schema 必须是 JSON 对象")
+        if strict:
+            for field in required:
+                if field not in data:
+                    raise ValueError(f"Schema 缺少必要字段：{field}")
+        for field, value in data.items():
+            if field in list_fields:
+                if not isinstance(value, list):
+                    raise ValueError(f"Schema 字段 {field} 必须是数组")
+            elif field == "weights":
+                if not isinstance(value, dict):
+                    raise ValueError("Schema 字段 weights 必须是对象")
+                for key, weight in value.items():
+                    if not isinstance(weight, (int, float)) or isinstance(weight, bool):
+                        raise ValueError(f"权重 {key} 必须是数值")
+
+    return validate
+
+
+validate_schema = _compile_validator()
+
+
+class Schema:
+    """不可变、结构共享的 Prompt Schema"""
+
+    __slots__ = LIST_FIELDS + ("weights", "extra")
+
+    def __init__(self, **fields: Any):
+        for name in LIST_FIELDS:
+            object.__setattr__(self, name, tuple(fields.get(name, ())))
+        object.__setattr__(self, "weights", tuple(fields.get("weights", ())))
+        object.__setattr__(self, "extra", tuple(fields.get("extra", ())))
+
+    # ---------- 构造与导出 ----------
+
+    @classmethod
+    def from_dict(cls, data: Union[Dict[str, Any], "Schema"], strict: bool = True) -> "Schema":
+        """
+        从字典构造（已是 Schema 时直接返回）
+
+        Args:
+            strict: 是否要求必要字段齐全（数据库中的历史 Schema 可放宽）
+
+        Raises:
+            ValueError: 校验失败
+        """
+        if isinstance(data, Schema):
+            return data
+        validate_schema(data, strict)
+
+        schema = object.__new__(cls)
+        extra = []
+        for key, value in data.items():
+            if key in LIST_FIELDS or key == "weights":
+                continue
+            extra.append((key, tuple(value) if isinstance(value, list) else value))
+        for name in LIST_FIELDS:
+            object.__setattr__(schema, name, tuple(str(v) for v in data.get(name, ())))
+        object.__setattr__(schema, "weights", tuple(
+            (key, float(value)) for key, value in (data.get("weights") or {}).items()
+        ))
+        object.__setattr__(schema, "extra", tuple(extra))
+        return schema
+
+    def to_dict(self) -> Dict[str, Any]:
+        """导出为可 JSON 序列化的字典（存库 / API 响应）"""
+        data: Dict[str, Any] = {name: list(getattr(self, name)) for name in LIST_FIELDS}
+        data["weights"] = dict(self.weights)
+        for key, value in self.extra:
+            data[key] = list(value) if isinstance(value, tuple) else value
+        return data
+
+    # ---------- 只读访问（兼容原先基于 dict 的调用方） ----------
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in LIST_FIELDS:
+            return getattr(self, key)
+        if key == "weights":
+            return dict(self.weights)
+        for extra_key, value in self.extra:
+            if extra_key == key:
+                return value
+        return default
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def keys(self) -> Iterator[str]:
+        yield from LIST_FIELDS
+        yield "weights"
+        for key, _ in self.extra:
+            yield key
+
+    def weight(self, key: str, default: Optional[float] = None) -> Optional[float]:
+        for weight_key, value in self.weights:
+            if weight_key == key:
+                return value
+        return default
+
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError("Schema 是不可变对象")
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, Schema):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __hash__(self) -> int:
+        return hash(tuple(getattr(self, name) for name in LIST_FIELDS) + (self.weights,))
+
+    def __repr__(self) -> str:
+        return f"Schema({self.to_dict()!r})"
+
+    # ---------- Diff 应用（结构共享） ----------
+
+    def _replace(self, name: str, value: Any) -> "Schema":
+        """复制自身并替换一个槽位，其余槽位共享引用"""
+        schema = object.__new__(Schema)
+        for slot in self.__slots__:
+            object.__setattr__(schema, slot, value if slot == name else getattr(self, slot))
+        return schema
+
+    def _get_list(self, field: str) -> Tuple[Any, ...]:
+        if field in LIST_FIELDS:
+            return getattr(self, field)
+        value = self.get(field, ())
+        if isinstance(value, tuple):
+            return value
+        if value is None:
+            return ()
+        # 额外字段可能是标量（如 "mood": "calm"），按单元素列表处理，不能拆成字符
+        return (value,)
+
+    def _set_list(self, field: str, values: Tuple[Any, ...]) -> "Schema":
+        if field in LIST_FIELDS:
+            return self._replace(field, values)
+        extra = tuple((k, v) for k, v in self.extra if k != field) + ((field, values),)
+        return self._replace("extra", extra)
+
+    def _set_weight(self, key: str, value: float) -> "Schema":
+        weights = self.weights
+        for index, (weight_key, _) in enumerate(weights):
+            if weight_key == key:
+                return self._replace("weights", weights[:index] + ((key, value),) + weights[index + 1:])
+        return self._replace("weights", weights + ((key, value),))
+
+    def apply(self, op: Dict[str, Any]) -> "Schema":
+        """
+        应用单个 Diff 操作，返回新的 Schema
+
+        Raises:
+            ValueError: 操作不合法
+        """
+        action = op["action"]
+        field = op["field"]
+        path = field.split(".")
+
+        if action == "add":
+            if field == "weights" or len(path) > 1:
+                raise ValueError(f"add 操作不支持字段 {field}")
+            return self._set_list(field, self._get_list(field) + tuple(op["values"]))
+
+        if action == "remove":
+            if "values" not in op or field not in self:
+                return self
+            values = list(self._get_list(field))
+            for value in op["values"]:
+                if value in values:
+                    values.remove(value)
+            return self._set_list(field, tuple(values))
+
+        if action == "adjust":
+            if len(path) != 2 or path[0] != "weights":
+                raise ValueError(f"adjust 操作只支持 weights.<key> 字段：{field}")
+            current = self.weight(path[1], WEIGHT_DEFAULT)
+            return self._set_weight(path[1], max(WEIGHT_MIN, min(WEIGHT_MAX, current + op["delta"])))
+
+        if action == "replace":
+            value = op["value"]
+            if field == "weights":
+                return self._replace("weights", tuple((k, float(v)) for k, v in dict(value).items()))
+            if len(path) == 2 and path[0] == "weights":
+                return self._set_weight(path[1], float(value))
+            if len(path) > 1:
+                raise ValueError(f"replace 操作不支持字段 {field}")
+            if isinstance(value, list):
+                value = tuple(value)
+            if field in LIST_FIELDS:
+                return self._replace(field, tuple(value) if isinstance(value, tuple) else (value,))
+            extra = tuple((k, v) for k, v in self.extra if k != field) + ((field, value),)
+            return self._replace("extra", extra)
+
+        raise ValueError(f"未知的操作类型：{action}")
+
+    def apply_diff(self, diff: Dict[str, Any]) -> "Schema":
+        """依次应用 Diff 中的全部操作"""
+        schema = self
+        for op in diff["operations"]:
+            schema = schema.apply(op)
+        return schema
+
+
+_MISSING = object()
@@ -2,12 +2,13 @@
 API 请求数据模型
 """
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
 
 class PreviewRequest(BaseModel):
     """预览 Prompt 请求"""
     user_input: str = Field(..., description="用户的创意描述")
+    speculative: bool = Field(False, description="是否在预览的同时投机生成图片")
 
 
 class GenerateRequest(BaseModel):
@@ -16,9 +17,41 @@ class GenerateRequest(BaseModel):
     session_id: Optional[str] = Field(None, description="会话 ID（可选，不提供则创建新会话）")
     schema: Optional[dict] = Field(None, description="预览确认的 Schema（可选）")
     prompt: Optional[str] = Field(None, description="预览确认的 Prompt（可选）")
+    preview_token: Optional[str] = Field(None, description="投机预览返回的 token（可选）")
+    progressive: bool = Field(False, description="是否先返回低分辨率草图，正式图在后台渲染")
 
 
 class FeedbackRequest(BaseModel):
-    """反馈优化请求"""
+    """反馈优化请求（feedback 和 preview_token 至少提供一个）"""
+    version: int = Field(..., description="当前版本号")
+    feedback: Optional[str] = Field(None, description="用户反馈")
+    preview_token: Optional[str] = Field(None, description="反馈预览返回的 token（提供时直接采用预览结果）")
+    progressive: bool = Field(False, description="是否先返回低分辨率草图，正式图在后台渲染")
+
+
+class FeedbackPreviewRequest(BaseModel):
+    """反馈预览请求"""
+    version: int = Field(..., description="当前版本号")
+    feedback: str = Field(..., description="用户反馈")
+
+
+class FeedbackCandidatesRequest(BaseModel):
+    """多候选反馈请求（一次 LLM 调用返回多个候选 Diff）"""
     version: int = Field(..., description="当前版本号")
     feedback: str = Field(..., description="用户反馈")
+    count: int = Field(3, ge=1, le=5, description="候选数量上限（去重后实际返回的候选可能更少）")
+
+
+class FeedbackBatchRequest(BaseModel):
+    """批量反馈请求（多条反馈合并为一个 Diff 和一张图片）"""
+    version: int = Field(..., description="当前版本号")
+    feedbacks: List[str] = Field(..., min_length=1, max_length=20, description="反馈列表（按输入顺序）")
+    progressive: bool = Field(False, description="是否先返回低分辨率草图，正式图在后台渲染")
+
+
+class EditRequest(BaseModel):
+    """直接编辑 Schema 请求（结构化 Prompt Diff）"""
+    version: int = Field(..., description="当前版本号")
+    operations: List[Dict[str, Any]] = Field(..., description="Diff 操作列表（格式同 Prompt Diff）")
+    reasoning: Optional[str] = Field(None, description="修改说明（可选）")
+    progressive: bool = Field(False, description="是否先返回低分辨率草图，正式图在后台渲染")
@@ -32,6 +32,7 @@ class GenerateResponse(BaseModel):
     schema: Dict[str, Any]
     prompt: str
     image_url: str
+    image_status: str = "final"  # draft 表示正式图仍在渲染
     created_at: str
 
 
@@ -44,10 +45,30 @@ class FeedbackResponse(BaseModel):
     schema: Dict[str, Any]
     prompt: str
     image_url: str
+    image_status: str = "final"  # draft 表示正式图仍在渲染
     created_at: str
 
 
+class FeedbackPreviewResponse(BaseModel):
+    """反馈预览响应（不生成图片）"""
+    session_id: str
+    version: int
+    preview_token: str
+    diff: Dict[str, Any]
+    schema: Dict[str, Any]
+    prompt: str
+
+
+class FeedbackCandidatesResponse(BaseModel):
+    """多候选反馈响应（每个候选都可通过 preview_token 提交到 /feedback）"""
+    session_id: str
+    version: int
+    requested: int  # 请求的候选数量；重复或不合法的候选被丢弃后 candidates 可能更少
+    candidates: List[FeedbackPreviewResponse]
+
+
 class PreviewResponse(BaseModel):
     """预览 Prompt 响应"""
     schema: Dict[str, Any]
     prompt: str
+    preview_token: Optional[str] = None  # 投机生成已开始时返回
@@ -0,0 +1,110 @@
+"""
+进程内缓存工具
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Optional, Tuple
+
+
+class LRUCache:
+    """线程安全的 LRU 缓存（超过 maxsize 时淘汰最久未使用的条目）"""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class TTLCache:
+    """
+    线程安全的过期缓存
+
+    条目在 ttl 秒后过期（访问时惰性清理，也可调用 purge 主动清理）；
+    超过 maxsize 时淘汰最早写入的条目。条目被淘汰或过期时调用 on_evict(key, value)。
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: float = 300.0,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expired_locked(self) -> List[Tuple[Hashable, Any]]:
+        """取出已过期和超出容量的条目（调用方持有锁）"""
+        now = time.monotonic()
+        evicted = []
+        while self._data:
+            key, (expires_at, value) = next(iter(self._data.items()))
+            if expires_at > now and len(self._data) <= self.maxsize:
+                break
+            del self._data[key]
+            evicted.append((key, value))
+        return evicted
+
+    def _notify(self, evicted: List[Tuple[Hashable, Any]]):
+        if self.on_evict:
+            for key, value in evicted:
+                self.on_evict(key, value)
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        with self._lock:
+            evicted = self._expired_locked()
+            entry = self._data.get(key)
+        self._notify(evicted)
+        return entry[1] if entry else default
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            evicted = self._expired_locked()
+        self._notify(evicted)
+
+    def pop(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        """取出并删除条目（不触发 on_evict）"""
+        with self._lock:
+            evicted = self._expired_locked()
+            entry = self._data.pop(key, None)
+        self._notify(evicted)
+        return entry[1] if entry else default
+
+    def purge(self):
+        """清理已过期的条目"""
+        with self._lock:
+            evicted = self._expired_locked()
+        self._notify(evicted)
+
+    def values(self) -> List[Any]:
+        with self._lock:
+            return [value for _, value in self._data.values()]
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,170 @@
+"""
+Conflict Detector - Schema 冲突检测
+
+规则表（app/prompts/conflict_rules.json，可通过 CONFLICT_RULES_PATH 替换）中
+每条规则是若干组互斥词，同一 Schema 中出现两组及以上的词即为冲突：
+    {
+      "id": "realism_vs_cartoon",
+      "description": "写实与卡通风格互斥",
+      "fields": ["style"],                       # 可选，默认检查 scan_fields 全部字段
+      "groups": [["纯写实", "超写实"], ["纯卡通", "像素风"]]
+    }
+
+全部规则的词编译进同一个 Aho-Corasick 自动机，检测时把各字段元素
+拼接成一段文本扫描一遍，耗时与规则数量无关。negative 字段描述的是
+需要避免的内容，不参与检测。
+"""
+import json
+from bisect import bisect_right
+from collections import defaultdict
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+
+from app.config import settings
+from app.services.phrase_matcher import PhraseMatcher
+
+
+DEFAULT_RULES_PATH = Path(__file__).parent.parent / "prompts" / "conflict_rules.json"
+DEFAULT_SCAN_FIELDS = (
+    "subject", "appearance", "style", "composition",
+    "lighting", "background", "quality"
+)
+
+# 元素之间的分隔符（不会出现在规则词中，避免跨元素误匹配）
+_SEPARATOR = "\n"
+
+
+class ConflictDetector:
+    """编译后的冲突规则集（构造后只读，可在线程间共享）"""
+
+    def __init__(self, table: Dict[str, Any]):
+        self.scan_fields: Tuple[str, ...] = tuple(table.get("scan_fields") or DEFAULT_SCAN_FIELDS)
+        self.rules: List[Dict[str, Any]] = []
+        # 每条规则生效的字段集合（None 表示全部 scan_fields）
+        self._rule_fields: List[Optional[frozenset]] = []
+
+        terms: List[Tuple[str, Tuple[int, int]]] = []
+        for rule in table.get("rules", []):
+            groups = rule.get("groups") or []
+            if len(groups) < 2:
+                raise ValueError(f"冲突规则 {rule.get('id')} 至少需要两组互斥词")
+            rule_index = len(self.rules)
+            self.rules.append(rule)
+            self._rule_fields.append(frozenset(rule["fields"]) if rule.get("fields") else None)
+            for group_index, group in enumerate(groups):
+                for term in group:
+                    if _SEPARATOR in term:
+                        raise ValueError(f"冲突规则 {rule.get('id')} 的词不能包含换行：{term!r}")
+                    terms.append((term, (rule_index, group_index)))
+
+        self.matcher = PhraseMatcher(terms)
+
+    @classmethod
+    def from_file(cls, path: Union[str, Path]) -> "ConflictDetector":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def scan(self, schema: Any) -> List[Dict[str, Any]]:
+        """
+        扫描 Schema，返回全部冲突（无冲突时为空列表）
+
+        Args:
+            schema: dict 或 Schema（只需支持 get）
+
+        Returns:
+            [
+                {
+                    "rule": "realism_vs_cartoon",
+                    "description": "写实与卡通风格互斥",
+                    "matches": [
+                        {"group": 0, "term": "纯写实", "field": "style", "index": 0, "element": "纯写实风格"},
+                        {"group": 1, "term": "纯卡通", "field": "style", "index": 2, "element": "纯卡通"}
+                    ]
+                }
+            ]
+        """
+        # 拼接所有字段元素，记录每个元素在文本中的起始位置
+        parts: List[str] = []
+        starts: List[int] = []
+        locations: List[Tuple[str, int, str]] = []
+        offset = 0
+        for field in self.scan_fields:
+            for index, element in enumerate(schema.get(field) or ()):
+                if not isinstance(element, str):
+                    continue
+                parts.append(element)
+                starts.append(offset)
+                locations.append((field, index, element))
+                offset += len(element) + len(_SEPARATOR)
+        if not parts:
+            return []
+        text = _SEPARATOR.join(parts)
+
+        hits: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+        for start, end, (rule_index, group_index) in self.matcher.find_all(text):
+            field, index, element = locations[bisect_right(starts, start) - 1]
+            allowed = self._rule_fields[rule_index]
+            if allowed is not None and field not in allowed:
+                continue
+            hits[rule_index].append({
+                "group": group_index,
+                "term": text[start:end],
+                "field": field,
+                "index": index,
+                "element": element
+            })
+
+        conflicts = []
+        for rule_index in sorted(hits):
+            matches = hits[rule_index]
+            if len({match["group"] for match in matches}) < 2:
+                continue
+            rule = self.rules[rule_index]
+            conflicts.append({
+                "rule": rule.get("id", str(rule_index)),
+                "description": rule.get("description", ""),
+                "matches": matches
+            })
+        return conflicts
+
+    def introduced(self, before: Any, after: Any) -> List[Dict[str, Any]]:
+        """
+        修改后新出现的冲突
+
+        原 Schema 中已有的冲突不算：修改后某条规则命中的元素（按字段和内容，
+        不看下标）都已出现在原 Schema 同一规则的冲突中时忽略该冲突。
+        """
+        conflicts = self.scan(after)
+        if not conflicts:
+            return []
+
+        def elements(conflict: Dict[str, Any]) -> Set[Tuple[int, str, str]]:
+            return {(match["group"], match["field"], match["element"]) for match in conflict["matches"]}
+
+        existing = {conflict["rule"]: elements(conflict) for conflict in self.scan(before)}
+        return [
+            conflict for conflict in conflicts
+            if not elements(conflict) <= existing.get(conflict["rule"], set())
+        ]
+
+
+def format_conflicts(conflicts: List[Dict[str, Any]]) -> str:
+    """把冲突列表格式化为一行错误信息"""
+    messages = []
+    for conflict in conflicts:
+        located = "、".join(
+            f"{match['field']}[{match['index']}]「{match['element']}」"
+            for match in conflict["matches"]
+        )
+        messages.append(f"{conflict['description'] or conflict['rule']}：{located}")
+    return "Schema 冲突：" + "；".join(messages)
+
+
+@lru_cache(maxsize=1)
+def get_conflict_detector() -> ConflictDetector:
+    """加载冲突规则并编译自动机（进程内只执行一次，应用启动时预热）"""
+    path = Path(settings.conflict_rules_path) if settings.conflict_rules_path else DEFAULT_RULES_PATH
+    detector = ConflictDetector.from_file(path)
+    print(f"🧭 已加载冲突规则 {len(detector.rules)} 条（{path.name}）")
+    return detector
@@ -0,0 +1,217 @@
+"""
+Context Builder - 构造 LLM 调用的消息并控制 token 预算
+
+- Schema 以紧凑 JSON 序列化（无缩进、无多余空白）
+- 反馈分析只发送与反馈相关的字段（subject 和 weights 始终发送）
+- 消息顺序固定为 [静态 System Prompt, 动态用户内容]，
+  System Prompt 在各次调用间完全相同，可命中上游的前缀缓存
+- 超出 LLM_CONTEXT_TOKEN_BUDGET 时依次退化：去掉 System Prompt 中的示例
+  → 改用内置的精简 System Prompt → 只发送反馈相关的 Schema 字段 → 截断用户输入
+  （其余部分本身已超出预算时不截断，按原样发送）
+- 每次调用的 prompt / completion token 数记录在 usage_stats
+"""
+import json
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from app.config import settings
+from app.core.metrics import record_tokens
+from app.schemas.prompt import Schema
+from app.services.phrase_matcher import PhraseMatcher
+from app.services.token_counter import count_tokens, token_counter_mode
+
+
+# 反馈关键词 → 相关 Schema 字段（与 feedback.txt 的映射规则一致）
+FIELD_KEYWORDS: Dict[str, List[str]] = {
+    "lighting": ["暗", "亮", "光", "曝光", "色调", "冷", "暖", "阴影", "氛围"],
+    "appearance": ["脸", "人物", "表情", "五官", "眼睛", "头发", "衣服", "服装", "皮肤", "身材", "手", "外观"],
+    "background": ["背景", "环境", "场景"],
+    "style": ["风格", "写实", "卡通", "动漫", "真实", "画风", "二次元", "艺术"],
+    "composition": ["构图", "角度", "视角", "镜头", "特写", "远景", "近景", "居中", "位置"],
+    "quality": ["清晰", "模糊", "质量", "画质", "细节", "分辨率"],
+    "negative": ["变形", "多余", "怪", "崩", "模糊", "不要", "去掉"],
+}
+
+# 始终发送的字段
+ALWAYS_INCLUDED = ("subject", "weights")
+
+# 每条消息的格式开销（role、分隔符等）
+_MESSAGE_OVERHEAD = 4
+
+# System Prompt 中的 few-shot 示例段落（从标题到下一个【...】标题）
+_EXAMPLE_SECTION_RE = re.compile(r"【(?:示例|参考案例)[^】]*】.*?(?=【|\Z)", re.S)
+
+
+def compact_json(data: Any) -> str:
+    """紧凑 JSON 序列化"""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+_field_matcher = PhraseMatcher(
+    (keyword, field) for field, keywords in FIELD_KEYWORDS.items() for keyword in keywords
+)
+
+
+def relevant_fields(feedback: str) -> List[str]:
+    """反馈涉及的 Schema 字段（按 Schema 字段顺序，未识别时返回空列表）"""
+    matched = {field for _, _, field in _field_matcher.find_all(feedback)}
+    return [field for field in FIELD_KEYWORDS if field in matched]
+
+
+def strip_examples(system_prompt: str) -> str:
+    """去掉 System Prompt 中的示例段落"""
+    return _EXAMPLE_SECTION_RE.sub("", system_prompt)
+
+
+def count_message_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(count_tokens(message["content"]) + _MESSAGE_OVERHEAD for message in messages)
+
+
+class ContextBuilder:
+    """LLM 消息构造器"""
+
+    def __init__(self, token_budget: Optional[int] = None):
+        self.token_budget = settings.llm_context_token_budget if token_budget is None else token_budget
+
+    def feedback_messages(
+        self,
+        system_prompt: str,
+        fallback_system_prompt: str,
+        feedback: str,
+        schema: Union[Dict[str, Any], Schema]
+    ) -> Tuple[List[Dict[str, str]], int]:
+        """
+        构造反馈分析消息
+
+        Returns:
+            (messages, 预估 prompt token 数)
+        """
+        full = schema.to_dict() if isinstance(schema, Schema) else schema
+        fields = relevant_fields(feedback)
+        data = full
+        if fields:
+            keep = set(fields) | set(ALWAYS_INCLUDED)
+            data = {key: value for key, value in full.items() if key in keep}
+
+        # 超出预算时的最小上下文：只保留相关字段及其权重（未识别时只保留 subject）
+        minimal = {key: full[key] for key in (fields or ["subject"]) if key in full}
+        weights = {key: value for key, value in (full.get("weights") or {}).items() if key in fields}
+        if weights:
+            minimal["weights"] = weights
+
+        def build(system: str, text: str, reduced: bool = False) -> List[Dict[str, str]]:
+            context = minimal if reduced else data
+            return [
+                {"role": "system", "content": system},
+                {"role": "user", "content": f"当前 Schema:\n{compact_json(context)}\n\n用户反馈: {text}\n\n请生成 Prompt Diff。"}
+            ]
+
+        return self._fit(build, system_prompt, fallback_system_prompt, feedback, reducible=minimal != data)
+
+    def generation_messages(
+        self,
+        system_prompt: str,
+        fallback_system_prompt: str,
+        user_input: str
+    ) -> Tuple[List[Dict[str, str]], int]:
+        """构造 Schema 生成消息"""
+
+        def build(system: str, text: str, reduced: bool = False) -> List[Dict[str, str]]:
+            return [
+                {"role": "system", "content": system},
+                {"role": "user", "content": text}
+            ]
+
+        return self._fit(build, system_prompt, fallback_system_prompt, user_input)
+
+    def _fit(
+        self,
+        build,
+        system_prompt: str,
+        fallback_system_prompt: str,
+        text: str,
+        reducible: bool = False
+    ):
+        messages = build(system_prompt, text)
+        tokens = count_message_tokens(messages)
+        if not self.token_budget or tokens <= self.token_budget:
+            return messages, tokens
+
+        # 1. 去掉示例 → 2. 改用内置的精简 System Prompt → 3. 精简 Schema 上下文
+        steps = []
+        stripped = strip_examples(system_prompt)
+        if stripped != system_prompt:
+            steps.append(("去掉 System Prompt 中的示例", stripped, False))
+            system_prompt = stripped
+        if fallback_system_prompt and fallback_system_prompt != system_prompt:
+            steps.append(("改用精简 System Prompt", fallback_system_prompt, False))
+            system_prompt = fallback_system_prompt
+        if reducible:
+            steps.append(("只发送相关的 Schema 字段", system_prompt, True))
+
+        reduced = False
+        for label, system_prompt, reduced in steps:
+            messages = build(system_prompt, text, reduced)
+            tokens = count_message_tokens(messages)
+            if tokens <= self.token_budget:
+                print(f"⚠️ 上下文超出预算，{label}（{tokens} tokens）")
+                return messages, tokens
+
+        # 4. 截断用户输入：只能占用其余部分剩下的预算
+        available = self.token_budget - count_message_tokens(build(system_prompt, "", reduced))
+        if available <= 0:
+            print(f"⚠️ 上下文超出预算，但 System Prompt 和 Schema 已占满预算，不截断用户输入（{tokens} tokens）")
+            return messages, tokens
+        text_tokens = max(count_tokens(text), 1)
+        keep_chars = max(int(len(text) * available / text_tokens), 1)
+        messages = build(system_prompt, text[:keep_chars], reduced)
+        tokens = count_message_tokens(messages)
+        print(f"⚠️ 上下文超出预算，用户输入截断为 {keep_chars} 字符（{tokens} tokens）")
+        return messages, tokens
+
+
+class UsageStats:
+    """LLM token 用量统计（进程内，按调用类型汇总）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals: Dict[str, Dict[str, int]] = {}
+
+    def record(self, kind: str, response: Any, estimated_prompt_tokens: int) -> Dict[str, Any]:
+        """
+        记录一次调用的用量（上游未返回 usage 时使用本地估算值）
+
+        Returns:
+            {"prompt_tokens", "completion_tokens", "cached_tokens", "estimated_prompt_tokens",
+             "token_counter"}（token_counter 为本地估算使用的计数方式：tiktoken / heuristic）
+        """
+        usage = getattr(response, "usage", None)
+        details = getattr(usage, "prompt_tokens_details", None)
+        record = {
+            "prompt_tokens": getattr(usage, "prompt_tokens", None) or estimated_prompt_tokens,
+            "completion_tokens": getattr(usage, "completion_tokens", None) or 0,
+            "cached_tokens": getattr(details, "cached_tokens", None) or 0,
+            "estimated_prompt_tokens": estimated_prompt_tokens,
+            "token_counter": token_counter_mode()
+        }
+        with self._lock:
+            totals = self._totals.setdefault(kind, {
+                "calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0,
+                "heuristic_calls": 0
+            })
+            totals["calls"] += 1
+            for key in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+                totals[key] += record[key]
+            # 上下文预算按字符估算的调用（精确计数不可用），预算只是近似值
+            if record["token_counter"] == "heuristic":
+                totals["heuristic_calls"] += 1
+        record_tokens(record["prompt_tokens"], record["completion_tokens"])
+        return record
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {kind: dict(totals) for kind, totals in self._totals.items()}
+
+
+usage_stats = UsageStats()
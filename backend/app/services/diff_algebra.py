@@ -0,0 +1,120 @@
+"""
+Diff Algebra - Prompt Diff 的比较、合并与取反
+
+Diff 的语义由 Schema.apply 定义（add / remove / adjust / replace），
+本模块在此基础上提供：
+- diff_schemas(a, b)：计算把 a 变为 b 的规范化最小 Diff
+- compose(base, diffs)：把一串 Diff 压缩为一个等价 Diff（squash 为别名）
+- invert(base, diff)：计算撤销 diff 的逆 Diff
+
+规范化 Diff 满足 apply(a, diff_schemas(a, b)) == b（权重按键比较，不区分顺序；
+Diff 无法删除字段，b 中不存在的额外字段以空列表表示）。
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from app.schemas.prompt import LIST_FIELDS, WEIGHT_MAX, WEIGHT_MIN, Schema
+
+SchemaLike = Union[Dict[str, Any], Schema]
+
+
+def _list_ops(field: str, source: Tuple[Any, ...], target: Tuple[Any, ...]) -> List[Dict[str, Any]]:
+    """单个列表字段的最小操作：能用 remove + add 表达时优先，否则整体 replace"""
+    if source == target:
+        return []
+
+    remaining = list(target)
+    removed = []
+    for value in source:
+        if value in remaining:
+            remaining.remove(value)
+        else:
+            removed.append(value)
+    added = remaining
+
+    # 模拟 remove（删除首次出现）+ add（追加）后的结果，顺序不一致则退化为 replace
+    simulated = list(source)
+    for value in removed:
+        simulated.remove(value)
+    simulated.extend(added)
+    if tuple(simulated) != tuple(target):
+        return [{"action": "replace", "field": field, "value": list(target)}]
+
+    ops = []
+    if removed:
+        ops.append({"action": "remove", "field": field, "values": removed})
+    if added:
+        ops.append({"action": "add", "field": field, "values": added})
+    return ops
+
+
+def _weight_ops(source: Dict[str, float], target: Dict[str, float]) -> List[Dict[str, Any]]:
+    """权重操作：删除了键时整体 replace，否则逐键 adjust（无法精确表达时用 replace）"""
+    if source == target:
+        return []
+    if any(key not in target for key in source):
+        return [{"action": "replace", "field": "weights", "value": dict(target)}]
+
+    ops = []
+    for key, value in target.items():
+        if key in source and source[key] == value:
+            continue
+        if key in source:
+            delta = value - source[key]
+            if source[key] + delta == value and WEIGHT_MIN <= value <= WEIGHT_MAX:
+                ops.append({"action": "adjust", "field": f"weights.{key}", "delta": delta})
+                continue
+        ops.append({"action": "replace", "field": f"weights.{key}", "value": value})
+    return ops
+
+
+def diff_schemas(source: SchemaLike, target: SchemaLike, reasoning: Optional[str] = None) -> Dict[str, Any]:
+    """计算把 source 变为 target 的规范化 Diff"""
+    a = Schema.from_dict(source, strict=False)
+    b = Schema.from_dict(target, strict=False)
+
+    operations: List[Dict[str, Any]] = []
+    for field in LIST_FIELDS:
+        operations.extend(_list_ops(field, getattr(a, field), getattr(b, field)))
+    operations.extend(_weight_ops(dict(a.weights), dict(b.weights)))
+
+    # 额外字段：两边都是列表（或原来不存在）时按列表字段处理，否则整体替换
+    # （标量不能作为 add / remove 的基础，Schema.apply 会把字符串拆成字符）
+    source_extra = dict(a.extra)
+    for key, value in b.extra:
+        old = source_extra.get(key, ())
+        if isinstance(value, tuple) and isinstance(old, tuple):
+            operations.extend(_list_ops(key, old, value))
+        elif key not in source_extra or old != value:
+            operations.append({"action": "replace", "field": key, "value": list(value) if isinstance(value, tuple) else value})
+    for key, value in a.extra:
+        if key not in dict(b.extra):
+            operations.append({"action": "replace", "field": key, "value": []})
+
+    return {"operations": operations, "reasoning": reasoning}
+
+
+def compose(base: SchemaLike, diffs: Iterable[Dict[str, Any]], reasoning: Optional[str] = None) -> Dict[str, Any]:
+    """把依次作用在 base 上的一串 Diff 压缩为一个等价的最小 Diff"""
+    schema = Schema.from_dict(base, strict=False)
+    result = schema
+    for diff in diffs:
+        result = result.apply_diff(diff)
+    return diff_schemas(schema, result, reasoning)
+
+
+squash = compose
+
+
+def invert(base: SchemaLike, diff: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    计算 diff 的逆 Diff
+
+    remove / adjust（有截断）/ replace 会丢失信息，因此需要 diff 作用前的 base。
+    """
+    schema = Schema.from_dict(base, strict=False)
+    return diff_schemas(schema.apply_diff(diff), schema)
+
+
+def changed_fields(diff: Dict[str, Any]) -> List[str]:
+    """Diff 涉及的顶层字段（去重并保持顺序）"""
+    return list(dict.fromkeys(op["field"].split(".")[0] for op in diff.get("operations", [])))
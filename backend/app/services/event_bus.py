@@ -0,0 +1,59 @@
+"""
+Event Bus - 进程内会话事件广播
+
+发布方可以在任意线程调用 publish，事件通过订阅者所在事件循环的
+call_soon_threadsafe 投递到各自的 asyncio.Queue；订阅者队列已满时丢弃新事件
+（慢客户端不影响其他订阅者）。用于 GET /sessions/{id}/events 的 SSE 推送。
+"""
+import asyncio
+import threading
+from typing import Any, Dict, Set, Tuple
+
+
+class EventBus:
+    """按频道（会话 ID）分发事件"""
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel: str) -> asyncio.Queue:
+        """订阅频道（需在事件循环中调用）"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, channel: str, queue: asyncio.Queue):
+        with self._lock:
+            subscribers = self._subscribers.get(channel)
+            if not subscribers:
+                return
+            subscribers.difference_update({entry for entry in subscribers if entry[1] is queue})
+            if not subscribers:
+                del self._subscribers[channel]
+
+    def publish(self, channel: str, event: str, data: Any):
+        """发布事件（线程安全，无订阅者时直接忽略）"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        message = {"event": event, "data": data}
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_deliver, queue, message)
+            except RuntimeError:
+                # 订阅者的事件循环已关闭
+                self.unsubscribe(channel, queue)
+
+    def subscriber_count(self, channel: str) -> int:
+        with self._lock:
+            return len(self._subscribers.get(channel, ()))
+
+
+def _deliver(queue: asyncio.Queue, message: Dict[str, Any]):
+    if not queue.full():
+        queue.put_nowait(message)
+
+
+event_bus = EventBus()
@@ -4,10 +4,18 @@ Feedback Engine - 负责理解反馈并生成 Prompt Diff
 阶段 2: 接入 OpenAI GPT-4o
 """
 import json
-import copy
 import time
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Union
+
+from app.config import settings
+from app.core.metrics import record_fallback, record_feedback_batch, upstream_call
+from app.schemas.prompt import LIST_FIELDS, Schema
+from app.services.diff_algebra import diff_schemas
+from app.services.context_builder import ContextBuilder, usage_stats
+from app.services.conflict_detector import format_conflicts, get_conflict_detector
+from app.services.schema_compactor import compact_schema
+from app.services.feedback_rules import fast_path_stats, get_feedback_classifier
 
 
 # Feedback System Prompt（阶段 2 使用）
@@ -59,9 +67,17 @@ Diff 输出:
 """
 
 
+# Diff 操作类型和单次权重调整幅度上限（与 feedback.txt 的约定一致）
+DIFF_ACTIONS = ("add", "remove", "adjust", "replace")
+DELTA_LIMIT = 0.5
+
+
 class ConflictError(Exception):
-    """Schema 冲突异常"""
-    pass
+    """Schema 冲突异常（conflicts 为 ConflictDetector.scan 返回的冲突列表）"""
+
+    def __init__(self, message: str, conflicts: Optional[List[Dict[str, Any]]] = None):
+        super().__init__(message)
+        self.conflicts = conflicts or []
 
 
 class FeedbackEngine:
@@ -73,9 +89,9 @@ class FeedbackEngine:
             use_real_api: 是否使用真实 OpenAI API（阶段 2 设置为 True）
         """
         self.use_real_api = use_real_api
+        self.last_usage = None
         if use_real_api:
             from openai import OpenAI
-            from app.config import settings
             self.client = OpenAI(
                 api_key=settings.openai_api_key,
                 base_url=settings.openai_api_base  # 支持自定义 Base URL
@@ -122,11 +138,281 @@ class FeedbackEngine:
         if not feedback or not feedback.strip():
             raise ValueError("用户反馈不能为空")
 
+        # 常见反馈先走本地规则，命中则不再调用 LLM
+        if settings.feedback_fast_path_enabled:
+            result = self._analyze_with_rules(feedback, current_schema)
+            if result is not None:
+                return result
+
         if self.use_real_api:
             return self._analyze_with_openai(feedback, current_schema)
         else:
             return self._analyze_mock(feedback, current_schema)
 
+    def analyze_feedback_batch(
+        self,
+        feedbacks: List[str],
+        current_schema: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        把多条反馈合并为一个 Diff（最多一次 LLM 调用）
+
+        - 每条反馈都命中本地规则时完全在本地合并
+        - 否则把全部反馈编号后放进同一次 LLM 调用
+        - 合并后的操作按顺序应用，再用 diff_schemas 计算净 Diff，
+          同一字段上重叠或互相抵消的操作（先加后删、多次调整同一权重）被消解
+
+        Returns:
+            与 analyze_feedback 相同的结构，另含 "feedbacks"（去重后的反馈列表）
+
+        Raises:
+            ValueError: 反馈为空，或合并后互相抵消、Schema 没有净修改（不应生成新版本）
+        """
+        items = list(dict.fromkeys(item.strip() for item in feedbacks if item and item.strip()))
+        if not items:
+            raise ValueError("用户反馈不能为空")
+        if len(items) == 1:
+            result = self.analyze_feedback(items[0], current_schema)
+            result["feedbacks"] = items
+            return result
+
+        diff = None
+        if settings.feedback_fast_path_enabled:
+            diff = self._merge_rule_diffs(items, current_schema)
+
+        path = "rules" if diff is not None else "llm"
+        if diff is not None:
+            new_schema = self._apply_diff(current_schema, diff)
+        else:
+            numbered = "\n".join(f"{index}. {item}" for index, item in enumerate(items, 1))
+            combined = f"（共 {len(items)} 条，请合并为一个 Diff，同一字段的修改不要重复）\n{numbered}"
+            if self.use_real_api:
+                result = self._analyze_with_openai(combined, current_schema)
+            else:
+                result = self._analyze_mock(combined, current_schema)
+            diff = result["diff"]
+            new_schema = Schema.from_dict(result["new_schema"], strict=False)
+
+        merged = diff_schemas(current_schema, new_schema, diff.get("reasoning"))
+        record_feedback_batch(path, len(items), changed=bool(merged["operations"]))
+        if not merged["operations"]:
+            raise ValueError("这些反馈互相抵消，Schema 没有变化，未生成新版本")
+
+        from app.services.prompt_engine import PromptEngine
+        prompt = PromptEngine()._render_prompt(new_schema)
+
+        return {
+            "diff": merged,
+            "new_schema": new_schema.to_dict(),
+            "prompt": prompt,
+            "feedbacks": items
+        }
+
+    def analyze_feedback_candidates(
+        self,
+        feedback: str,
+        current_schema: Dict[str, Any],
+        count: int = 3
+    ) -> List[Dict[str, Any]]:
+        """
+        一次 LLM 调用生成多个候选 Diff（反馈含义模糊时供用户挑选）
+
+        - 真实 API 使用 n=count 在同一次请求中采样多个回复
+        - 每个候选在本地校验、应用并渲染 Prompt；
+          不合法、有冲突或规范化后与前面重复的候选被丢弃
+        - 没有可用候选时回退到 analyze_feedback 的单个结果
+
+        Returns:
+            候选列表（最多 count 个，去重后可能更少），每项结构与 analyze_feedback 相同
+
+        Raises:
+            ValueError: 反馈为空或 count 不合法
+        """
+        if not feedback or not feedback.strip():
+            raise ValueError("用户反馈不能为空")
+        if count < 1:
+            raise ValueError("候选数量必须大于 0")
+
+        if self.use_real_api:
+            diffs = self._candidate_diffs_with_openai(feedback, current_schema, count)
+        else:
+            diffs = self._candidate_diffs_mock(feedback, current_schema, count)
+
+        from app.services.prompt_engine import PromptEngine
+        engine = PromptEngine()
+
+        candidates = []
+        seen = set()
+        for index, diff in enumerate(diffs):
+            try:
+                self._validate_diff(diff)
+                new_schema = self._apply_diff(current_schema, diff)
+            except (ValueError, ConflictError) as e:
+                print(f"⚠️ 丢弃候选 {index + 1}: {e}")
+                continue
+
+            key = json.dumps(diff_schemas(current_schema, new_schema)["operations"], ensure_ascii=False, sort_keys=True)
+            if key in seen:
+                continue
+            seen.add(key)
+            candidates.append({
+                "diff": diff,
+                "new_schema": new_schema.to_dict(),
+                "prompt": engine._render_prompt(new_schema)
+            })
+
+        if not candidates:
+            print("⚠️ 没有可用的候选 Diff，回退到单个结果")
+            return [self.analyze_feedback(feedback, current_schema)]
+
+        print(f"🎲 生成 {len(candidates)} 个候选 Diff（请求 {count} 个）")
+        return candidates
+
+    def _candidate_diffs_with_openai(
+        self,
+        feedback: str,
+        current_schema: Dict[str, Any],
+        count: int
+    ) -> List[Any]:
+        """一次请求采样 count 个回复，返回解析出的 Diff（无法解析的回复被跳过）"""
+        max_retries = 3
+        retry_delay = 1  # 秒
+
+        messages, estimated_tokens = ContextBuilder().feedback_messages(
+            self.system_prompt, FEEDBACK_SYSTEM_PROMPT, feedback, current_schema
+        )
+
+        for attempt in range(max_retries):
+            try:
+                print(f"🔄 调用 OpenAI API 生成 {count} 个候选 Diff (尝试 {attempt + 1}/{max_retries})...")
+
+                with upstream_call("openai", "llm.feedback_candidates", model=self.model, attempt=attempt):
+                    response = self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        response_format={"type": "json_object"},
+                        # 提高采样温度，让候选之间有差异
+                        temperature=0.9,
+                        max_tokens=1000,
+                        n=count
+                    )
+                self.last_usage = usage_stats.record("feedback_candidates", response, estimated_tokens)
+
+                diffs = []
+                for choice in response.choices:
+                    try:
+                        diffs.append(json.loads(choice.message.content))
+                    except (TypeError, json.JSONDecodeError) as e:
+                        print(f"⚠️ 候选 Diff 解析失败: {e}")
+                return diffs
+
+            except Exception as e:
+                print(f"⚠️ OpenAI API 调用失败: {e}")
+                if attempt < max_retries - 1:
+                    time.sleep(retry_delay)
+                    retry_delay *= 2  # 指数退避
+                    continue
+                print(f"❌ API 调用失败，回退到 mock 模式")
+                record_fallback("feedback_engine")
+                return self._candidate_diffs_mock(feedback, current_schema, count)
+
+    def _candidate_diffs_mock(
+        self,
+        feedback: str,
+        current_schema: Dict[str, Any],
+        count: int
+    ) -> List[Dict[str, Any]]:
+        """
+        Mock 候选：以 mock Diff 为基准，按不同幅度缩放权重调整
+
+        缩放系数在 0.5–1.5 之间均匀取 count 个，最接近 1.0 的一个换成 1.0 并排在最前，
+        保证第一个候选总是标准幅度（count=3 时为 1.0 / 0.5 / 1.5）
+        """
+        base = self._analyze_mock(feedback, current_schema)["diff"]
+        if count == 1:
+            scales = [1.0]
+        else:
+            scales = [round(0.5 + i / (count - 1), 2) for i in range(count)]
+            scales.remove(min(scales, key=lambda scale: abs(scale - 1.0)))
+            scales.insert(0, 1.0)
+
+        diffs = []
+        for scale in scales:
+            label = "标准" if scale == 1.0 else f"{'轻微' if scale < 1.0 else '强烈'} ×{scale:g}"
+            operations = [
+                {**op, "delta": round(op["delta"] * scale, 2)} if op["action"] == "adjust" else op
+                for op in base["operations"]
+            ]
+            diffs.append({"operations": operations, "reasoning": f"{base['reasoning']}（{label}）"})
+        return diffs
+
+    def _merge_rule_diffs(
+        self,
+        items: List[str],
+        current_schema: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """全部反馈都命中本地规则时，按顺序拼接各自的操作（任一未命中返回 None）"""
+        schema = Schema.from_dict(current_schema, strict=False)
+        matches = []
+        for item in items:
+            # 规则中依赖当前 Schema 的操作按前面反馈应用后的结果解析
+            matched = self._classify_with_rules(item, schema)
+            if matched is None:
+                # 整批交给 LLM：只记一次升级，前面命中的条目不计入命中
+                fast_path_stats.record(None)
+                return None
+            matches.append(matched)
+            schema = schema.apply_diff(matched["diff"])
+
+        for matched in matches:
+            fast_path_stats.record(matched)
+        return {
+            "operations": [op for matched in matches for op in matched["diff"]["operations"]],
+            "reasoning": "；".join(matched["diff"]["reasoning"] for matched in matches)
+        }
+
+    def _classify_with_rules(
+        self,
+        feedback: str,
+        current_schema: Union[Dict[str, Any], Schema]
+    ) -> Optional[Dict[str, Any]]:
+        """按本地规则分类；规则展开的 Diff 同样经过 _validate_diff，不合法时视为未命中"""
+        matched = get_feedback_classifier().classify(feedback, current_schema)
+        if matched is None:
+            return None
+        try:
+            self._validate_diff(matched["diff"])
+        except ValueError as e:
+            print(f"⚠️ 本地规则 {matched['rules']} 生成的 Diff 不合法，交给 LLM: {e}")
+            return None
+        return matched
+
+    def _analyze_with_rules(
+        self,
+        feedback: str,
+        current_schema: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """本地规则快速通道（置信度不足时返回 None）"""
+        start = time.perf_counter()
+        matched = self._classify_with_rules(feedback, current_schema)
+        fast_path_stats.record(matched)
+        if matched is None:
+            return None
+
+        diff = matched["diff"]
+        new_schema = self._apply_diff(current_schema, diff)
+
+        from app.services.prompt_engine import PromptEngine
+        prompt = PromptEngine()._render_prompt(new_schema)
+
+        elapsed_us = (time.perf_counter() - start) * 1e6
+        print(f"⚡ 本地规则命中 {matched['rules']}（置信度 {matched['confidence']:.2f}，{elapsed_us:.0f}µs）")
+        return {
+            "diff": diff,
+            "new_schema": new_schema.to_dict(),
+            "prompt": prompt
+        }
+
     def _analyze_mock(self, feedback: str, current_schema: Dict[str, Any]) -> Dict[str, Any]:
         """阶段 1: Mock 实现"""
         # 简单的反馈映射规则
@@ -180,7 +466,7 @@ class FeedbackEngine:
 
         return {
             "diff": diff,
-            "new_schema": new_schema,
+            "new_schema": new_schema.to_dict(),
             "prompt": prompt
         }
 
@@ -193,27 +479,23 @@ class FeedbackEngine:
         max_retries = 3
         retry_delay = 1  # 秒
 
-        user_prompt = f"""当前 Schema:
-{json.dumps(current_schema, ensure_ascii=False, indent=2)}
-
-用户反馈: {feedback}
-
-请生成 Prompt Diff。"""
+        messages, estimated_tokens = ContextBuilder().feedback_messages(
+            self.system_prompt, FEEDBACK_SYSTEM_PROMPT, feedback, current_schema
+        )
 
         for attempt in range(max_retries):
             try:
                 print(f"🔄 调用 OpenAI API 分析反馈 (尝试 {attempt + 1}/{max_retries})...")
 
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": self.system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
-                    response_format={"type": "json_object"},
-                    temperature=0.5,
-                    max_tokens=1000
-                )
+                with upstream_call("openai", "llm.feedback", model=self.model, attempt=attempt):
+                    response = self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        response_format={"type": "json_object"},
+                        temperature=0.5,
+                        max_tokens=1000
+                    )
+                self.last_usage = usage_stats.record("feedback", response, estimated_tokens)
 
                 diff = json.loads(response.choices[0].message.content)
 
@@ -228,10 +510,10 @@ class FeedbackEngine:
                 engine = PromptEngine()
                 prompt = engine._render_prompt(new_schema)
 
-                print(f"✅ 反馈分析成功")
+                print(f"✅ 反馈分析成功（prompt {self.last_usage['prompt_tokens']} / completion {self.last_usage['completion_tokens']} tokens）")
                 return {
                     "diff": diff,
-                    "new_schema": new_schema,
+                    "new_schema": new_schema.to_dict(),
                     "prompt": prompt
                 }
 
@@ -242,6 +524,7 @@ class FeedbackEngine:
                     continue
                 else:
                     print(f"❌ 解析失败，回退到 mock 模式")
+                    record_fallback("feedback_engine")
                     return self._analyze_mock(feedback, current_schema)
 
             except Exception as e:
@@ -252,10 +535,18 @@ class FeedbackEngine:
                     continue
                 else:
                     print(f"❌ API 调用失败，回退到 mock 模式")
+                    record_fallback("feedback_engine")
                     return self._analyze_mock(feedback, current_schema)
 
     def _validate_diff(self, diff: Dict[str, Any]):
-        """验证 Diff 格式"""
+        """
+        验证 Diff 格式（逐个操作检查字段和取值类型）
+
+        Raises:
+            ValueError: Diff 不合法
+        """
+        if not isinstance(diff, dict):
+            raise ValueError("Diff 必须是 JSON 对象")
         if "operations" not in diff:
             raise ValueError("Diff 缺少 operations 字段")
         if not isinstance(diff["operations"], list):
@@ -263,68 +554,117 @@ class FeedbackEngine:
         if len(diff["operations"]) == 0:
             raise ValueError("operations 不能为空")
 
-    def _apply_diff(
+        for index, op in enumerate(diff["operations"]):
+            prefix = f"operations[{index}]"
+            if not isinstance(op, dict):
+                raise ValueError(f"{prefix} 必须是对象")
+            action = op.get("action")
+            field = op.get("field")
+            if action not in DIFF_ACTIONS:
+                raise ValueError(f"{prefix} 的 action 必须是 {'/'.join(DIFF_ACTIONS)} 之一")
+            if not isinstance(field, str) or not field:
+                raise ValueError(f"{prefix} 缺少 field")
+
+            path = field.split(".")
+            is_weight = len(path) == 2 and path[0] == "weights" and bool(path[1])
+            if len(path) > 1 and not is_weight:
+                raise ValueError(f"{prefix} 的 field 只支持字段名或 weights.<key>：{field}")
+
+            if action in ("add", "remove"):
+                if field == "weights" or is_weight:
+                    raise ValueError(f"{prefix} 的 {action} 操作不支持权重字段，请使用 adjust 或 replace")
+                values = op.get("values")
+                if not isinstance(values, list) or not values:
+                    raise ValueError(f"{prefix} 的 values 必须是非空数组")
+                if not all(isinstance(value, str) and value.strip() for value in values):
+                    raise ValueError(f"{prefix} 的 values 只能包含非空字符串")
+
+            elif action == "adjust":
+                if not is_weight:
+                    raise ValueError(f"{prefix} 的 adjust 操作只支持 weights.<key> 字段")
+                delta = op.get("delta")
+                if not isinstance(delta, (int, float)) or isinstance(delta, bool):
+                    raise ValueError(f"{prefix} 的 delta 必须是数值")
+                if not -DELTA_LIMIT <= delta <= DELTA_LIMIT:
+                    raise ValueError(f"{prefix} 的 delta 超出范围 [-{DELTA_LIMIT}, {DELTA_LIMIT}]")
+
+            elif action == "replace":
+                if "value" not in op:
+                    raise ValueError(f"{prefix} 的 replace 操作缺少 value")
+                value = op["value"]
+                if is_weight and (not isinstance(value, (int, float)) or isinstance(value, bool)):
+                    raise ValueError(f"{prefix} 的权重必须是数值")
+                if field == "weights":
+                    if not isinstance(value, dict) or not all(
+                        isinstance(v, (int, float)) and not isinstance(v, bool) for v in value.values()
+                    ):
+                        raise ValueError(f"{prefix} 的 weights 必须是数值对象")
+                elif field in LIST_FIELDS and not (
+                    isinstance(value, list) and all(isinstance(v, str) for v in value)
+                ):
+                    raise ValueError(f"{prefix} 的 {field} 必须是字符串数组")
+
+    def apply_edit(
         self,
-        original_schema: Dict[str, Any],
-        diff: Dict[str, Any]
+        diff: Dict[str, Any],
+        current_schema: Dict[str, Any]
     ) -> Dict[str, Any]:
         """
-        应用 Prompt Diff 到原 Schema
+        直接应用用户提交的结构化 Diff（不调用 LLM）
+
+        Returns:
+            与 analyze_feedback 相同的结构
+
+        Raises:
+            ValueError: Diff 不合法
+            ConflictError: Schema 冲突
         """
-        new_schema = copy.deepcopy(original_schema)
+        self._validate_diff(diff)
+        diff = {
+            "operations": diff["operations"],
+            "reasoning": diff.get("reasoning") or "手动编辑 Schema"
+        }
+        # 用户显式提交的修改不做压缩
+        new_schema = self._apply_diff(current_schema, diff, compact=False)
 
-        for op in diff["operations"]:
-            action = op["action"]
-            field = op["field"]
+        from app.services.prompt_engine import PromptEngine
+        prompt = PromptEngine()._render_prompt(new_schema)
 
-            if action == "add":
-                if field not in new_schema:
-                    new_schema[field] = []
-                new_schema[field].extend(op["values"])
+        return {
+            "diff": diff,
+            "new_schema": new_schema.to_dict(),
+            "prompt": prompt
+        }
 
-            elif action == "remove":
-                if field in new_schema and "values" in op:
-                    for val in op["values"]:
-                        if val in new_schema[field]:
-                            new_schema[field].remove(val)
+    def _apply_diff(
+        self,
+        original_schema: Union[Dict[str, Any], Schema],
+        diff: Dict[str, Any],
+        compact: bool = True
+    ) -> Schema:
+        """
+        应用 Prompt Diff 到原 Schema
 
-            elif action == "adjust":
-                keys = field.split(".")
-                current = new_schema
-                for key in keys[:-1]:
-                    if key not in current:
-                        current[key] = {}
-                    current = current[key]
-
-                last_key = keys[-1]
-                current_value = current.get(last_key, 0.5)
-                new_value = current_value + op["delta"]
-                current[last_key] = max(0.1, min(1.5, new_value))
+        原 Schema 不会被修改；返回的新 Schema 只复制被修改的字段。
+        开启 Schema 压缩且 compact=True 时，压缩产生的 replace 操作追加到 diff["operations"]，
+        存储的 Diff 仍能重放出新 Schema（节省量见 /feedback/compaction/stats）
+        """
+        original = Schema.from_dict(original_schema, strict=False)
+        new_schema = original.apply_diff(diff)
 
-            elif action == "replace":
-                keys = field.split(".")
-                current = new_schema
-                for key in keys[:-1]:
-                    current = current[key]
-                current[keys[-1]] = op["value"]
+        # 去重、字段上限和 Prompt 长度预算
+        if compact and settings.schema_compaction_enabled:
+            new_schema, report = compact_schema(new_schema)
+            if report["operations"]:
+                diff["operations"] = list(diff["operations"]) + report["operations"]
 
-        # 冲突检测
-        self._detect_conflicts(new_schema)
+        # 冲突检测（只拒绝本次修改引入的冲突）
+        self._detect_conflicts(original, new_schema)
 
         return new_schema
 
-    def _detect_conflicts(self, schema: Dict[str, Any]):
-        """检测 Schema 冲突"""
-        style = ' '.join(schema.get("style", []))
-
-        # 冲突检测规则（更宽松）
-        conflicting_pairs = [
-            (["纯写实", "超写实"], ["纯卡通", "像素风"]),
-            (["极度明亮", "高曝光"], ["极度黑暗", "纯黑背景"]),
-        ]
-
-        for group1, group2 in conflicting_pairs:
-            has_group1 = any(s in style for s in group1)
-            has_group2 = any(s in style for s in group2)
-            if has_group1 and has_group2:
-                raise ConflictError(f"Style 冲突：不能同时包含 {group1} 和 {group2}")
+    def _detect_conflicts(self, original: Schema, schema: Schema):
+        """检测 Diff 引入的 Schema 冲突（规则见 app/prompts/conflict_rules.json，原 Schema 中已有的冲突不报）"""
+        conflicts = get_conflict_detector().introduced(original, schema)
+        if conflicts:
+            raise ConflictError(format_conflicts(conflicts), conflicts)
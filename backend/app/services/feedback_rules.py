@@ -0,0 +1,200 @@
+"""
+Feedback Rules - 反馈本地规则快速通道
+
+规则表（app/prompts/feedback_rules.json，可通过 FEEDBACK_RULES_PATH 替换）
+把常见反馈短语映射为确定的 Diff 操作。全部短语和语气词编译进同一个
+Aho-Corasick 自动机，一次扫描完成匹配，置信度足够高时直接产出 Diff，
+只有含糊的反馈才交给 GPT-4o。
+
+置信度 = 规则置信度 × 覆盖率
+- 覆盖率：规则短语覆盖的字符数 / 去掉标点和语气词后的有效字符数
+- 短语前紧跟否定词（"不太暗"）或同组规则互相矛盾（"太暗又太亮"）时置信度为 0
+"""
+import json
+import threading
+import unicodedata
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from app.config import settings
+from app.schemas.prompt import Schema
+from app.services.phrase_matcher import PhraseMatcher
+
+
+DEFAULT_RULES_PATH = Path(__file__).parent.parent / "prompts" / "feedback_rules.json"
+
+# 语气词 / 填充词在自动机中的 payload
+_FILLER = None
+
+
+def _is_punctuation(char: str) -> bool:
+    return char.isspace() or unicodedata.category(char).startswith(("P", "S"))
+
+
+class FeedbackRuleClassifier:
+    """基于规则表的反馈分类器（构造后只读，可在线程间共享）"""
+
+    def __init__(self, table: Dict[str, Any]):
+        self.rules: Dict[str, Dict[str, Any]] = {}
+        phrases: List[Tuple[str, Optional[str]]] = []
+
+        for rule in table.get("rules", []):
+            rule_id = rule["id"]
+            if rule_id in self.rules:
+                raise ValueError(f"反馈规则 ID 重复：{rule_id}")
+            if not rule.get("operations"):
+                raise ValueError(f"反馈规则 {rule_id} 缺少 operations")
+            self.rules[rule_id] = rule
+            phrases.extend((phrase, rule_id) for phrase in rule.get("phrases", []))
+
+        phrases.extend((filler, _FILLER) for filler in table.get("fillers", []))
+        self.negations = tuple(table.get("negations", []))
+        self.matcher = PhraseMatcher(phrases)
+
+    @classmethod
+    def from_file(cls, path: Union[str, Path]) -> "FeedbackRuleClassifier":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def match(self, feedback: str) -> Dict[str, Any]:
+        """
+        匹配反馈文本
+
+        Returns:
+            {
+                "rules": ["brighten", ...],   # 命中的规则（按出现顺序去重）
+                "phrases": ["太暗", ...],      # 命中的短语
+                "confidence": 0.95            # 0 ~ 1
+            }
+        """
+        text = feedback.strip()
+        matches = self.matcher.find_longest(text)
+
+        rule_ids: List[str] = []
+        phrases: List[str] = []
+        covered = 0
+        filler_chars = 0
+        negated = False
+        for start, end, rule_id in matches:
+            if rule_id is _FILLER:
+                filler_chars += end - start
+                continue
+            if start > 0 and text[start - 1] in self.negations:
+                negated = True
+            covered += end - start
+            phrases.append(text[start:end])
+            if rule_id not in rule_ids:
+                rule_ids.append(rule_id)
+
+        result = {"rules": rule_ids, "phrases": phrases, "confidence": 0.0}
+        if not rule_ids or negated:
+            return result
+
+        # 同组规则互相矛盾（例如同时要求变亮和变暗）
+        groups = [self.rules[rule_id].get("group", rule_id) for rule_id in rule_ids]
+        if len(set(groups)) != len(groups):
+            return result
+
+        punctuation = sum(1 for char in text if _is_punctuation(char))
+        meaningful = max(len(text) - punctuation - filler_chars, covered)
+        coverage = covered / meaningful if meaningful else 0.0
+        base = min(float(self.rules[rule_id].get("confidence", 1.0)) for rule_id in rule_ids)
+        result["confidence"] = round(base * coverage, 4)
+        return result
+
+    def build_diff(
+        self,
+        rule_ids: List[str],
+        phrases: List[str],
+        current_schema: Union[Dict[str, Any], Schema]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        把命中的规则展开为 Diff
+
+        规则中带 match 的 remove 操作按当前 Schema 解析：
+        移除包含任一关键词的元素，没有可移除的元素时跳过该操作。
+        """
+        operations = []
+        for rule_id in rule_ids:
+            for op in self.rules[rule_id]["operations"]:
+                if "match" in op:
+                    keywords = op["match"]
+                    values = [
+                        value for value in current_schema.get(op["field"]) or []
+                        if isinstance(value, str) and any(keyword in value for keyword in keywords)
+                    ]
+                    if not values:
+                        continue
+                    op = {"action": op["action"], "field": op["field"], "values": values}
+                operations.append(dict(op))
+
+        if not operations:
+            return None
+
+        descriptions = "，".join(self.rules[rule_id].get("description", rule_id) for rule_id in rule_ids)
+        return {
+            "operations": operations,
+            "reasoning": f"本地规则匹配「{'、'.join(phrases)}」：{descriptions}"
+        }
+
+    def classify(
+        self,
+        feedback: str,
+        current_schema: Union[Dict[str, Any], Schema],
+        threshold: Optional[float] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        置信度达到阈值时返回 {"diff", "confidence", "rules"}，否则返回 None（需交给 LLM）
+        """
+        threshold = settings.feedback_fast_path_threshold if threshold is None else threshold
+        matched = self.match(feedback)
+        if matched["confidence"] < threshold:
+            return None
+
+        diff = self.build_diff(matched["rules"], matched["phrases"], current_schema)
+        if diff is None:
+            return None
+        return {"diff": diff, "confidence": matched["confidence"], "rules": matched["rules"]}
+
+
+class FastPathStats:
+    """快速通道命中统计（进程内）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.escalated = 0
+        self.rule_hits: Dict[str, int] = {}
+
+    def record(self, result: Optional[Dict[str, Any]]):
+        with self._lock:
+            if result is None:
+                self.escalated += 1
+                return
+            self.hits += 1
+            for rule_id in result["rules"]:
+                self.rule_hits[rule_id] = self.rule_hits.get(rule_id, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.escalated
+            return {
+                "total": total,
+                "hits": self.hits,
+                "escalated": self.escalated,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "rule_hits": dict(self.rule_hits)
+            }
+
+
+fast_path_stats = FastPathStats()
+
+
+@lru_cache(maxsize=1)
+def get_feedback_classifier() -> FeedbackRuleClassifier:
+    """加载规则表并编译自动机（进程内只执行一次）"""
+    path = Path(settings.feedback_rules_path) if settings.feedback_rules_path else DEFAULT_RULES_PATH
+    classifier = FeedbackRuleClassifier.from_file(path)
+    print(f"⚡ 已加载反馈规则 {len(classifier.rules)} 条（{path.name}）")
+    return classifier
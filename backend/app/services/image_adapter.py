@@ -1,13 +1,71 @@
 """
 Image Adapter - 负责图像生成
-阶段 1: Mock 实现（使用 picsum.photos）
+阶段 1: Mock 实现（本地确定性生成，或使用 picsum.photos）
 阶段 2: 接入火山引擎 Seedream 图片生成 API
+
+反馈迭代时上一版本的图片作为参考图（图生图）传给 Seedream。
+参考图缩小并编码为 data URI 后按 (路径, 修改时间, 大小) 缓存，
+同一版本的多次反馈不会重复读取和编码原图。
 """
+import asyncio
+import os
+import threading
+import time
 import httpx
 import random
 from pathlib import Path
 from typing import Dict, Any, Optional
 
+from app.config import settings
+from app.core.metrics import record_fallback, record_span, span, upstream_call
+from app.services.cache import LRUCache
+from app.services.image_utils import downscale_enabled, encode_reference, to_data_uri
+from app.services.procedural_image import parse_size, render_image
+
+
+class ImageStats:
+    """图片生成统计（各阶段耗时、参考图上传字节数和编码缓存命中）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Dict[str, float]] = {}
+        self._reference = {"uploads": 0, "upload_bytes": 0, "cache_hits": 0, "cache_misses": 0}
+
+    def record_stage(self, stage: str, seconds: float):
+        with self._lock:
+            totals = self._stages.setdefault(stage, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            totals["count"] += 1
+            totals["total_ms"] += seconds * 1000
+            totals["max_ms"] = max(totals["max_ms"], seconds * 1000)
+
+    def record_reference(self, upload_bytes: int, cache_hit: bool):
+        with self._lock:
+            self._reference["uploads"] += 1
+            self._reference["upload_bytes"] += upload_bytes
+            self._reference["cache_hits" if cache_hit else "cache_misses"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {
+                stage: {
+                    "count": totals["count"],
+                    "avg_ms": round(totals["total_ms"] / totals["count"], 2),
+                    "max_ms": round(totals["max_ms"], 2)
+                }
+                for stage, totals in self._stages.items()
+            }
+            reference = dict(self._reference)
+        reference["avg_upload_bytes"] = (
+            reference["upload_bytes"] // reference["uploads"] if reference["uploads"] else 0
+        )
+        return {"stages": stages, "reference": reference, "downscale_enabled": downscale_enabled()}
+
+
+image_stats = ImageStats()
+
+# 已编码的参考图：(路径, 修改时间, 大小) → data URI
+_reference_cache = LRUCache(maxsize=settings.reference_cache_size)
+
 
 class ImageAdapter:
     """图像生成适配器
@@ -24,7 +82,6 @@ class ImageAdapter:
         self.use_real_api = use_real_api
 
         # 存储路径
-        from app.config import settings
         self.storage_path = Path(settings.storage_path)
         self.storage_path.mkdir(parents=True, exist_ok=True)
 
@@ -39,12 +96,17 @@ class ImageAdapter:
             )
             self.model = settings.gemini_model
 
+        # 最近一次生成的各阶段耗时（毫秒）
+        self.last_timings: Dict[str, float] = {}
+
     async def generate_image(
         self,
         prompt: str,
         session_id: str,
         version: int,
-        reference_image_path: Optional[str] = None
+        reference_image_path: Optional[str] = None,
+        draft: bool = False,
+        fallback: bool = True
     ) -> Dict[str, str]:
         """
         生成图片
@@ -54,6 +116,8 @@ class ImageAdapter:
             session_id: 会话 ID
             version: 版本号
             reference_image_path: 参考图片路径（用于迭代优化）
+            draft: 是否生成低分辨率草图（渐进式生成，文件名带 -draft 后缀）
+            fallback: 真实 API 失败时是否回退到 mock 图片（False 时抛出 RuntimeError）
 
         Returns:
             {
@@ -65,19 +129,120 @@ class ImageAdapter:
             RuntimeError: API 调用失败
         """
         if self.use_real_api:
-            return await self._generate_with_gemini(prompt, session_id, version, reference_image_path)
+            return await self._generate_with_gemini(
+                prompt, session_id, version, reference_image_path, draft, fallback
+            )
         else:
-            return await self._generate_mock(session_id, version)
+            return await self._generate_mock(session_id, version, draft, prompt=prompt)
+
+    def _image_filename(self, session_id: str, version: int, draft: bool = False, ext: str = "png") -> str:
+        """图片文件名：{session_id}-v{version}.png，草图为 {session_id}-v{version}-draft.png"""
+        return f"{session_id}-v{version}{'-draft' if draft else ''}.{ext}"
+
+    def place_image(self, source_path: str, session_id: str, version: int) -> Dict[str, str]:
+        """
+        把已生成的图片移动到版本对应的文件名（用于采用投机生成的结果）
+
+        Returns:
+            与 generate_image 相同的结构
+        """
+        source = Path(source_path)
+        filename = f"{session_id}-v{version}{source.suffix}"
+        filepath = self.storage_path / filename
+        os.replace(source, filepath)
 
-    async def _generate_mock(self, session_id: str, version: int) -> Dict[str, str]:
-        """阶段 1: Mock 实现（下载 picsum 图片）"""
+        return {
+            "image_url": f"{settings.public_base_url}/images/{filename}",
+            "image_path": str(filepath)
+        }
+
+    async def _load_reference(self, reference_image_path: str) -> Optional[str]:
+        """
+        读取参考图并编码为 data URI（缓存命中时不读取原图）
+
+        Returns:
+            data URI；文件不存在时返回 None
+        """
+        path = Path(reference_image_path)
+        try:
+            stat = path.stat()
+        except OSError:
+            print(f"⚠️ 参考图不存在，按文生图处理: {reference_image_path}")
+            return None
+
+        key = (str(path.resolve()), stat.st_mtime_ns, stat.st_size)
+        data_uri = _reference_cache.get(key)
+        cache_hit = data_uri is not None
+        if not cache_hit:
+            start = time.perf_counter()
+            data, mime = await asyncio.to_thread(
+                encode_reference, path, settings.reference_image_max_side, settings.reference_image_quality
+            )
+            data_uri = to_data_uri(data, mime)
+            _reference_cache.set(key, data_uri)
+            self._record_stage("reference_encode", time.perf_counter() - start)
+            print(f"🖼️ 参考图编码完成：{stat.st_size} → {len(data)} 字节")
+
+        image_stats.record_reference(len(data_uri), cache_hit)
+        return data_uri
+
+    def _record_stage(self, stage: str, seconds: float):
+        self.last_timings[stage] = round(seconds * 1000, 2)
+        image_stats.record_stage(stage, seconds)
+        record_span(f"image.{stage}", seconds)
+
+    async def _generate_mock(
+        self,
+        session_id: str,
+        version: int,
+        draft: bool = False,
+        prompt: str = ""
+    ) -> Dict[str, str]:
+        """阶段 1: Mock 实现（MOCK_IMAGE_SOURCE 为 procedural 时本地生成，picsum 时下载随机图片）"""
+        if settings.mock_image_source == "picsum":
+            return await self._download_picsum(session_id, version, draft)
+
+        try:
+            # 模拟上游延迟和故障
+            latency = settings.mock_image_latency_ms + random.uniform(
+                -settings.mock_image_latency_jitter_ms, settings.mock_image_latency_jitter_ms
+            )
+            if latency > 0:
+                await asyncio.sleep(latency / 1000)
+            if random.random() < settings.mock_image_failure_rate:
+                raise RuntimeError("模拟图片生成故障")
+
+            width, height = parse_size(settings.mock_image_size)
+            if draft:
+                width, height = max(width // 2, 1), max(height // 2, 1)
+            image_format = settings.mock_image_format
+
+            # 相同 Prompt 生成相同画面；没有 Prompt 时按会话和版本区分
+            seed = prompt or f"{session_id}-v{version}"
+            filename = self._image_filename(session_id, version, draft, image_format)
+            filepath = self.storage_path / filename
+            with span("image.mock"):
+                data = await asyncio.to_thread(render_image, seed, width, height, image_format)
+                filepath.write_bytes(data)
+
+            return {
+                "image_url": f"{settings.public_base_url}/images/{filename}",
+                "image_path": str(filepath)
+            }
+
+        except Exception as e:
+            raise RuntimeError(f"图片生成失败: {e}")
+
+    async def _download_picsum(self, session_id: str, version: int, draft: bool = False) -> Dict[str, str]:
+        """下载 picsum 随机图片（需要联网）"""
         try:
             # 使用随机种子确保图片不同
             seed = random.randint(1, 10000)
-            picsum_url = f"https://picsum.photos/seed/{seed}/1920/1080"
+            width, height = (960, 540) if draft else (1920, 1080)
+            picsum_url = f"https://picsum.photos/seed/{seed}/{width}/{height}"
 
             # 文件命名
-            filename = f"{session_id}-v{version}.png"
+            filename = self._image_filename(session_id, version, draft)
             filepath = self.storage_path / filename
 
             # 下载图片
@@ -89,7 +254,6 @@ class ImageAdapter:
                     f.write(response.content)
 
             # 构建公开 URL
-            from app.config import settings
             public_url = f"{settings.public_base_url}/images/{filename}"
 
             return {
@@ -107,41 +271,58 @@ class ImageAdapter:
         prompt: str,
         session_id: str,
         version: int,
-        reference_image_path: Optional[str] = None
+        reference_image_path: Optional[str] = None,
+        draft: bool = False,
+        fallback: bool = True
     ) -> Dict[str, str]:
         """调用火山引擎 Seedream 图片生成 API（OpenAI SDK 兼容接口）"""
+        self.last_timings = {}
         try:
-            print(f"🔄 调用火山引擎 Seedream 图片生成 API...")
-
-            # 使用 OpenAI 图片生成接口格式
-            response = self.client.images.generate(
-                model=self.model,
-                prompt=prompt,
-                size="2K",  # 火山引擎支持: "2K", "4K" 或像素值如 "2048x2048"
-                response_format="url",  # 返回 URL，或使用 "b64_json" 返回 base64
-                extra_body={
-                    "watermark": False  # 是否添加水印
-                }
-            )
+            size = settings.draft_image_size if draft else settings.image_size
+            extra_body = {
+                "watermark": False  # 是否添加水印
+            }
+            if reference_image_path and settings.reference_image_enabled:
+                reference = await self._load_reference(reference_image_path)
+                if reference:
+                    # Seedream 图生图：image 支持 URL 或 base64 data URI
+                    extra_body["image"] = reference
+            print(f"🔄 调用火山引擎 Seedream 图片生成 API（{size}{'，图生图' if 'image' in extra_body else ''}）...")
+
+            # 使用 OpenAI 图片生成接口格式（同步 SDK 放到线程中执行，不阻塞事件循环）
+            start = time.perf_counter()
+            with upstream_call("seedream", model=self.model):
+                response = await asyncio.to_thread(
+                    self.client.images.generate,
+                    model=self.model,
+                    prompt=prompt,
+                    size=size,  # 火山引擎支持: "1K", "2K", "4K" 或像素值如 "2048x2048"
+                    response_format="url",  # 返回 URL，或使用 "b64_json" 返回 base64
+                    extra_body=extra_body
+                )
+            self._record_stage("generate", time.perf_counter() - start)
 
             # 获取图片 URL
             image_url = response.data[0].url
 
             # 下载图片到本地
-            filename = f"{session_id}-v{version}.png"
+            filename = self._image_filename(session_id, version, draft)
             filepath = self.storage_path / filename
 
+            start = time.perf_counter()
             async with httpx.AsyncClient(timeout=60.0) as client:
                 img_response = await client.get(image_url)
                 img_response.raise_for_status()
+            self._record_stage("download", time.perf_counter() - start)
 
-                with open(filepath, "wb") as f:
-                    f.write(img_response.content)
+            start = time.perf_counter()
+            with open(filepath, "wb") as f:
+                f.write(img_response.content)
+            self._record_stage("write", time.perf_counter() - start)
 
-            from app.config import settings
             public_url = f"{settings.public_base_url}/images/{filename}"
 
-            print(f"✅ 火山引擎图片生成成功: {filename}")
+            print(f"✅ 火山引擎图片生成成功: {filename}（{self.last_timings}）")
             return {
                 "image_url": public_url,
                 "image_path": str(filepath)
@@ -149,5 +330,8 @@ class ImageAdapter:
 
         except Exception as e:
             print(f"❌ 火山引擎图片生成失败: {e}")
+            if not fallback:
+                raise RuntimeError(f"图片生成失败: {e}") from e
             print(f"⚠️ 回退到 mock 模式")
-            return await self._generate_mock(session_id, version)
+            record_fallback("image_adapter")
+            return await self._generate_mock(session_id, version, draft, prompt=prompt)
@@ -0,0 +1,74 @@
+"""
+图片处理工具
+
+缩放依赖 Pillow（pyproject.toml 中已声明）。环境中缺少 Pillow 时退化为直接复制原图，
+启动时打印警告，/images/stats 的 downscale_enabled 为 false。
+"""
+import base64
+import io
+import mimetypes
+import shutil
+from functools import lru_cache
+from pathlib import Path
+from typing import Tuple
+
+
+@lru_cache(maxsize=1)
+def _load_pillow():
+    """按需导入 Pillow，未安装时返回 None（只警告一次）"""
+    try:
+        from PIL import Image
+        return Image
+    except ImportError:
+        print("⚠️ 未安装 Pillow，缩略图和参考图不会缩小（请执行 uv sync 安装依赖）")
+        return None
+
+
+def downscale_enabled() -> bool:
+    """图片缩放是否可用（Pillow 已安装）"""
+    return _load_pillow() is not None
+
+
+def make_thumbnail(source: Path, target: Path, max_side: int) -> Path:
+    """
+    生成缩略图（长边不超过 max_side）
+
+    Returns:
+        实际写入的文件路径
+    """
+    Image = _load_pillow()
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if Image is None:
+        shutil.copyfile(source, target)
+        return target
+
+    with Image.open(source) as image:
+        image.thumbnail((max_side, max_side))
+        image.save(target)
+    return target
+
+
+def encode_reference(source: Path, max_side: int, quality: int = 85) -> Tuple[bytes, str]:
+    """
+    把参考图缩小并编码为 JPEG（长边不超过 max_side）
+
+    Pillow 未安装时返回原图字节。
+
+    Returns:
+        (图片字节, MIME 类型)
+    """
+    Image = _load_pillow()
+    if Image is None:
+        mime = mimetypes.guess_type(source.name)[0] or "image/png"
+        return source.read_bytes(), mime
+
+    with Image.open(source) as image:
+        image.thumbnail((max_side, max_side))
+        buffer = io.BytesIO()
+        image.convert("RGB").save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue(), "image/jpeg"
+
+
+def to_data_uri(data: bytes, mime: str) -> str:
+    """编码为 data URI（data:<mime>;base64,...）"""
+    return f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}"
@@ -0,0 +1,96 @@
+"""
+JSON Stream - 增量解析 LLM 流式输出的 JSON 对象
+
+LLM 以任意切分的文本片段输出一个 JSON 对象，ObjectStreamParser 逐字符
+跟踪嵌套深度和字符串状态，每当顶层对象的一个成员（"key": value）完整结束，
+就立即解析并产出，不必等待整个对象输出完毕。
+"""
+import json
+from typing import Any, Iterator, List, Tuple
+
+
+class ObjectStreamParser:
+    """
+    顶层 JSON 对象的增量解析器
+
+    用法：
+        parser = ObjectStreamParser()
+        for chunk in chunks:
+            for key, value in parser.feed(chunk):
+                ...
+        result = parser.result()   # 完整对象
+    """
+
+    def __init__(self):
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._started = False
+        self.finished = False
+        # 当前顶层成员的原始文本
+        self._member: List[str] = []
+        self._members: dict = {}
+
+    def feed(self, chunk: str) -> Iterator[Tuple[str, Any]]:
+        """输入一个文本片段，产出其中完整结束的顶层成员 (key, value)"""
+        for char in chunk:
+            if self.finished:
+                # 对象结束后只允许空白
+                if not char.isspace():
+                    raise ValueError("JSON 对象结束后存在多余内容")
+                continue
+
+            if not self._started:
+                if char == "{":
+                    self._started = True
+                    self._depth = 1
+                elif not char.isspace():
+                    raise ValueError(f"JSON 流必须以对象开始，遇到 {char!r}")
+                continue
+
+            if self._in_string:
+                self._member.append(char)
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._member.append(char)
+            elif char in "{[":
+                self._depth += 1
+                self._member.append(char)
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.finished = True
+                    member = self._complete_member()
+                    if member is not None:
+                        yield member
+                else:
+                    self._member.append(char)
+            elif char == "," and self._depth == 1:
+                member = self._complete_member()
+                if member is not None:
+                    yield member
+            else:
+                self._member.append(char)
+
+    def _complete_member(self):
+        text = "".join(self._member).strip()
+        self._member = []
+        if not text:
+            return None
+        (key, value), = json.loads("{" + text + "}").items()
+        self._members[key] = value
+        return key, value
+
+    def result(self) -> dict:
+        """返回已解析的完整对象（对象未结束时抛出 ValueError）"""
+        if not self.finished:
+            raise ValueError("JSON 对象不完整")
+        return dict(self._members)
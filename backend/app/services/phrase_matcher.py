@@ -0,0 +1,87 @@
+"""
+Phrase Matcher - 多模式串匹配（Aho-Corasick 自动机）
+
+一次扫描文本即可找出所有词表短语的出现位置，耗时只与文本长度和命中数有关，
+与词表大小无关。反馈规则分类和 Schema 冲突检测共用本模块。
+"""
+from collections import deque
+from typing import Any, Dict, Generic, Iterable, Iterator, List, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class PhraseMatcher(Generic[T]):
+    """
+    Aho-Corasick 自动机
+
+    用法：
+        matcher = PhraseMatcher([("太暗", "brighten"), ("背景太乱", "simplify")])
+        for start, end, payload in matcher.find_all("背景太乱而且太暗"):
+            ...
+    """
+
+    def __init__(self, phrases: Iterable[Tuple[str, T]]):
+        # 状态 0 为根；goto[state][char] -> state
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # outputs[state] = [(短语长度, payload), ...]
+        self._outputs: List[List[Tuple[int, T]]] = [[]]
+
+        for phrase, payload in phrases:
+            if phrase:
+                self._insert(phrase, payload)
+        self._build_failure_links()
+
+    def __len__(self) -> int:
+        return len(self._goto)
+
+    def _insert(self, phrase: str, payload: T):
+        state = 0
+        for char in phrase:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+            state = next_state
+        self._outputs[state].append((len(phrase), payload))
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                # 合并后缀状态的输出，匹配时无需再沿失败链回溯
+                self._outputs[next_state] = self._outputs[next_state] + self._outputs[self._fail[next_state]]
+
+    def find_all(self, text: str) -> Iterator[Tuple[int, int, T]]:
+        """产出所有匹配 (start, end, payload)，end 为开区间"""
+        goto = self._goto
+        fail = self._fail
+        outputs = self._outputs
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, payload in outputs[state]:
+                yield index + 1 - length, index + 1, payload
+
+    def find_longest(self, text: str) -> List[Tuple[int, int, T]]:
+        """最左最长且互不重叠的匹配（同一位置多个短语时取最长）"""
+        matches = sorted(self.find_all(text), key=lambda m: (m[0], -(m[1] - m[0])))
+        selected: List[Tuple[int, int, Any]] = []
+        cursor = 0
+        for start, end, payload in matches:
+            if start >= cursor:
+                selected.append((start, end, payload))
+                cursor = end
+        return selected
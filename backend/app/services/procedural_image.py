@@ -0,0 +1,117 @@
+"""
+Procedural Image - 离线确定性图片生成（mock 模式使用）
+
+不依赖网络和第三方库（只用 zlib + struct），同一个种子总是生成同一张图：
+画面由若干色块组成，色块颜色和竖直渐变由种子的哈希决定。
+整行按色块整段拼接，不逐像素计算，1920x1080 的 PNG 可在几十毫秒内生成。
+"""
+import hashlib
+import struct
+import zlib
+from typing import List, Tuple
+
+
+# 水平和竖直方向的色块数
+_COLUMNS = 16
+_ROWS = 9
+
+FORMATS = ("png", "bmp")
+
+
+def parse_size(size: str) -> Tuple[int, int]:
+    """解析 "1920x1080" 格式的尺寸"""
+    try:
+        width, height = (int(part) for part in size.lower().split("x"))
+    except ValueError:
+        raise ValueError(f"图片尺寸格式应为 <宽>x<高>：{size}")
+    if width <= 0 or height <= 0:
+        raise ValueError(f"图片尺寸必须为正数：{size}")
+    return width, height
+
+
+def _palette(seed: str) -> List[Tuple[int, int, int]]:
+    """由种子派生出每个色块的基础颜色"""
+    digest = b""
+    counter = 0
+    while len(digest) < _COLUMNS * _ROWS * 3:
+        digest += hashlib.sha256(f"{seed}:{counter}".encode("utf-8")).digest()
+        counter += 1
+    # 以第一个颜色为主色调，其余色块向主色调靠拢，画面不至于过于杂乱
+    base = digest[0], digest[1], digest[2]
+    return [
+        tuple((base[c] + digest[i * 3 + c]) // 2 for c in range(3))
+        for i in range(_COLUMNS * _ROWS)
+    ]
+
+
+def _rows(seed: str, width: int, height: int) -> List[bytes]:
+    """逐行生成 RGB 像素数据（自上而下）"""
+    palette = _palette(seed)
+    # 每个色块的列宽（最后一块补齐剩余像素）
+    widths = [width // _COLUMNS] * _COLUMNS
+    widths[-1] += width - sum(widths)
+    band_height = max(height // _ROWS, 1)
+
+    rows = []
+    for y in range(height):
+        band = min(y // band_height, _ROWS - 1)
+        # 色块内的竖直渐变：从 100% 到 70% 亮度
+        shade = 100 - (y % band_height) * 30 // band_height
+        row = b"".join(
+            bytes(channel * shade // 100 for channel in palette[band * _COLUMNS + column]) * widths[column]
+            for column in range(_COLUMNS)
+        )
+        rows.append(row)
+    return rows
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+def encode_png(rows: List[bytes], width: int, height: int) -> bytes:
+    """RGB 行数据编码为 PNG（每行过滤类型 0）"""
+    raw = b"".join(b"\x00" + row for row in rows)
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + _png_chunk(b"IHDR", header)
+        + _png_chunk(b"IDAT", zlib.compress(raw, 6))
+        + _png_chunk(b"IEND", b"")
+    )
+
+
+def encode_bmp(rows: List[bytes], width: int, height: int) -> bytes:
+    """RGB 行数据编码为 24 位 BMP（自下而上、BGR、每行 4 字节对齐）"""
+    padding = b"\x00" * ((4 - width * 3 % 4) % 4)
+    pixels = b"".join(_to_bgr(row) + padding for row in reversed(rows))
+    header = struct.pack("<2sIHHI", b"BM", 54 + len(pixels), 0, 0, 54)
+    info = struct.pack("<IiiHHIIiiII", 40, width, height, 1, 24, 0, len(pixels), 2835, 2835, 0, 0)
+    return header + info + pixels
+
+
+def _to_bgr(row: bytes) -> bytes:
+    bgr = bytearray(row)
+    bgr[0::3], bgr[2::3] = row[2::3], row[0::3]
+    return bytes(bgr)
+
+
+def render_image(seed: str, width: int, height: int, image_format: str = "png") -> bytes:
+    """
+    生成图片
+
+    Args:
+        seed: 种子（通常为 Prompt），相同种子生成相同画面
+        width: 宽度（像素）
+        height: 高度（像素）
+        image_format: png 或 bmp
+
+    Returns:
+        编码后的图片字节
+    """
+    if image_format not in FORMATS:
+        raise ValueError(f"不支持的图片格式 {image_format}，可选：{'/'.join(FORMATS)}")
+    rows = _rows(seed, width, height)
+    if image_format == "bmp":
+        return encode_bmp(rows, width, height)
+    return encode_png(rows, width, height)
@@ -0,0 +1,91 @@
+"""
+Progressive Rendering - 先草图后正式图的渐进式生成
+
+1. 请求内先生成低分辨率草图（DRAFT_IMAGE_SIZE），版本以 image_status="draft" 入库并立即返回
+2. 响应发送后在后台渲染正式图（IMAGE_SIZE），写完文件后用一条 UPDATE
+   把版本的 image_url / image_path 换成正式图；草图在 DRAFT_RETENTION_SECONDS 后删除，
+   期间已读到草图路径的反馈请求仍可把它作为参考图。
+   正式图不回退到 mock：真实 API 失败时版本标记为 failed，继续使用草图
+3. 两个阶段都通过事件总线向 GET /sessions/{id}/events 的订阅者推送：
+   image_draft / image_final / image_failed
+"""
+import asyncio
+from pathlib import Path
+from typing import Optional
+
+from app.config import settings
+from app.core.database import SessionLocal
+from app.services.event_bus import event_bus
+from app.services.image_adapter import ImageAdapter
+from app.services.session_manager import SessionManager
+
+
+IMAGE_STATUS_DRAFT = "draft"
+IMAGE_STATUS_FINAL = "final"
+IMAGE_STATUS_FAILED = "failed"
+
+
+def announce_draft(session_id: str, version_number: int, image_url: str):
+    """通知订阅者草图已就绪"""
+    event_bus.publish(session_id, "image_draft", {
+        "version": version_number,
+        "image_url": image_url,
+        "image_status": IMAGE_STATUS_DRAFT
+    })
+
+
+def _schedule_draft_removal(draft_path: str):
+    """延迟删除已被正式图替换的草图"""
+    delay = settings.draft_retention_seconds
+    if delay <= 0:
+        Path(draft_path).unlink(missing_ok=True)
+        return
+    asyncio.get_running_loop().call_later(delay, lambda: Path(draft_path).unlink(missing_ok=True))
+
+
+async def render_final_image(
+    session_id: str,
+    version_id: str,
+    version_number: int,
+    prompt: str,
+    reference_image_path: Optional[str] = None
+):
+    """后台渲染正式图并替换草图（BackgroundTasks 调用，自行管理数据库会话）"""
+    image_adapter = ImageAdapter(use_real_api=settings.use_real_api)
+    try:
+        image_result = await image_adapter.generate_image(
+            prompt=prompt,
+            session_id=session_id,
+            version=version_number,
+            reference_image_path=reference_image_path,
+            fallback=False
+        )
+    except Exception as e:
+        print(f"❌ 正式图渲染失败 {session_id} v{version_number}: {e}")
+        with SessionLocal() as db:
+            SessionManager(db).update_version_image(version_id, image_status=IMAGE_STATUS_FAILED)
+        event_bus.publish(session_id, "image_failed", {
+            "version": version_number,
+            "detail": str(e),
+            "image_status": IMAGE_STATUS_FAILED
+        })
+        return
+
+    with SessionLocal() as db:
+        draft_path = SessionManager(db).update_version_image(
+            version_id,
+            image_url=image_result["image_url"],
+            image_path=image_result["image_path"],
+            image_status=IMAGE_STATUS_FINAL
+        )
+
+    # 版本已指向正式图，草图延迟删除
+    if draft_path and draft_path != image_result["image_path"]:
+        _schedule_draft_removal(draft_path)
+
+    print(f"🖼️ 正式图已替换草图 {session_id} v{version_number}")
+    event_bus.publish(session_id, "image_final", {
+        "version": version_number,
+        "image_url": image_result["image_url"],
+        "image_status": IMAGE_STATUS_FINAL
+    })
@@ -7,7 +7,12 @@ import json
 import random
 import time
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, Union
+
+from app.core.metrics import record_fallback, upstream_call
+from app.schemas.prompt import Schema, validate_schema
+from app.services.context_builder import ContextBuilder, usage_stats
+from app.services.json_stream import ObjectStreamParser
 
 
 # System Prompt 模板（阶段 2 使用）
@@ -94,6 +99,7 @@ class PromptEngine:
             use_real_api: 是否使用真实 OpenAI API（阶段 2 设置为 True）
         """
         self.use_real_api = use_real_api
+        self.last_usage = None
         if use_real_api:
             from openai import OpenAI
             from app.config import settings
@@ -142,6 +148,77 @@ class PromptEngine:
         else:
             return self._generate_mock(user_input)
 
+    def generate_schema_stream(self, user_input: str) -> Iterator[Dict[str, Any]]:
+        """
+        流式生成 Schema：每个字段生成完毕即产出，最后产出渲染后的 Prompt
+
+        Yields:
+            {"event": "field", "data": {"field": "subject", "value": [...]}}
+            ...
+            {"event": "done", "data": {"schema": dict, "prompt": str}}
+
+        Raises:
+            ValueError: 用户输入为空
+        """
+        if not user_input or not user_input.strip():
+            raise ValueError("用户输入不能为空")
+
+        if not self.use_real_api:
+            result = self._generate_mock(user_input)
+            for field, value in result["schema"].items():
+                yield {"event": "field", "data": {"field": field, "value": value}}
+            yield {"event": "done", "data": result}
+            return
+
+        emitted: Dict[str, Any] = {}
+        try:
+            for field, value in self._stream_with_openai(user_input):
+                emitted[field] = value
+                yield {"event": "field", "data": {"field": field, "value": value}}
+            schema = dict(emitted)
+            self._validate_schema(schema)
+            result = {"schema": schema, "prompt": self._render_prompt(schema)}
+        except Exception as e:
+            # 流式调用失败时退回非流式生成（含重试和 Mock 回退），只补发有变化的字段
+            print(f"⚠️ 流式生成失败: {e}，改用非流式生成")
+            record_fallback("prompt_stream")
+            result = self.generate_schema(user_input)
+            for field, value in result["schema"].items():
+                if emitted.get(field) != value:
+                    yield {"event": "field", "data": {"field": field, "value": value}}
+
+        yield {"event": "done", "data": result}
+
+    def _stream_with_openai(self, user_input: str) -> Iterator[tuple]:
+        """调用 OpenAI 流式接口，逐个产出解析完成的顶层字段 (field, value)"""
+        messages, estimated_tokens = ContextBuilder().generation_messages(
+            self.system_prompt, GENERATION_SYSTEM_PROMPT, user_input
+        )
+        print("🔄 调用 OpenAI API（流式）...")
+        parser = ObjectStreamParser()
+        # 计时覆盖整个流（从发起请求到最后一个片段）
+        with upstream_call("openai", "llm.generation_stream", model=self.model):
+            stream = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                response_format={"type": "json_object"},
+                temperature=0.7,
+                max_tokens=1500,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+
+            for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    self.last_usage = usage_stats.record("generation", chunk, estimated_tokens)
+                if not chunk.choices:
+                    continue
+                content = chunk.choices[0].delta.content
+                if content:
+                    yield from parser.feed(content)
+            parser.result()
+        print("✅ Prompt 流式生成成功")
+
     def _generate_mock(self, user_input: str) -> Dict[str, Any]:
         """阶段 1: Mock 实现"""
         # 预设的两个 Schema 模板
@@ -186,20 +263,23 @@ class PromptEngine:
         max_retries = 3
         retry_delay = 1  # 秒
 
+        messages, estimated_tokens = ContextBuilder().generation_messages(
+            self.system_prompt, GENERATION_SYSTEM_PROMPT, user_input
+        )
+
         for attempt in range(max_retries):
             try:
                 print(f"🔄 调用 OpenAI API (尝试 {attempt + 1}/{max_retries})...")
 
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": self.system_prompt},
-                        {"role": "user", "content": user_input}
-                    ],
-                    response_format={"type": "json_object"},
-                    temperature=0.7,
-                    max_tokens=1500
-                )
+                with upstream_call("openai", "llm.generation", model=self.model, attempt=attempt):
+                    response = self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        response_format={"type": "json_object"},
+                        temperature=0.7,
+                        max_tokens=1500
+                    )
+                self.last_usage = usage_stats.record("generation", response, estimated_tokens)
 
                 schema_json = json.loads(response.choices[0].message.content)
 
@@ -208,7 +288,7 @@ class PromptEngine:
 
                 prompt = self._render_prompt(schema_json)
 
-                print(f"✅ Prompt 生成成功")
+                print(f"✅ Prompt 生成成功（prompt {self.last_usage['prompt_tokens']} / completion {self.last_usage['completion_tokens']} tokens）")
                 return {
                     "schema": schema_json,
                     "prompt": prompt
@@ -221,6 +301,7 @@ class PromptEngine:
                     continue
                 else:
                     print(f"❌ 解析失败，回退到 mock 模式")
+                    record_fallback("prompt_engine")
                     return self._generate_mock(user_input)
 
             except Exception as e:
@@ -231,19 +312,14 @@ class PromptEngine:
                     continue
                 else:
                     print(f"❌ API 调用失败，回退到 mock 模式")
+                    record_fallback("prompt_engine")
                     return self._generate_mock(user_input)
 
     def _validate_schema(self, schema: Dict[str, Any]):
-        """验证 Schema 完整性"""
-        required_fields = [
-            "subject", "appearance", "style", "composition",
-            "lighting", "background", "quality", "negative", "weights"
-        ]
-        for field in required_fields:
-            if field not in schema:
-                raise ValueError(f"Schema 缺少必要字段：{field}")
+        """验证 Schema 完整性（校验函数在模块加载时编译一次）"""
+        validate_schema(schema)
 
-    def _render_prompt(self, schema: Dict[str, Any]) -> str:
+    def _render_prompt(self, schema: Union[Dict[str, Any], Schema]) -> str:
         """
         将 Schema 渲染为自然语言 Prompt
 
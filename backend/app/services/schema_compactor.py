@@ -0,0 +1,201 @@
+"""
+Schema Compactor - 控制 Schema 随反馈轮次增长
+
+多轮反馈中 add 操作不断追加元素，Schema 和渲染出的 Prompt 会无限变长。
+开启 SCHEMA_COMPACTION_ENABLED 后，每次应用 LLM / 规则生成的 Diff 后依次执行：
+1. 去重：归一化后完全相同的元素只保留第一个
+2. 近似去重：忽略"的"后相同、或字符二元组 Jaccard 相似度达到阈值的元素只保留第一个
+3. 字段上限：超出 SCHEMA_FIELD_CAPS 时丢弃最早的元素（subject 的首个元素为主体，始终保留）
+4. 长度预算：渲染后的 Prompt 超过 PROMPT_CHAR_BUDGET 时，
+   从权重最低的字段开始逐个丢弃最早的元素，每个字段至少保留一个元素
+
+压缩结果以 replace 操作的形式返回，由调用方追加到 Diff 中，
+保证存储的 Diff 仍能从父版本重放出存储的 Schema。节省量累计在 compaction_stats。
+"""
+import threading
+import unicodedata
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.config import settings
+from app.schemas.prompt import LIST_FIELDS, WEIGHT_DEFAULT, Schema
+from app.services.token_counter import count_tokens
+
+
+def normalize_element(value: str) -> str:
+    """归一化：全半角统一、转小写、去掉空白和标点"""
+    value = unicodedata.normalize("NFKC", value).lower()
+    return "".join(
+        char for char in value
+        if not char.isspace() and not unicodedata.category(char).startswith(("P", "S"))
+    )
+
+
+def _bigrams(value: str) -> Set[str]:
+    if len(value) < 2:
+        return {value}
+    return {value[i:i + 2] for i in range(len(value) - 1)}
+
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    union = len(a | b)
+    return len(a & b) / union if union else 1.0
+
+
+class SchemaCompactor:
+    """Schema 压缩器"""
+
+    def __init__(
+        self,
+        similarity_threshold: Optional[float] = None,
+        field_caps: Optional[Dict[str, int]] = None,
+        char_budget: Optional[int] = None
+    ):
+        self.similarity_threshold = (
+            settings.schema_similarity_threshold if similarity_threshold is None else similarity_threshold
+        )
+        self.field_caps = settings.schema_field_caps if field_caps is None else field_caps
+        self.char_budget = settings.prompt_char_budget if char_budget is None else char_budget
+
+    def compact(self, schema: Schema) -> Tuple[Schema, Dict[str, Any]]:
+        """
+        压缩 Schema
+
+        Returns:
+            (新 Schema, 报告)
+            报告：{
+                "duplicates": 2, "near_duplicates": 1, "capped": 0, "trimmed": 3,
+                "chars_saved": 48, "tokens_saved": 31,
+                "operations": [{"action": "replace", "field": "lighting", "value": [...]}]
+            }
+        """
+        from app.services.prompt_engine import PromptEngine
+        render = PromptEngine()._render_prompt
+
+        original = schema
+        before = render(schema)
+        report = {"duplicates": 0, "near_duplicates": 0, "capped": 0, "trimmed": 0}
+
+        for field in LIST_FIELDS:
+            values = schema.get(field)
+            kept = self._dedupe(values, report)
+            kept = self._cap(field, kept, report)
+            if len(kept) != len(values):
+                schema = schema.apply({"action": "replace", "field": field, "value": kept})
+
+        after = render(schema)
+        if self.char_budget and len(after) > self.char_budget:
+            schema, after = self._trim_to_budget(schema, after, render, report)
+
+        report["chars_saved"] = len(before) - len(after)
+        report["tokens_saved"] = count_tokens(before) - count_tokens(after) if report["chars_saved"] else 0
+        report["operations"] = [
+            {"action": "replace", "field": field, "value": list(schema.get(field))}
+            for field in LIST_FIELDS
+            if schema.get(field) != original.get(field)
+        ]
+        return schema, report
+
+    def _dedupe(self, values: Tuple[Any, ...], report: Dict[str, Any]) -> List[Any]:
+        kept: List[Any] = []
+        seen: Set[str] = set()
+        loose_seen: Set[str] = set()
+        kept_bigrams: List[Set[str]] = []
+        for value in values:
+            if not isinstance(value, str):
+                kept.append(value)
+                continue
+            key = normalize_element(value)
+            if key in seen:
+                report["duplicates"] += 1
+                continue
+            # 近似比较时忽略结构助词（"更亮的环境光" ≈ "更亮环境光"）
+            loose_key = key.replace("的", "")
+            grams = _bigrams(loose_key)
+            if loose_key in loose_seen or self.similarity_threshold and any(
+                _jaccard(grams, other) >= self.similarity_threshold for other in kept_bigrams
+            ):
+                report["near_duplicates"] += 1
+                continue
+            seen.add(key)
+            loose_seen.add(loose_key)
+            kept_bigrams.append(grams)
+            kept.append(value)
+        return kept
+
+    def _cap(self, field: str, values: List[Any], report: Dict[str, Any]) -> List[Any]:
+        cap = self.field_caps.get(field)
+        if not cap or len(values) <= cap:
+            return values
+        report["capped"] += len(values) - cap
+        if field == "subject":
+            # 主体始终保留，其余保留最新的元素
+            return values[:1] + values[len(values) - cap + 1:] if cap > 1 else values[:1]
+        return values[len(values) - cap:]
+
+    def _trim_to_budget(self, schema: Schema, rendered: str, render, report: Dict[str, Any]):
+        while len(rendered) > self.char_budget:
+            candidates = []
+            for field in LIST_FIELDS:
+                values = schema.get(field)
+                if len(values) <= 1:
+                    continue
+                weight = schema.weight(field, WEIGHT_DEFAULT)
+                candidates.append((weight, -len(values), field))
+            if not candidates:
+                break
+
+            _, _, field = min(candidates)
+            values = schema.get(field)
+            # 丢弃最早的元素（subject 保留主体）
+            drop = 1 if field == "subject" else 0
+            schema = schema.apply({
+                "action": "replace",
+                "field": field,
+                "value": list(values[:drop] + values[drop + 1:])
+            })
+            report["trimmed"] += 1
+            rendered = render(schema)
+        return schema, rendered
+
+
+class CompactionStats:
+    """Schema 压缩统计（进程内）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.compacted = 0
+        self.removed = {"duplicates": 0, "near_duplicates": 0, "capped": 0, "trimmed": 0}
+        self.chars_saved = 0
+        self.tokens_saved = 0
+
+    def record(self, report: Dict[str, Any]):
+        with self._lock:
+            self.runs += 1
+            if report["operations"]:
+                self.compacted += 1
+            for key in self.removed:
+                self.removed[key] += report[key]
+            self.chars_saved += report["chars_saved"]
+            self.tokens_saved += report["tokens_saved"]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": settings.schema_compaction_enabled,
+                "runs": self.runs,
+                "compacted": self.compacted,
+                "removed": dict(self.removed),
+                "chars_saved": self.chars_saved,
+                "tokens_saved": self.tokens_saved
+            }
+
+
+compaction_stats = CompactionStats()
+
+
+def compact_schema(schema: Schema) -> Tuple[Schema, Dict[str, Any]]:
+    """按当前配置压缩 Schema（结果计入 compaction_stats）"""
+    schema, report = SchemaCompactor().compact(schema)
+    compaction_stats.record(report)
+    return schema, report
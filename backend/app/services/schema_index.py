@@ -0,0 +1,194 @@
+"""
+Schema Index - Schema 元素倒排索引与相似项目检索
+
+倒排表 schema_terms 记录 (field, term) → version_id / session_id，
+由 SessionManager.create_version 增量维护。相似度检索只读取
+查询 Schema 中出现的元素对应的倒排列表，不扫描 Version.schema。
+"""
+import itertools
+import math
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import insert, tuple_
+from sqlalchemy.orm import Session as SQLSession
+
+from app.config import settings
+from app.models import Session, Version, SchemaTerm
+
+
+# 参与索引的列表字段（weights 是数值，不参与）
+INDEXED_FIELDS = (
+    "subject", "appearance", "style", "composition",
+    "lighting", "background", "quality", "negative"
+)
+
+
+def normalize_term(value: Any) -> str:
+    """元素归一化：去首尾空白、合并连续空白、转小写"""
+    return " ".join(str(value).split()).lower()[:255]
+
+
+def extract_terms(schema: Dict[str, Any]) -> Set[Tuple[str, str]]:
+    """从 Schema 中提取去重后的 (field, term)"""
+    terms = set()
+    for field in INDEXED_FIELDS:
+        values = schema.get(field) or []
+        if not isinstance(values, list):
+            continue
+        for value in values:
+            term = normalize_term(value)
+            if term:
+                terms.add((field, term))
+    return terms
+
+
+class SchemaIndex:
+    """Schema 元素倒排索引（与调用方共用同一个数据库事务）"""
+
+    def __init__(self, db: SQLSession):
+        self.db = db
+
+    # ---------- 写入 ----------
+
+    def index_version(self, version: Version):
+        """写入单个版本的倒排记录"""
+        self.index_versions([version])
+
+    def index_versions(self, versions: Iterable[Version]):
+        """批量写入倒排记录"""
+        rows = [
+            {
+                "field": field,
+                "term": term,
+                "version_id": str(version.id),
+                "session_id": str(version.session_id)
+            }
+            for version in versions
+            for field, term in extract_terms(version.schema or {})
+        ]
+        if rows:
+            self.db.execute(insert(SchemaTerm), rows)
+
+    def remove_session(self, session_id: str):
+        """删除会话的全部倒排记录"""
+        self.db.query(SchemaTerm).filter(
+            SchemaTerm.session_id == str(session_id)
+        ).delete(synchronize_session=False)
+
+    def rebuild(self, batch_size: int = 1000) -> int:
+        """重建全部倒排记录"""
+        self.db.query(SchemaTerm).delete(synchronize_session=False)
+        self.db.commit()
+
+        versions = (
+            self.db.query(Version)
+            .join(Session, Session.id == Version.session_id)
+            .filter(Session.deleted_at.is_(None))
+            .yield_per(batch_size)
+        )
+        # 已归档会话的版本行已删除，从归档文件读取
+        from app.services.session_transfer import SessionExporter
+        archived = SessionExporter(self.db).archived_versions()
+
+        count = 0
+        batch: List[Version] = []
+        for version in itertools.chain(versions, archived):
+            batch.append(version)
+            if len(batch) >= batch_size:
+                self.index_versions(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            self.index_versions(batch)
+            count += len(batch)
+        self.db.commit()
+        return count
+
+    # ---------- 查询 ----------
+
+    def similar_sessions(
+        self,
+        schema: Dict[str, Any],
+        limit: int = 10,
+        exclude_session_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        按加权元素重合度检索相似项目
+
+        得分 = Σ 命中元素的 (字段权重 × IDF) / Σ 查询元素的 (字段权重 × IDF)，
+        IDF 按包含该元素的会话数计算，常见元素（如"高清"）贡献更小。
+
+        Returns:
+            [
+                {
+                    "session_id": "...",
+                    "name": "...",
+                    "score": 0.82,                          # 0 ~ 1
+                    "matched": {"style": ["赛博朋克"], ...}  # 命中的元素
+                }
+            ]
+        """
+        query_terms = extract_terms(schema)
+        if not query_terms:
+            return []
+
+        # 只读取查询元素的倒排列表（每个会话每个元素只取一次）
+        postings = (
+            self.db.query(SchemaTerm.field, SchemaTerm.term, SchemaTerm.session_id)
+            .join(Session, Session.id == SchemaTerm.session_id)
+            .filter(
+                tuple_(SchemaTerm.field, SchemaTerm.term).in_(list(query_terms)),
+                Session.deleted_at.is_(None)
+            )
+            .distinct()
+            .all()
+        )
+
+        total_sessions = max(
+            self.db.query(Session).filter(Session.deleted_at.is_(None)).count(), 1
+        )
+        document_frequency: Dict[Tuple[str, str], int] = defaultdict(int)
+        matched: Dict[str, Dict[str, List[str]]] = defaultdict(lambda: defaultdict(list))
+        for field, term, session_id in postings:
+            document_frequency[(field, term)] += 1
+            if session_id != exclude_session_id:
+                matched[session_id][field].append(term)
+
+        field_weights = settings.similarity_field_weights
+
+        def term_weight(field: str, term: str) -> float:
+            idf = math.log(1 + total_sessions / (1 + document_frequency.get((field, term), 0)))
+            return field_weights.get(field, 1.0) * idf
+
+        query_weight = sum(term_weight(field, term) for field, term in query_terms)
+        if query_weight <= 0:
+            return []
+
+        scored = []
+        for session_id, fields in matched.items():
+            weight = sum(
+                term_weight(field, term)
+                for field, terms in fields.items()
+                for term in terms
+            )
+            scored.append((weight / query_weight, session_id))
+
+        scored.sort(reverse=True)
+        scored = scored[:limit]
+        if not scored:
+            return []
+
+        names = dict(
+            self.db.query(Session.id, Session.name)
+            .filter(Session.id.in_([session_id for _, session_id in scored]))
+            .all()
+        )
+        return [
+            {
+                "session_id": session_id,
+                "name": names.get(session_id),
+                "score": round(score, 4),
+                "matched": {field: sorted(terms) for field, terms in matched[session_id].items()}
+            }
+            for score, session_id in scored
+        ]
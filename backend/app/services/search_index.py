@@ -0,0 +1,262 @@
+"""
+Search Index - 会话和版本的全文检索
+
+- SQLite: FTS5 虚拟表（unicode61 分词器）
+- PostgreSQL: tsvector + GIN 索引（simple 配置）
+
+中文等 CJK 文本没有空格分词，这里在写入和查询前统一做预切分：
+CJK 连续字符切成单字 + 二元组（bigram），拉丁字母和数字按单词小写。
+两种数据库都只需要按空格分词，检索行为保持一致。
+"""
+import re
+from typing import Any, Dict, List, Optional
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session as SQLSession
+
+from app.models import Session, Version, SearchDocument
+
+
+# CJK 统一表意文字 / 扩展A / 兼容表意文字 / 日文假名 / 韩文音节
+_CJK = r"\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af"
+_TOKEN_RE = re.compile(rf"([{_CJK}]+)|([0-9A-Za-z\u00c0-\u024f]+)")
+
+
+def tokenize(value: Optional[str], for_query: bool = False) -> List[str]:
+    """
+    CJK 感知的预分词
+
+    写入时 CJK 连续字符输出单字和二元组，保证单字查询也能命中；
+    查询时长度 >= 2 的 CJK 片段只输出二元组（短语由相邻二元组的交集近似）。
+    """
+    if not value:
+        return []
+
+    tokens: List[str] = []
+    for cjk, word in _TOKEN_RE.findall(value):
+        if word:
+            tokens.append(word.lower())
+            continue
+        if len(cjk) == 1 or not for_query:
+            tokens.extend(cjk)
+        tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+
+    # 去重并保持顺序
+    return list(dict.fromkeys(tokens))
+
+
+def ensure_search_schema(bind: Engine):
+    """创建方言相关的索引结构（init_db 和 Alembic 迁移共用）"""
+    with bind.begin() as conn:
+        if bind.dialect.name == "sqlite":
+            conn.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS search_fts "
+                "USING fts5(content, tokenize = 'unicode61 remove_diacritics 2')"
+            ))
+        elif bind.dialect.name == "postgresql":
+            conn.execute(text(
+                "ALTER TABLE search_documents ADD COLUMN IF NOT EXISTS tsv tsvector"
+            ))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_search_documents_tsv "
+                "ON search_documents USING GIN (tsv)"
+            ))
+
+
+class SearchIndex:
+    """全文检索索引（与调用方共用同一个数据库事务）"""
+
+    def __init__(self, db: SQLSession):
+        self.db = db
+        self.dialect = db.get_bind().dialect.name
+
+    # ---------- 写入 ----------
+
+    def index_session(self, session: Session):
+        """索引会话名称和描述（已存在则替换）"""
+        self._upsert(
+            doc_key=f"s:{session.id}",
+            session_id=session.id,
+            version_id=None,
+            parts=[session.name, session.description]
+        )
+
+    def index_version(self, version: Version):
+        """索引版本的用户输入、反馈和 Prompt（版本不可变，只会写入一次）"""
+        self._upsert(
+            doc_key=f"v:{version.id}",
+            session_id=version.session_id,
+            version_id=version.id,
+            parts=[version.user_input, version.user_feedback, version.prompt]
+        )
+
+    def remove_session(self, session_id: str):
+        """删除会话及其所有版本的索引文档"""
+        documents = self.db.query(SearchDocument).filter(SearchDocument.session_id == str(session_id))
+
+        ids = [doc_id for (doc_id,) in documents.with_entities(SearchDocument.id)]
+        if not ids:
+            return
+        if self.dialect == "sqlite":
+            for start in range(0, len(ids), 500):
+                self.db.execute(
+                    text("DELETE FROM search_fts WHERE rowid IN ({})".format(
+                        ",".join(str(doc_id) for doc_id in ids[start:start + 500])
+                    ))
+                )
+        documents.delete(synchronize_session=False)
+
+    def rebuild(self, batch_size: int = 1000) -> int:
+        """重建全部索引（用于首次上线或索引损坏后的修复）"""
+        if self.dialect == "sqlite":
+            self.db.execute(text("DELETE FROM search_fts"))
+        self.db.query(SearchDocument).delete(synchronize_session=False)
+        self.db.commit()
+
+        count = 0
+        for session in self.db.query(Session).filter(Session.deleted_at.is_(None)).yield_per(batch_size):
+            self.index_session(session)
+            count += 1
+        self.db.commit()
+
+        versions = (
+            self.db.query(Version)
+            .join(Session, Session.id == Version.session_id)
+            .filter(Session.deleted_at.is_(None))
+            .yield_per(batch_size)
+        )
+        for version in versions:
+            self.index_version(version)
+            count += 1
+            if count % batch_size == 0:
+                self.db.commit()
+
+        # 已归档会话的版本行已删除，从归档文件读取
+        from app.services.session_transfer import SessionExporter
+        for version in SessionExporter(self.db).archived_versions():
+            self.index_version(version)
+            count += 1
+            if count % batch_size == 0:
+                self.db.commit()
+        self.db.commit()
+        return count
+
+    def _upsert(
+        self,
+        doc_key: str,
+        session_id: str,
+        version_id: Optional[str],
+        parts: List[Optional[str]]
+    ):
+        tokens: List[str] = []
+        for part in parts:
+            tokens.extend(tokenize(part))
+        content = " ".join(dict.fromkeys(tokens))
+
+        document = self.db.query(SearchDocument).filter(SearchDocument.doc_key == doc_key).first()
+        if document is None:
+            document = SearchDocument(doc_key=doc_key, session_id=str(session_id), version_id=version_id)
+            self.db.add(document)
+            self.db.flush()
+        elif self.dialect == "sqlite":
+            self.db.execute(text("DELETE FROM search_fts WHERE rowid = :id"), {"id": document.id})
+
+        if self.dialect == "sqlite":
+            self.db.execute(
+                text("INSERT INTO search_fts (rowid, content) VALUES (:id, :content)"),
+                {"id": document.id, "content": content}
+            )
+        elif self.dialect == "postgresql":
+            self.db.execute(
+                text("UPDATE search_documents SET tsv = to_tsvector('simple', :content) WHERE id = :id"),
+                {"id": document.id, "content": content}
+            )
+
+    # ---------- 查询 ----------
+
+    def search(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        全文检索，按会话聚合结果
+
+        Returns:
+            [
+                {
+                    "session_id": "...",
+                    "name": "...",
+                    "description": "...",
+                    "score": 1.23,                # 越大越相关
+                    "matched_versions": [1, 3]    # 命中的版本号（空列表表示命中会话名称/描述）
+                }
+            ]
+        """
+        tokens = tokenize(query, for_query=True)
+        if not tokens:
+            return []
+
+        # 先取足够多的文档命中，再按会话聚合
+        doc_limit = max(limit * 10, 100)
+        if self.dialect == "sqlite":
+            match = " ".join(
+                f'"{token}"*' if token.isascii() else f'"{token}"'
+                for token in tokens
+            )
+            rows = self.db.execute(
+                text(
+                    "SELECT d.session_id, v.version_number, -bm25(search_fts) AS score "
+                    "FROM search_fts "
+                    "JOIN search_documents d ON d.id = search_fts.rowid "
+                    "JOIN sessions s ON s.id = d.session_id "
+                    "LEFT JOIN versions v ON v.id = d.version_id "
+                    "WHERE search_fts MATCH :match AND s.deleted_at IS NULL "
+                    "ORDER BY bm25(search_fts) LIMIT :limit"
+                ),
+                {"match": match, "limit": doc_limit}
+            ).all()
+        elif self.dialect == "postgresql":
+            tsquery = " & ".join(
+                f"{token}:*" if token.isascii() else token
+                for token in tokens
+            )
+            rows = self.db.execute(
+                text(
+                    "SELECT d.session_id, v.version_number, ts_rank(d.tsv, q) AS score "
+                    "FROM search_documents d "
+                    "CROSS JOIN to_tsquery('simple', :tsquery) q "
+                    "JOIN sessions s ON s.id = d.session_id "
+                    "LEFT JOIN versions v ON v.id = d.version_id "
+                    "WHERE d.tsv @@ q AND s.deleted_at IS NULL "
+                    "ORDER BY score DESC LIMIT :limit"
+                ),
+                {"tsquery": tsquery, "limit": doc_limit}
+            ).all()
+        else:
+            raise RuntimeError(f"不支持的数据库类型: {self.dialect}")
+
+        # 按会话聚合：取最高分，收集命中的版本号
+        hits: Dict[str, Dict[str, Any]] = {}
+        for session_id, version_number, score in rows:
+            hit = hits.setdefault(session_id, {"score": float(score), "matched_versions": []})
+            hit["score"] = max(hit["score"], float(score))
+            if version_number is not None:
+                hit["matched_versions"].append(version_number)
+
+        ranked = sorted(hits.items(), key=lambda item: item[1]["score"], reverse=True)[:limit]
+        if not ranked:
+            return []
+
+        sessions = {
+            s.id: s for s in self.db.query(Session)
+            .filter(Session.id.in_([session_id for session_id, _ in ranked]))
+            .all()
+        }
+        return [
+            {
+                "session_id": session_id,
+                "name": sessions[session_id].name,
+                "description": sessions[session_id].description,
+                "score": hit["score"],
+                "matched_versions": sorted(hit["matched_versions"])
+            }
+            for session_id, hit in ranked
+            if session_id in sessions
+        ]
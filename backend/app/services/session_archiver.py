@@ -0,0 +1,227 @@
+"""
+Session Archiver - 不活跃会话的冷存储归档
+
+归档：把超过阈值未活跃的会话（版本记录 + 原图）打包为
+archive_path/<session_id>.tar.gz（格式与 /export 的 TAR 相同），
+原位置只保留会话行、一张缩略图和 summary（版本数、缩略图、最新 Prompt）。
+全文检索和 Schema 倒排索引保留，归档项目仍可通过 /search 和 /search/similar 找到；
+导出时 SessionExporter 直接从归档文件读取版本，无需先恢复。
+
+恢复：SessionManager.get_session 等读取入口发现会话已归档时，
+自动调用 restore 把版本和图片解包回热存储，调用方无感知。
+恢复在一个事务中完成，任一步失败都会回滚（已放置的图片一并删除），
+会话保持归档状态，下次访问时重试。
+
+并发：进程内用每个会话一把 threading.Lock 互斥；跨进程依赖会话行的
+SELECT ... FOR UPDATE（PostgreSQL 上生效）。SQLite 没有行锁，但写事务串行，
+后到的恢复会因归档文件已被删除而回滚，随后发现会话已恢复并直接返回。
+"""
+import gzip
+import os
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Optional
+from sqlalchemy import delete, exists, update
+from sqlalchemy.orm import Session as SQLSession
+
+from app.config import settings
+from app.models import Session, Version
+from app.services.image_utils import make_thumbnail
+from app.services.schema_index import SchemaIndex
+from app.services.session_transfer import SessionExporter, SessionImporter
+
+
+# 同一会话的归档/恢复互斥（仅限本进程，跨进程见模块说明）
+_session_locks: dict = {}
+_session_locks_guard = threading.Lock()
+
+
+def _session_lock(session_id: str) -> threading.Lock:
+    with _session_locks_guard:
+        return _session_locks.setdefault(session_id, threading.Lock())
+
+
+class SessionArchiver:
+    """会话冷存储归档器"""
+
+    def __init__(self, db: SQLSession):
+        self.db = db
+        self.archive_dir = Path(settings.archive_path)
+        self.storage_path = Path(settings.storage_path)
+
+    def find_inactive(self, days: Optional[int] = None, limit: int = 100) -> List[str]:
+        """
+        查找超过 days 天未更新、且没有新版本的会话
+
+        没有版本的会话无需归档（archive_session 会跳过），这里直接排除，
+        否则它们会一直占据按时间排序的前 limit 个位置，归档无法推进。
+        """
+        days = settings.archive_after_days if days is None else days
+        cutoff = datetime.utcnow() - timedelta(days=days)
+
+        any_version = exists().where(Version.session_id == Session.id)
+        recent_version = exists().where(
+            Version.session_id == Session.id,
+            Version.created_at >= cutoff
+        )
+        rows = (
+            self.db.query(Session.id)
+            .filter(
+                Session.deleted_at.is_(None),
+                Session.archived_at.is_(None),
+                Session.updated_at < cutoff,
+                any_version,
+                ~recent_version
+            )
+            .order_by(Session.updated_at)
+            .limit(limit)
+            .all()
+        )
+        return [session_id for (session_id,) in rows]
+
+    def archive_inactive(self, days: Optional[int] = None, limit: int = 100) -> int:
+        """归档不活跃会话，返回归档数量"""
+        archived = 0
+        for session_id in self.find_inactive(days, limit):
+            try:
+                if self.archive_session(session_id):
+                    archived += 1
+            except Exception as e:
+                self.db.rollback()
+                print(f"⚠️ 归档会话失败 {session_id}: {e}")
+        return archived
+
+    def archive_session(self, session_id: str) -> bool:
+        """归档单个会话（归档文件写完并落盘后才删除热数据）"""
+        with _session_lock(session_id):
+            session = self._lock_row(session_id)
+            if not session or session.deleted_at or session.archived_at:
+                self.db.rollback()
+                return False
+
+            versions = (
+                self.db.query(Version)
+                .filter(Version.session_id == session_id)
+                .order_by(Version.version_number)
+                .all()
+            )
+            if not versions:
+                self.db.rollback()
+                return False
+
+            # 1. 写归档文件（先写临时文件再原子替换）
+            self.archive_dir.mkdir(parents=True, exist_ok=True)
+            archive_file = self.archive_dir / f"{session_id}.tar.gz"
+            tmp_file = archive_file.with_suffix(".tmp")
+            with gzip.open(tmp_file, "wb") as f:
+                for chunk in SessionExporter(self.db).iter_tar([session_id]):
+                    f.write(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, archive_file)
+
+            # 2. 保留最新版本的缩略图
+            latest = versions[-1]
+            thumbnail_path = None
+            thumbnail_url = None
+            if latest.image_path and Path(latest.image_path).is_file():
+                thumbnail = make_thumbnail(
+                    Path(latest.image_path),
+                    self.storage_path / f"{session_id}-thumb{Path(latest.image_path).suffix}",
+                    settings.thumbnail_max_side
+                )
+                thumbnail_path = str(thumbnail)
+                thumbnail_url = f"{settings.public_base_url}/images/{thumbnail.name}"
+
+            # 3. 删除热数据（检索索引保留），写入摘要（保持 updated_at 不变）
+            image_paths = [version.image_path for version in versions]
+            self.db.execute(
+                delete(Version)
+                .where(Version.session_id == session_id)
+                .execution_options(synchronize_session=False)
+            )
+            self.db.execute(
+                update(Session)
+                .where(Session.id == session_id)
+                .values(
+                    archived_at=datetime.utcnow(),
+                    archive_path=str(archive_file),
+                    summary={
+                        "version_count": len(versions),
+                        "thumbnail_url": thumbnail_url,
+                        "thumbnail_path": thumbnail_path,
+                        "latest_prompt": latest.prompt
+                    },
+                    updated_at=Session.updated_at
+                )
+                .execution_options(synchronize_session=False)
+            )
+            self.db.commit()
+            self.db.expire(session)
+
+            # 4. 提交成功后再删除原图
+            for image_path in image_paths:
+                if image_path and image_path != thumbnail_path:
+                    Path(image_path).unlink(missing_ok=True)
+
+            print(f"🧊 已归档会话 {session_id}（{len(versions)} 个版本）")
+            return True
+
+    def restore(self, session: Session) -> Session:
+        """把已归档会话恢复到热存储（单个事务，失败时回滚并保持归档状态）"""
+        session_id = session.id
+        with _session_lock(session_id):
+            locked = self._lock_row(session_id)
+            if locked is None or not locked.archived_at:
+                # 其他请求已完成恢复
+                self.db.commit()
+                return session
+
+            archive_file = Path(locked.archive_path)
+            thumbnail_path = (locked.summary or {}).get("thumbnail_path")
+            importer = SessionImporter(self.db, merge_existing=True, commit=False)
+            try:
+                # 倒排索引在归档期间保留，导入时会重新写入，先删除旧记录
+                SchemaIndex(self.db).remove_session(session_id)
+                with gzip.open(archive_file, "rb") as f:
+                    importer.import_archive(f)
+                self.db.execute(
+                    update(Session)
+                    .where(Session.id == session_id)
+                    .values(
+                        archived_at=None,
+                        archive_path=None,
+                        summary=None,
+                        updated_at=Session.updated_at
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+                self.db.commit()
+            except Exception:
+                importer.discard()
+                # 其他进程可能已完成恢复并删除了归档文件
+                archived = self.db.query(Session.archived_at).filter(Session.id == session_id).scalar()
+                self.db.commit()
+                if archived:
+                    raise
+                self.db.refresh(session)
+                return session
+            self.db.refresh(session)
+
+            archive_file.unlink(missing_ok=True)
+            if thumbnail_path:
+                Path(thumbnail_path).unlink(missing_ok=True)
+
+            print(f"♨️  已恢复归档会话 {session.id}")
+            return session
+
+    def _lock_row(self, session_id: str) -> Optional[Session]:
+        """读取并锁定会话行（PostgreSQL 上为 SELECT ... FOR UPDATE）"""
+        return (
+            self.db.query(Session)
+            .filter(Session.id == str(session_id))
+            .populate_existing()
+            .with_for_update()
+            .first()
+        )
@@ -1,12 +1,18 @@
 """
 Session Manager - 会话和版本管理服务
 """
+import asyncio
+from datetime import datetime
 from typing import List, Optional, Dict, Any
 from uuid import UUID, uuid4
 from sqlalchemy.orm import Session as SQLSession
-from sqlalchemy import desc
-from pathlib import Path
+from sqlalchemy import desc, update
+from app.core.metrics import RequestTrace
 from app.models import Session, Version
+from app.services.search_index import SearchIndex
+from app.services.schema_index import SchemaIndex
+from app.services.session_archiver import SessionArchiver
+from app.services.telemetry import TelemetryStore
 
 
 class SessionManager:
@@ -14,6 +20,9 @@ class SessionManager:
 
     def __init__(self, db: SQLSession):
         self.db = db
+        self.search_index = SearchIndex(db)
+        self.schema_index = SchemaIndex(db)
+        self.telemetry = TelemetryStore(db)
 
     def create_session(self) -> Session:
         """创建新会话"""
@@ -24,8 +33,42 @@ class SessionManager:
         return session
 
     def get_session(self, session_id: str) -> Optional[Session]:
-        """获取会话（支持字符串类型的 ID）"""
-        return self.db.query(Session).filter(Session.id == str(session_id)).first()
+        """
+        获取会话（支持字符串类型的 ID，已删除的会话视为不存在）
+
+        已归档到冷存储的会话会在这里自动恢复
+        """
+        session = (
+            self.db.query(Session)
+            .filter(Session.id == str(session_id), Session.deleted_at.is_(None))
+            .first()
+        )
+        if session and session.archived_at:
+            session = SessionArchiver(self.db).restore(session)
+        return session
+
+    def _is_archived(self, session_id: str) -> bool:
+        archived = (
+            self.db.query(Session.archived_at)
+            .filter(Session.id == str(session_id), Session.deleted_at.is_(None))
+            .scalar()
+        )
+        return archived is not None
+
+    def _ensure_hot(self, session_id: str):
+        """版本读取前确认会话不在冷存储中（已归档则先恢复）"""
+        if self._is_archived(session_id):
+            self.get_session(session_id)
+
+    async def restore_if_archived(self, session_id: str):
+        """
+        已归档的会话在线程池中恢复
+
+        恢复要解压归档并批量写库，async 路由在读取会话 / 版本前先调用，
+        之后的同步读取不会再在事件循环中触发恢复
+        """
+        if self._is_archived(session_id):
+            await asyncio.to_thread(self._ensure_hot, session_id)
 
     def create_version(
         self,
@@ -37,7 +80,11 @@ class SessionManager:
         user_input: Optional[str] = None,
         user_feedback: Optional[str] = None,
         diff: Optional[Dict[str, Any]] = None,
-        parent_version_id: Optional[str] = None
+        parent_version_id: Optional[str] = None,
+        image_status: str = "final",
+        *,
+        kind: str,
+        trace: Optional[RequestTrace] = None
     ) -> Version:
         """
         创建新版本
@@ -52,6 +99,9 @@ class SessionManager:
             user_feedback: 用户反馈（迭代优化）
             diff: Prompt Diff（迭代优化）
             parent_version_id: 父版本 ID
+            image_status: 图片状态（渐进式生成时先以 draft 入库）
+            kind: 版本来源（generate / feedback / edit / rollback），写入版本遥测
+            trace: 归属到该版本的 trace（默认当前请求；采用预览 / 投机结果时由调用方合并传入）
 
         Returns:
             Version 对象
@@ -77,10 +127,20 @@ class SessionManager:
             prompt=prompt,
             diff=diff,
             image_url=image_url,
-            image_path=image_path
+            image_path=image_path,
+            image_status=image_status
         )
 
         self.db.add(version)
+        self.db.flush()
+
+        # 增量维护全文索引和 Schema 倒排索引（与版本写入同一事务）
+        self.search_index.index_version(version)
+        self.schema_index.index_version(version)
+
+        # 本次请求的生成遥测（耗时、token、重试、回退）
+        self.telemetry.record_version(version, kind, trace)
+
         self.db.commit()
         self.db.refresh(version)
 
@@ -91,26 +151,57 @@ class SessionManager:
 
         return version
 
+    def update_version_image(
+        self,
+        version_id: str,
+        image_url: Optional[str] = None,
+        image_path: Optional[str] = None,
+        image_status: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        更新版本的图片（渐进式生成中用正式图替换草图）
+
+        Returns:
+            替换前的 image_path（版本不存在时返回 None）
+        """
+        version = self.db.get(Version, str(version_id))
+        if not version:
+            return None
+        previous_path = version.image_path
+        if image_url is not None:
+            version.image_url = image_url
+        if image_path is not None:
+            version.image_path = image_path
+        if image_status is not None:
+            version.image_status = image_status
+        self.db.commit()
+        return previous_path
+
     def get_version(
         self,
         session_id: str,
         version_number: int
     ) -> Optional[Version]:
-        """获取指定版本"""
+        """获取指定版本（已删除会话的版本视为不存在）"""
+        self._ensure_hot(session_id)
         return (
             self.db.query(Version)
+            .join(Session, Session.id == Version.session_id)
             .filter(
                 Version.session_id == str(session_id),
-                Version.version_number == version_number
+                Version.version_number == version_number,
+                Session.deleted_at.is_(None)
             )
             .first()
         )
 
     def get_all_versions(self, session_id: str) -> List[Version]:
-        """获取会话的所有版本（按版本号排序）"""
+        """获取会话的所有版本（按版本号排序，已删除会话返回空列表）"""
+        self._ensure_hot(session_id)
         return (
             self.db.query(Version)
-            .filter(Version.session_id == str(session_id))
+            .join(Session, Session.id == Version.session_id)
+            .filter(Version.session_id == str(session_id), Session.deleted_at.is_(None))
             .order_by(Version.version_number)
             .all()
         )
@@ -141,6 +232,7 @@ class SessionManager:
                 "user_input": version.user_input,
                 "user_feedback": version.user_feedback,
                 "image_url": version.image_url,
+                "image_status": version.image_status,
                 "created_at": version.created_at.isoformat(),
                 "children": []
             }
@@ -167,6 +259,7 @@ class SessionManager:
         """获取所有项目列表（按更新时间倒序）"""
         return (
             self.db.query(Session)
+            .filter(Session.deleted_at.is_(None))
             .order_by(desc(Session.updated_at))
             .offset(skip)
             .limit(limit)
@@ -175,7 +268,7 @@ class SessionManager:
 
     def count_sessions(self) -> int:
         """统计项目总数"""
-        return self.db.query(Session).count()
+        return self.db.query(Session).filter(Session.deleted_at.is_(None)).count()
 
     def update_session(
         self,
@@ -193,28 +286,46 @@ class SessionManager:
         if description is not None:
             session.description = description
 
+        self.search_index.index_session(session)
+
         self.db.commit()
         self.db.refresh(session)
         return session
 
     def delete_session(self, session_id: str) -> bool:
-        """删除项目（级联删除版本和图片文件）"""
-        session = self.get_session(session_id)
-        if not session:
-            return False
-
-        # 删除所有关联图片文件
-        for version in session.versions:
-            try:
-                if version.image_path:
-                    image_file = Path(version.image_path)
-                    if image_file.exists():
-                        image_file.unlink()
-            except Exception as e:
-                print(f"删除图片失败: {e}")
-
-        # 删除会话（级联删除版本记录）
-        self.db.delete(session)
-        self.db.commit()
-        return True
+        """
+        删除项目（软删除）
+
+        只标记 deleted_at 并立即返回，图片文件和版本记录
+        由 SessionPurger 在后台分批清理。
+        """
+        return bool(self.delete_sessions([session_id]))
+
+    def delete_sessions(self, session_ids: List[str]) -> List[str]:
+        """
+        批量删除项目（软删除）
+
+        Returns:
+            实际被标记删除的会话 ID 列表（不存在或已删除的会被忽略）
+        """
+        ids = list(dict.fromkeys(str(session_id) for session_id in session_ids))
+        if not ids:
+            return []
+
+        existing = [
+            session_id
+            for (session_id,) in self.db.query(Session.id)
+            .filter(Session.id.in_(ids), Session.deleted_at.is_(None))
+            .all()
+        ]
+        if not existing:
+            return []
 
+        self.db.execute(
+            update(Session)
+            .where(Session.id.in_(existing))
+            .values(deleted_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        self.db.commit()
+        return existing
@@ -0,0 +1,140 @@
+"""
+Session Purger - 后台清理已软删除的会话
+
+删除接口只负责打上 deleted_at 标记并立即返回，
+图片文件和版本记录由本模块在后台分批清理。
+"""
+from pathlib import Path
+from typing import Iterable, List, Optional
+from sqlalchemy.orm import Session as SQLSession
+from sqlalchemy import delete, desc
+
+from app.config import settings
+from app.models import Session, Version
+from app.services.search_index import SearchIndex
+from app.services.schema_index import SchemaIndex
+
+
+class SessionPurger:
+    """已删除会话清理器（分批删除图片文件和版本记录）"""
+
+    def __init__(self, db: SQLSession, batch_size: Optional[int] = None):
+        self.db = db
+        self.batch_size = batch_size or settings.purge_batch_size
+
+    def purge_session(self, session_id: str) -> int:
+        """
+        清理单个已软删除的会话
+
+        每批删除 batch_size 个版本（先删图片文件，再删记录并提交），
+        版本全部删除后再删除会话本身。
+
+        Returns:
+            删除的版本数量
+        """
+        session = self.db.get(Session, str(session_id))
+        if not session or session.deleted_at is None:
+            # 不存在或已被恢复，不做处理
+            return 0
+
+        removed = 0
+        while True:
+            # 按版本号倒序删除，尽量先删子版本
+            rows = (
+                self.db.query(Version.id, Version.image_path)
+                .filter(Version.session_id == session.id)
+                .order_by(desc(Version.version_number))
+                .limit(self.batch_size)
+                .all()
+            )
+            if not rows:
+                break
+
+            for _, image_path in rows:
+                self._unlink(image_path)
+
+            self.db.execute(
+                delete(Version)
+                .where(Version.id.in_([version_id for version_id, _ in rows]))
+                .execution_options(synchronize_session=False)
+            )
+            self.db.commit()
+            removed += len(rows)
+
+        # 已归档会话还需删除归档文件和缩略图
+        if session.archive_path:
+            self._unlink(session.archive_path)
+        if session.summary:
+            self._unlink(session.summary.get("thumbnail_path"))
+
+        SearchIndex(self.db).remove_session(session.id)
+        SchemaIndex(self.db).remove_session(session.id)
+        self.db.execute(delete(Session).where(Session.id == session.id))
+        self.db.commit()
+        return removed
+
+    def purge_sessions(self, session_ids: Iterable[str]) -> int:
+        """清理多个会话，单个失败不影响其余会话"""
+        removed = 0
+        for session_id in session_ids:
+            try:
+                removed += self.purge_session(session_id)
+            except Exception as e:
+                self.db.rollback()
+                print(f"⚠️ 清理会话失败 {session_id}: {e}")
+        return removed
+
+    def pending_session_ids(self) -> List[str]:
+        """所有已软删除、等待清理的会话 ID"""
+        rows = (
+            self.db.query(Session.id)
+            .filter(Session.deleted_at.isnot(None))
+            .all()
+        )
+        return [session_id for (session_id,) in rows]
+
+    def purge_pending(self) -> int:
+        """清理所有等待中的会话（用于启动时补偿上次未完成的清理）"""
+        return self.purge_sessions(self.pending_session_ids())
+
+    @staticmethod
+    def _unlink(image_path: Optional[str]):
+        """删除图片文件（失败只记录日志）"""
+        if not image_path:
+            return
+        try:
+            Path(image_path).unlink(missing_ok=True)
+        except Exception as e:
+            print(f"删除图片失败: {e}")
+
+
+def purge_sessions_in_background(session_ids: List[str]):
+    """
+    后台任务入口（使用独立的数据库会话）
+
+    用法：
+        background_tasks.add_task(purge_sessions_in_background, [session_id])
+    """
+    from app.core.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        removed = SessionPurger(db).purge_sessions(session_ids)
+        print(f"🗑️  已清理 {len(session_ids)} 个会话，共 {removed} 个版本")
+    finally:
+        db.close()
+
+
+def purge_pending_in_background():
+    """后台清理所有等待中的会话"""
+    from app.core.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        purger = SessionPurger(db)
+        pending = purger.pending_session_ids()
+        if pending:
+            removed = purger.purge_sessions(pending)
+            print(f"🗑️  已补偿清理 {len(pending)} 个会话，共 {removed} 个版本")
+    finally:
+        db.close()
@@ -0,0 +1,508 @@
+"""
+Session Transfer - 会话导出与导入
+
+导出格式：
+- NDJSON：每行一条记录，先输出全部 session，再按会话和版本号输出 version
+    {"type": "session", "id": "...", "name": "...", ...}
+    {"type": "version", "id": "...", "session_id": "...", "schema": {...}, "image_file": "images/<sha256>.png", ...}
+- TAR（流式）：按批次交替写入图片和 NDJSON 分片
+    images/<sha256>.png          # 相同内容的图片只写入一次
+    records-000001.ndjson        # 每个分片最多 batch_size 条记录
+    ...
+
+数据库读取使用 yield_per，导入按批次批量插入，
+整个过程中内存只保留一个批次的数据。
+已归档到冷存储的会话（见 session_archiver.py）从归档文件中流式读取版本和图片，导出前无需恢复。
+"""
+import hashlib
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+from uuid import uuid4
+from sqlalchemy import insert
+from sqlalchemy.orm import Session as SQLSession
+
+from app.config import settings
+from app.models import Session, Version
+from app.services.search_index import SearchIndex
+from app.services.schema_index import SchemaIndex
+
+
+def file_sha256(path: Path) -> str:
+    """计算文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def _parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """tarfile 流式写入的缓冲区，每写完一个成员就取出已生成的字节"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_archive(archive_path: str) -> Iterator[Tuple[str, Any, Optional[BinaryIO]]]:
+    """
+    流式读取一个会话归档文件
+
+    Yields:
+        ("image", TarInfo, fileobj)：图片成员（fileobj 需在取下一项之前读完）
+        ("version", record, None)：版本记录
+    """
+    with tarfile.open(archive_path, mode="r|*") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            if member.name.startswith("images/"):
+                yield "image", member, tar.extractfile(member)
+            elif member.name.endswith(".ndjson"):
+                for line in tar.extractfile(member):
+                    line = line.strip()
+                    if line:
+                        record = json.loads(line)
+                        if record.get("type") == "version":
+                            yield "version", record, None
+
+
+class SessionExporter:
+    """会话导出器"""
+
+    def __init__(self, db: SQLSession, batch_size: Optional[int] = None):
+        self.db = db
+        self.batch_size = batch_size or settings.transfer_batch_size
+
+    def archived_sessions(self, session_ids: Optional[List[str]] = None) -> List[Tuple[str, str]]:
+        """已归档的未删除会话 [(session_id, archive_path)]（归档文件缺失的会跳过并告警）"""
+        query = self.db.query(Session.id, Session.archive_path).filter(
+            Session.deleted_at.is_(None),
+            Session.archived_at.isnot(None)
+        )
+        if session_ids:
+            query = query.filter(Session.id.in_(session_ids))
+        archived = []
+        for session_id, archive_path in query.order_by(Session.id).all():
+            if archive_path and Path(archive_path).is_file():
+                archived.append((session_id, archive_path))
+            else:
+                print(f"⚠️ 会话 {session_id} 的归档文件不存在，跳过其版本: {archive_path}")
+        return archived
+
+    def iter_archived_versions(self, session_ids: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+        """已归档会话的版本记录（image_file 指向归档包内的图片，不在本导出中）"""
+        for _, archive_path in self.archived_sessions(session_ids):
+            for kind, record, _ in iter_archive(archive_path):
+                if kind == "version":
+                    yield record
+
+    def archived_versions(self, session_ids: Optional[List[str]] = None) -> Iterator[Version]:
+        """已归档会话的版本（未加入数据库会话的临时 Version 对象，供重建检索索引使用）"""
+        for record in self.iter_archived_versions(session_ids):
+            yield Version(
+                id=record["id"],
+                session_id=record["session_id"],
+                version_number=record["version_number"],
+                user_input=record.get("user_input"),
+                user_feedback=record.get("user_feedback"),
+                schema=record.get("schema") or {},
+                prompt=record.get("prompt")
+            )
+
+    def iter_records(
+        self,
+        session_ids: Optional[List[str]] = None,
+        with_images: bool = False,
+        include_archived: bool = True
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        逐条产出导出记录
+
+        Args:
+            session_ids: 只导出指定会话（默认导出全部未删除会话）
+            with_images: 是否计算图片哈希并在记录中附带 image_file / _image_source
+            include_archived: 是否包含已归档会话的版本（从归档文件读取，不附带图片）
+        """
+        sessions = self.db.query(Session).filter(Session.deleted_at.is_(None))
+        if session_ids:
+            sessions = sessions.filter(Session.id.in_(session_ids))
+
+        for session in sessions.order_by(Session.id).yield_per(self.batch_size):
+            yield {
+                "type": "session",
+                "id": session.id,
+                "name": session.name,
+                "description": session.description,
+                "created_at": _isoformat(session.created_at),
+                "updated_at": _isoformat(session.updated_at)
+            }
+
+        versions = (
+            self.db.query(Version)
+            .join(Session, Session.id == Version.session_id)
+            .filter(Session.deleted_at.is_(None))
+        )
+        if session_ids:
+            versions = versions.filter(Version.session_id.in_(session_ids))
+
+        for version in versions.order_by(Version.session_id, Version.version_number).yield_per(self.batch_size):
+            record = {
+                "type": "version",
+                "id": version.id,
+                "session_id": version.session_id,
+                "version_number": version.version_number,
+                "parent_version_id": version.parent_version_id,
+                "user_input": version.user_input,
+                "user_feedback": version.user_feedback,
+                "schema": version.schema,
+                "prompt": version.prompt,
+                "diff": version.diff,
+                "image_name": Path(version.image_path).name if version.image_path else None,
+                "image_file": None,
+                "image_status": version.image_status,
+                "created_at": _isoformat(version.created_at)
+            }
+            if with_images and version.image_path:
+                image_path = Path(version.image_path)
+                if image_path.is_file():
+                    record["image_file"] = f"images/{file_sha256(image_path)}{image_path.suffix}"
+                    record["_image_source"] = str(image_path)
+            yield record
+
+        if include_archived:
+            for record in self.iter_archived_versions(session_ids):
+                yield {**record, "image_file": None}
+
+    def iter_ndjson(self, session_ids: Optional[List[str]] = None) -> Iterator[bytes]:
+        """流式输出 NDJSON（不含图片）"""
+        for record in self.iter_records(session_ids):
+            yield (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+    def iter_tar(self, session_ids: Optional[List[str]] = None) -> Iterator[bytes]:
+        """流式输出包含图片的 TAR 包（图片按内容哈希去重）"""
+        buffer = _ChunkBuffer()
+        tar = tarfile.open(fileobj=buffer, mode="w|")
+        written_images = set()
+        lines: List[bytes] = []
+        chunk_index = 0
+
+        def flush_records():
+            nonlocal chunk_index, lines
+            chunk_index += 1
+            data = b"".join(lines)
+            info = tarfile.TarInfo(f"records-{chunk_index:06d}.ndjson")
+            info.size = len(data)
+            info.mtime = int(time.time())
+            tar.addfile(info, io.BytesIO(data))
+            lines = []
+
+        for record in self.iter_records(session_ids, with_images=True, include_archived=False):
+            source = record.pop("_image_source", None)
+            if source and record["image_file"] not in written_images:
+                tar.add(source, arcname=record["image_file"])
+                written_images.add(record["image_file"])
+                yield buffer.drain()
+
+            lines.append((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+            if len(lines) >= self.batch_size:
+                flush_records()
+                yield buffer.drain()
+
+        # 已归档会话：直接转存归档包中的图片和版本记录（归档包内图片同样按内容哈希命名）
+        for _, archive_path in self.archived_sessions(session_ids):
+            for kind, item, fileobj in iter_archive(archive_path):
+                if kind == "image":
+                    if item.name not in written_images:
+                        tar.addfile(item, fileobj)
+                        written_images.add(item.name)
+                        yield buffer.drain()
+                    continue
+                lines.append((json.dumps(item, ensure_ascii=False) + "\n").encode("utf-8"))
+                if len(lines) >= self.batch_size:
+                    flush_records()
+                    yield buffer.drain()
+
+        if lines:
+            flush_records()
+        tar.close()
+        yield buffer.drain()
+
+
+class SessionImporter:
+    """
+    会话导入器
+
+    - 已存在的会话（按 ID）整体跳过，重复导入是幂等的
+    - 所属会话不存在的版本跳过（计入 versions_orphaned），不会写入孤立版本
+    - 会话和版本按批次批量插入，同时维护检索索引；整个导入在同一个事务中，
+      任一批次失败时全部回滚，并删除本次新放置的图片
+    - 图片按内容哈希暂存一次，再硬链接（不支持时复制）到各版本的文件名；
+      同名文件内容不同时改用带哈希后缀的文件名，不覆盖已有图片
+    """
+
+    def __init__(
+        self,
+        db: SQLSession,
+        batch_size: Optional[int] = None,
+        merge_existing: bool = False,
+        commit: bool = True
+    ):
+        """
+        Args:
+            merge_existing: 会话已存在时仍导入其版本（用于冷存储归档恢复），已存在的版本跳过
+            commit: 导入完成后是否提交；为 False 时由调用方提交，
+                调用方后续失败时应调用 discard() 回滚
+        """
+        self.db = db
+        self.batch_size = batch_size or settings.transfer_batch_size
+        self.merge_existing = merge_existing
+        self.commit = commit
+        self.storage_path = Path(settings.storage_path)
+        self.storage_path.mkdir(parents=True, exist_ok=True)
+        self.search_index = SearchIndex(db)
+        self.schema_index = SchemaIndex(db)
+
+        self.stats = {
+            "sessions_imported": 0,
+            "sessions_skipped": 0,
+            "versions_imported": 0,
+            "versions_orphaned": 0,
+            "images_received": 0,
+            "images_skipped": 0
+        }
+        self._skipped_sessions = set()
+        self._session_batch: List[Dict[str, Any]] = []
+        self._version_batch: List[Dict[str, Any]] = []
+        self._staging: Optional[Path] = None
+        # 本次导入新建的图片文件（回滚时删除）
+        self._created_files: List[Path] = []
+
+    def import_archive(self, fileobj: BinaryIO) -> Dict[str, int]:
+        """从 TAR 流导入（支持 gzip 等压缩格式）"""
+        self._staging = Path(tempfile.mkdtemp(prefix=".import-", dir=self.storage_path))
+        try:
+            with tarfile.open(fileobj=fileobj, mode="r|*") as tar:
+                for member in tar:
+                    if not member.isfile():
+                        continue
+                    extracted = tar.extractfile(member)
+                    if member.name.startswith("images/"):
+                        self._stage_image(member.name, extracted)
+                    elif member.name.endswith(".ndjson"):
+                        self._import_lines(line.decode("utf-8") for line in extracted)
+            self._finish()
+        except Exception:
+            self.discard()
+            raise
+        finally:
+            shutil.rmtree(self._staging, ignore_errors=True)
+            self._staging = None
+        return self.stats
+
+    def import_ndjson(self, lines: Iterable[str]) -> Dict[str, int]:
+        """从 NDJSON 行导入（不含图片）"""
+        try:
+            self._import_lines(lines)
+            self._finish()
+        except Exception:
+            self.discard()
+            raise
+        return self.stats
+
+    def discard(self):
+        """回滚本次导入：回滚事务并删除新放置的图片"""
+        self.db.rollback()
+        for path in self._created_files:
+            path.unlink(missing_ok=True)
+        self._created_files = []
+
+    def _finish(self):
+        self._flush()
+        if self.commit:
+            self.db.commit()
+
+    def _import_lines(self, lines: Iterable[str]):
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get("type") == "session":
+                self._session_batch.append(record)
+                if len(self._session_batch) >= self.batch_size:
+                    self._flush_sessions()
+            elif record.get("type") == "version":
+                # 版本写入前先确保所属会话已落库
+                if self._session_batch:
+                    self._flush_sessions()
+                self._version_batch.append(record)
+                if len(self._version_batch) >= self.batch_size:
+                    self._flush_versions()
+
+    def _flush(self):
+        self._flush_sessions()
+        self._flush_versions()
+
+    def _flush_sessions(self):
+        if not self._session_batch:
+            return
+        batch, self._session_batch = self._session_batch, []
+
+        existing = {
+            session_id for (session_id,) in self.db.query(Session.id)
+            .filter(Session.id.in_([record["id"] for record in batch]))
+            .all()
+        }
+        rows = []
+        for record in batch:
+            if record["id"] in existing and self.merge_existing:
+                continue
+            if record["id"] in existing:
+                self._skipped_sessions.add(record["id"])
+                self.stats["sessions_skipped"] += 1
+                continue
+            rows.append({
+                "id": record["id"],
+                "name": record.get("name"),
+                "description": record.get("description"),
+                "created_at": _parse_datetime(record.get("created_at")) or datetime.utcnow(),
+                "updated_at": _parse_datetime(record.get("updated_at")) or datetime.utcnow()
+            })
+
+        if rows:
+            self.db.execute(insert(Session), rows)
+            for row in rows:
+                self.search_index.index_session(Session(**row))
+            self.stats["sessions_imported"] += len(rows)
+
+    def _flush_versions(self):
+        if not self._version_batch:
+            return
+        batch, self._version_batch = self._version_batch, []
+
+        # 所属会话必须已存在（本次导入的会话已在同一事务中写入）
+        session_ids = {record["session_id"] for record in batch}
+        known_sessions = {
+            session_id for (session_id,) in self.db.query(Session.id)
+            .filter(Session.id.in_(session_ids))
+            .all()
+        }
+        existing_versions = set()
+        if self.merge_existing:
+            existing_versions = {
+                version_id for (version_id,) in self.db.query(Version.id)
+                .filter(Version.id.in_([record["id"] for record in batch]))
+                .all()
+            }
+
+        rows = []
+        for record in batch:
+            if record["session_id"] in self._skipped_sessions or record["id"] in existing_versions:
+                continue
+            if record["session_id"] not in known_sessions:
+                self.stats["versions_orphaned"] += 1
+                continue
+            image_path, image_url = self._place_image(record)
+            rows.append({
+                "id": record["id"],
+                "session_id": record["session_id"],
+                "version_number": record["version_number"],
+                "parent_version_id": record.get("parent_version_id"),
+                "user_input": record.get("user_input"),
+                "user_feedback": record.get("user_feedback"),
+                "schema": record["schema"],
+                "prompt": record["prompt"],
+                "diff": record.get("diff"),
+                "image_url": image_url,
+                "image_path": image_path,
+                "image_status": record.get("image_status") or "final",
+                "created_at": _parse_datetime(record.get("created_at")) or datetime.utcnow()
+            })
+
+        if rows:
+            self.db.execute(insert(Version), rows)
+            versions = [Version(**row) for row in rows]
+            for version in versions:
+                self.search_index.index_version(version)
+            self.schema_index.index_versions(versions)
+            self.stats["versions_imported"] += len(rows)
+
+    def _stage_image(self, name: str, fileobj: BinaryIO):
+        """按哈希暂存图片（同一哈希只写一次）"""
+        staged = self._staging / Path(name).name
+        if staged.exists():
+            return
+        with open(staged, "wb") as f:
+            shutil.copyfileobj(fileobj, f)
+        self.stats["images_received"] += 1
+
+    def _place_image(self, record: Dict[str, Any]):
+        """把暂存图片放到版本对应的文件名，返回 (image_path, image_url)"""
+        # 只取文件名部分，防止导入数据中的路径穿越
+        filename = Path(record.get("image_name") or f"{record['session_id']}-v{record['version_number']}.png").name
+        target = self.storage_path / filename
+        image_url = f"{settings.public_base_url}/images/{filename}"
+
+        staged = self._staging / Path(record["image_file"]).name if self._staging and record.get("image_file") else None
+        if staged is None or not staged.exists():
+            return str(target), image_url
+
+        # 暂存文件名即内容哈希；目标已存在且内容相同时直接复用
+        digest = staged.stem
+        if target.exists():
+            if file_sha256(target) == digest:
+                self.stats["images_skipped"] += 1
+                return str(target), image_url
+            # 同名文件内容不同（属于其他会话）：不覆盖，改用带哈希后缀的文件名，
+            # 回滚时只需删除新文件
+            target = self._alternate_target(target, digest)
+            image_url = f"{settings.public_base_url}/images/{target.name}"
+            if target.exists():
+                self.stats["images_skipped"] += 1
+                return str(target), image_url
+
+        # 相同内容的图片共享同一份数据（硬链接），文件系统不支持时退化为复制
+        tmp_target = target.with_name(f".{uuid4().hex}{target.suffix}")
+        try:
+            os.link(staged, tmp_target)
+        except OSError:
+            shutil.copyfile(staged, tmp_target)
+        os.replace(tmp_target, target)
+        self._created_files.append(target)
+        return str(target), image_url
+
+    @staticmethod
+    def _alternate_target(target: Path, digest: str) -> Path:
+        """同名文件已被占用时的新文件名（已存在时内容必须相同，否则使用随机文件名）"""
+        alternate = target.with_name(f"{target.stem}-{digest[:12]}{target.suffix}")
+        if alternate.exists() and file_sha256(alternate) != digest:
+            alternate = target.with_name(f"{target.stem}-{uuid4().hex[:12]}{target.suffix}")
+        return alternate
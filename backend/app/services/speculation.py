@@ -0,0 +1,254 @@
+"""
+Speculation - 预览后的投机图片生成
+
+大多数用户在 /preview 之后不修改 Schema 直接确认生成。开启投机模式后，
+/preview 返回 Schema 的同时在后台开始生成图片，并返回 preview_token：
+- /generate 携带相同 token 且 Schema / Prompt 未修改：直接采用后台任务的结果
+  （任务仍在进行时等待其完成）
+- Schema 或 Prompt 被修改：取消后台任务，按正常流程生成
+- 超过 SPECULATIVE_TTL_SECONDS 未被采用：取消任务并删除图片
+  （sweep_periodically 每 SPECULATIVE_SWEEP_INTERVAL_SECONDS 清理一次，不依赖后续请求触发）
+
+取消只能停止事件循环中的协程：已经在线程中发出的 Seedream 请求会继续执行完
+（费用照常产生），结果被丢弃。线程结束后才写出的图片没有任务认领，
+由 sweep 按文件名删除超过 TTL 的 spec-* 图片。
+
+花费控制：同时进行的投机任务不超过 SPECULATIVE_MAX_INFLIGHT；最近的采用率
+低于 SPECULATIVE_MIN_ADOPTION_RATE 时暂停投机，只保留少量探测请求。
+"""
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+from uuid import uuid4
+
+from app.config import settings
+from app.core.metrics import RequestTrace, isolated_trace
+from app.services.cache import TTLCache
+
+
+# 采用率统计窗口和最少样本数
+_OUTCOME_WINDOW = 50
+_MIN_SAMPLES = 20
+# 采用率过低时仍放行的探测比例
+_PROBE_RATE = 0.1
+
+
+def schema_fingerprint(schema: Dict[str, Any], prompt: str) -> str:
+    """Schema + Prompt 的内容指纹（键顺序无关）"""
+    payload = json.dumps({"schema": schema, "prompt": prompt}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SpeculativeJob:
+    """一次投机生成任务"""
+
+    __slots__ = ("token", "fingerprint", "task", "trace")
+
+    def __init__(self, token: str, fingerprint: str, task: "asyncio.Task", trace: RequestTrace):
+        self.token = token
+        self.fingerprint = fingerprint
+        self.task = task
+        # 预览阶段和后台图片生成的耗时，采用时计入 /generate 创建的版本
+        self.trace = trace
+
+    def discard(self):
+        """取消任务；已完成的任务删除其生成的图片"""
+        if not self.task.done():
+            self.task.cancel()
+            # 取消前已经完成的任务仍会产出结果，结束时再删除图片
+            self.task.add_done_callback(lambda _: self._remove_image())
+            return
+        self._remove_image()
+
+    def _remove_image(self):
+        if not self.task.cancelled() and self.task.exception() is None:
+            Path(self.task.result()["image_path"]).unlink(missing_ok=True)
+
+
+class SpeculationManager:
+    """投机任务管理（进程内单例）"""
+
+    def __init__(
+        self,
+        max_inflight: Optional[int] = None,
+        ttl: Optional[float] = None,
+        min_adoption_rate: Optional[float] = None
+    ):
+        self.max_inflight = settings.speculative_max_inflight if max_inflight is None else max_inflight
+        self.min_adoption_rate = (
+            settings.speculative_min_adoption_rate if min_adoption_rate is None else min_adoption_rate
+        )
+        ttl = settings.speculative_ttl_seconds if ttl is None else ttl
+        self.ttl = ttl
+        self._jobs = TTLCache(maxsize=max(self.max_inflight * 4, 16), ttl=ttl, on_evict=self._on_expire)
+        self._lock = threading.Lock()
+        self._outcomes: deque = deque(maxlen=_OUTCOME_WINDOW)
+        self._counters = {
+            "started": 0,
+            "adopted": 0,
+            "cancelled": 0,
+            "expired": 0,
+            "failed": 0,
+            "skipped": 0
+        }
+
+    # ---------- 统计 ----------
+
+    def _count(self, name: str, outcome: Optional[bool] = None):
+        with self._lock:
+            self._counters[name] += 1
+            if outcome is not None:
+                self._outcomes.append(outcome)
+
+    def _recent_adoption_rate(self) -> Optional[float]:
+        with self._lock:
+            if len(self._outcomes) < _MIN_SAMPLES:
+                return None
+            return sum(self._outcomes) / len(self._outcomes)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        resolved = counters["adopted"] + counters["cancelled"] + counters["expired"]
+        counters["inflight"] = self.inflight()
+        counters["adoption_rate"] = round(counters["adopted"] / resolved, 4) if resolved else 0.0
+        recent = self._recent_adoption_rate()
+        counters["recent_adoption_rate"] = round(recent, 4) if recent is not None else None
+        return counters
+
+    def inflight(self) -> int:
+        return sum(1 for job in self._jobs.values() if not job.task.done())
+
+    # ---------- 生命周期 ----------
+
+    def _on_expire(self, token: str, job: SpeculativeJob):
+        job.discard()
+        self._count("expired", False)
+        print(f"⌛ 投机生成未被采用，已丢弃（{token}）")
+
+    def sweep(self, storage_path: Optional[Path] = None) -> int:
+        """
+        清理过期任务和没有任务认领的投机图片
+
+        Returns:
+            删除的遗留图片数
+        """
+        self._jobs.purge()
+        live = {job.token for job in self._jobs.values()}
+        storage_path = Path(settings.storage_path) if storage_path is None else storage_path
+        cutoff = time.time() - self.ttl
+        removed = 0
+        for path in storage_path.glob("spec-*"):
+            token = path.name[len("spec-"):].split("-", 1)[0]
+            if token in live:
+                continue
+            try:
+                # 未超过 TTL 的文件可能正在被 /generate 采用（任务已出队、图片尚未移动）
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        if removed:
+            print(f"🧹 已删除 {removed} 张遗留的投机生成图片")
+        return removed
+
+    def start(
+        self,
+        image_adapter,
+        schema: Dict[str, Any],
+        prompt: str,
+        trace: Optional[RequestTrace] = None
+    ) -> Optional[str]:
+        """
+        开始投机生成（需在事件循环中调用）
+
+        Args:
+            trace: 预览阶段的 trace，后台图片生成的耗时也记录在其中
+
+        Returns:
+            preview_token；超出花费限制时返回 None
+        """
+        self._jobs.purge()
+        if self.inflight() >= self.max_inflight:
+            self._count("skipped")
+            return None
+        recent = self._recent_adoption_rate()
+        if recent is not None and recent < self.min_adoption_rate and random.random() >= _PROBE_RATE:
+            self._count("skipped")
+            return None
+
+        token = uuid4().hex
+        trace = trace or RequestTrace()
+
+        async def generate():
+            # 图片生成记录在投机任务自己的 trace 中，不计入发起预览的请求
+            with isolated_trace(trace, merge=False):
+                return await image_adapter.generate_image(prompt=prompt, session_id=f"spec-{token}", version=0)
+
+        task = asyncio.get_running_loop().create_task(generate())
+        # 被丢弃的任务也要取走异常，避免 "exception was never retrieved" 警告
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._jobs.set(token, SpeculativeJob(token, schema_fingerprint(schema, prompt), task, trace))
+        self._count("started")
+        print(f"🔮 开始投机生成图片（{token}）")
+        return token
+
+    async def adopt(
+        self,
+        token: str,
+        schema: Dict[str, Any],
+        prompt: str
+    ) -> Optional[Tuple[Dict[str, str], RequestTrace]]:
+        """
+        采用投机结果
+
+        Returns:
+            (图片生成结果, 预览和投机生成的 trace)；token 无效、内容已修改或任务失败时返回 None
+        """
+        job = self._jobs.pop(token)
+        if job is None:
+            return None
+
+        if job.fingerprint != schema_fingerprint(schema, prompt):
+            job.discard()
+            self._count("cancelled", False)
+            print(f"✂️ Schema 已修改，取消投机生成（{token}）")
+            return None
+
+        try:
+            result = await job.task
+        except Exception as e:
+            self._count("failed")
+            print(f"⚠️ 投机生成失败（{token}）: {e}")
+            return None
+
+        self._count("adopted", True)
+        print(f"🎯 采用投机生成结果（{token}）")
+        return result, job.trace
+
+    def cancel(self, token: str):
+        """放弃投机结果（用户重新生成 Schema 等情况）"""
+        job = self._jobs.pop(token)
+        if job is not None:
+            job.discard()
+            self._count("cancelled", False)
+
+
+speculation_manager = SpeculationManager()
+
+
+async def sweep_periodically():
+    """按 SPECULATIVE_SWEEP_INTERVAL_SECONDS 定期清理（启动时立即执行一次，清理上次运行遗留的图片）"""
+    while True:
+        try:
+            speculation_manager.sweep()
+        except Exception as e:
+            print(f"⚠️ 投机生成清理失败: {e}")
+        await asyncio.sleep(settings.speculative_sweep_interval_seconds)
@@ -0,0 +1,413 @@
+"""
+Telemetry - 版本生成遥测（按版本记录、每小时汇总、百分位查询）
+
+- record_version：创建版本时从当前请求的 trace（app/core/metrics.py）提取
+  LLM / 图片耗时、token、重试和回退信息，与版本写入同一事务；
+  采用预览 / 投机结果的版本使用随 preview_token 保存的 trace 与当前请求合并后的结果
+- roll_up：把已结束的整小时汇总为固定边界的直方图（telemetry_rollups），并清理过期明细
+- summarize：按时间窗口计算耗时百分位和回退率；已汇总的小时只读汇总行，
+  之后的部分（当前小时，以及后台任务尚未处理的小时）才读取明细
+"""
+import asyncio
+import os
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import delete, func
+from sqlalchemy.orm import Session as SQLSession
+
+from app.config import settings
+from app.core.metrics import RequestTrace, current_trace
+from app.models import TelemetryRollup, Version, VersionTelemetry
+
+
+# 耗时直方图边界（毫秒），最后一个桶为超出最大边界
+LATENCY_BUCKETS_MS = (
+    50, 100, 200, 300, 500, 750, 1000, 1500, 2000, 3000,
+    5000, 7500, 10000, 15000, 20000, 30000, 60000
+)
+
+# 视为 LLM 回退的组件（image_adapter 的回退单独体现在图片模型上）
+_LLM_FALLBACK_COMPONENTS = ("prompt_engine", "feedback_engine")
+
+HOUR = timedelta(hours=1)
+
+
+def hour_floor(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def collect(trace: RequestTrace) -> Dict[str, Any]:
+    """
+    从请求 trace 中提取一个版本的遥测字段
+
+    每次 LLM 尝试是一个 llm.* span，重试次数由 upstream_call 的 attempt 计入 trace；
+    image.* span（参考图编码、生成、下载、写盘或本地生成）之和为图片耗时。
+    """
+    llm_ms = image_ms = 0.0
+    llm_calls = 0
+    for name, (seconds, count) in list(trace.spans.items()):
+        if name.startswith("llm."):
+            llm_ms += seconds * 1000
+            llm_calls += count
+        elif name.startswith("image."):
+            image_ms += seconds * 1000
+
+    llm_model = trace.models.get("openai")
+    if any(component in trace.fallbacks for component in _LLM_FALLBACK_COMPONENTS):
+        llm_model = "mock"
+
+    if "image_adapter" in trace.fallbacks or ("image.mock" in trace.spans and "seedream" not in trace.models):
+        image_model = "mock"
+    else:
+        image_model = trace.models.get("seedream")
+
+    return {
+        "llm_model": llm_model,
+        "llm_ms": int(round(llm_ms)),
+        "llm_calls": llm_calls,
+        "retries": trace.retries,
+        "prompt_tokens": trace.tokens["prompt"],
+        "completion_tokens": trace.tokens["completion"],
+        "image_model": image_model,
+        "image_ms": int(round(image_ms)),
+        "fallback": bool(trace.fallbacks)
+    }
+
+
+def new_histogram() -> List[int]:
+    return [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+
+def observe(histogram: List[int], value_ms: float):
+    histogram[bisect_left(LATENCY_BUCKETS_MS, value_ms)] += 1
+
+
+def histogram_percentile(histogram: List[int], q: float) -> Optional[float]:
+    """
+    直方图百分位数（q 取 0~100），桶内线性插值
+
+    落在最后一个桶（超出最大边界）时返回最大边界。
+    """
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = total * q / 100
+    cumulative = 0
+    for index, count in enumerate(histogram):
+        if count and cumulative + count >= rank:
+            if index >= len(LATENCY_BUCKETS_MS):
+                return float(LATENCY_BUCKETS_MS[-1])
+            lower = LATENCY_BUCKETS_MS[index - 1] if index else 0
+            upper = LATENCY_BUCKETS_MS[index]
+            return round(lower + (upper - lower) * (rank - cumulative) / count, 1)
+        cumulative += count
+    return float(LATENCY_BUCKETS_MS[-1])
+
+
+def _exact_percentile(values: List[int], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return round(ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower), 1)
+
+
+class _Aggregate:
+    """一个时间窗口内的累计值（汇总行和明细行都累加到这里）"""
+
+    COUNTERS = (
+        "versions", "fallbacks", "llm_calls", "retries",
+        "prompt_tokens", "completion_tokens", "image_bytes"
+    )
+
+    def __init__(self):
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+        self.llm_histogram = new_histogram()
+        self.image_histogram = new_histogram()
+
+    def add_row(self, row: VersionTelemetry):
+        self.versions += 1
+        self.fallbacks += int(bool(row.fallback))
+        self.llm_calls += row.llm_calls
+        self.retries += row.retries
+        self.prompt_tokens += row.prompt_tokens
+        self.completion_tokens += row.completion_tokens
+        self.image_bytes += row.image_bytes
+        # 没有发生调用（本地规则快速通道、沿用已有图片等）不计入耗时分布
+        if row.llm_calls:
+            observe(self.llm_histogram, row.llm_ms)
+        if row.image_model:
+            observe(self.image_histogram, row.image_ms)
+
+    def add_rollup(self, rollup: TelemetryRollup):
+        for name in self.COUNTERS:
+            setattr(self, name, getattr(self, name) + getattr(rollup, name))
+        for index, count in enumerate(rollup.llm_histogram):
+            self.llm_histogram[index] += count
+        for index, count in enumerate(rollup.image_histogram):
+            self.image_histogram[index] += count
+
+    def to_dict(self) -> Dict[str, Any]:
+        def latency(histogram: List[int]) -> Dict[str, Any]:
+            return {
+                "count": sum(histogram),
+                "p50_ms": histogram_percentile(histogram, 50),
+                "p95_ms": histogram_percentile(histogram, 95),
+                "p99_ms": histogram_percentile(histogram, 99)
+            }
+
+        return {
+            "versions": self.versions,
+            "fallback_rate": round(self.fallbacks / self.versions, 4) if self.versions else 0.0,
+            "retries": self.retries,
+            "llm_calls": self.llm_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "avg_image_bytes": self.image_bytes // self.versions if self.versions else 0,
+            "llm": latency(self.llm_histogram),
+            "image": latency(self.image_histogram)
+        }
+
+
+class TelemetryStore:
+    """版本遥测（与调用方共用同一个数据库事务）"""
+
+    def __init__(self, db: SQLSession):
+        self.db = db
+
+    # ---------- 写入 ----------
+
+    def record_version(self, version: Version, kind: str, trace: Optional[RequestTrace] = None):
+        """
+        记录一个新版本的遥测（不提交）
+
+        没有请求 trace 时（命令行导入等）不记录。
+        """
+        trace = trace or current_trace()
+        if not settings.telemetry_enabled or trace is None:
+            return
+        try:
+            image_bytes = os.path.getsize(version.image_path)
+        except (OSError, TypeError):
+            image_bytes = 0
+        self.db.add(VersionTelemetry(
+            version_id=str(version.id),
+            session_id=str(version.session_id),
+            kind=kind,
+            created_at=version.created_at or datetime.utcnow(),
+            image_bytes=image_bytes,
+            **collect(trace)
+        ))
+
+    # ---------- 每小时汇总 ----------
+
+    def rolled_until(self) -> Optional[datetime]:
+        """已汇总到的时间点（最后一个汇总小时的结束时间）"""
+        last = self.db.query(func.max(TelemetryRollup.bucket_start)).scalar()
+        return last + HOUR if last else None
+
+    def roll_up(self, now: Optional[datetime] = None) -> int:
+        """
+        汇总已结束的整小时，并清理超过保留期的明细
+
+        从最后一个已汇总的小时开始重新汇总（覆盖该小时内提交较晚的记录），
+        只读取这之后的明细。
+
+        Returns:
+            写入的汇总行数
+        """
+        current_hour = hour_floor(now or datetime.utcnow())
+        last = self.db.query(func.max(TelemetryRollup.bucket_start)).scalar()
+        if last is None:
+            first = self.db.query(func.min(VersionTelemetry.created_at)).scalar()
+            if first is None:
+                return 0
+            last = hour_floor(first)
+
+        written = 0
+        if last < current_hour:
+            groups: Dict[Tuple[datetime, str, str, str], _Aggregate] = {}
+            rows = self.db.query(VersionTelemetry).filter(
+                VersionTelemetry.created_at >= last,
+                VersionTelemetry.created_at < current_hour
+            )
+            for row in rows.yield_per(1000):
+                key = (hour_floor(row.created_at), row.kind, row.llm_model or "", row.image_model or "")
+                groups.setdefault(key, _Aggregate()).add_row(row)
+
+            self.db.execute(
+                delete(TelemetryRollup)
+                .where(TelemetryRollup.bucket_start >= last, TelemetryRollup.bucket_start < current_hour)
+                .execution_options(synchronize_session=False)
+            )
+            for (bucket_start, kind, llm_model, image_model), aggregate in groups.items():
+                self.db.add(TelemetryRollup(
+                    bucket_start=bucket_start,
+                    kind=kind,
+                    llm_model=llm_model,
+                    image_model=image_model,
+                    llm_histogram=aggregate.llm_histogram,
+                    image_histogram=aggregate.image_histogram,
+                    **{name: getattr(aggregate, name) for name in _Aggregate.COUNTERS}
+                ))
+            written = len(groups)
+            self.db.commit()
+
+        # 明细保留 telemetry_retention_days 天；最后一个汇总小时的明细始终保留，供下次重新汇总
+        last_bucket = self.db.query(func.max(TelemetryRollup.bucket_start)).scalar()
+        if last_bucket is not None:
+            cutoff = min(current_hour - timedelta(days=settings.telemetry_retention_days), last_bucket)
+            self.db.execute(
+                delete(VersionTelemetry)
+                .where(VersionTelemetry.created_at < cutoff)
+                .execution_options(synchronize_session=False)
+            )
+            self.db.commit()
+        return written
+
+    # ---------- 查询 ----------
+
+    def summarize(
+        self,
+        hours: int = 24,
+        window_hours: int = 1,
+        kind: Optional[str] = None,
+        llm_model: Optional[str] = None,
+        image_model: Optional[str] = None,
+        now: Optional[datetime] = None
+    ) -> Dict[str, Any]:
+        """
+        最近 hours 小时的遥测汇总（按 window_hours 小时分窗口，窗口按整点对齐）
+
+        Returns:
+            {"start", "end", "window_hours", "total": {...}, "windows": [{"start", ...}]}
+        """
+        now = now or datetime.utcnow()
+        window = timedelta(hours=window_hours)
+        start = hour_floor(now) + HOUR - timedelta(hours=hours)
+        window_count = -(-hours // window_hours)
+        windows = [_Aggregate() for _ in range(window_count)]
+        total = _Aggregate()
+
+        def window_index(moment: datetime) -> int:
+            return min(int((moment - start) / window), window_count - 1)
+
+        rolled_until = self.rolled_until()
+        if rolled_until and rolled_until > start:
+            query = self.db.query(TelemetryRollup).filter(
+                TelemetryRollup.bucket_start >= start,
+                TelemetryRollup.bucket_start < rolled_until
+            )
+            if kind:
+                query = query.filter(TelemetryRollup.kind == kind)
+            if llm_model:
+                query = query.filter(TelemetryRollup.llm_model == llm_model)
+            if image_model:
+                query = query.filter(TelemetryRollup.image_model == image_model)
+            for rollup in query:
+                windows[window_index(rollup.bucket_start)].add_rollup(rollup)
+                total.add_rollup(rollup)
+
+        query = self.db.query(VersionTelemetry).filter(
+            VersionTelemetry.created_at >= max(start, rolled_until or start)
+        )
+        if kind:
+            query = query.filter(VersionTelemetry.kind == kind)
+        if llm_model:
+            query = query.filter(VersionTelemetry.llm_model == llm_model)
+        if image_model:
+            query = query.filter(VersionTelemetry.image_model == image_model)
+        for row in query.yield_per(1000):
+            windows[window_index(row.created_at)].add_row(row)
+            total.add_row(row)
+
+        return {
+            "start": start.isoformat(),
+            "end": now.isoformat(),
+            "window_hours": window_hours,
+            "total": total.to_dict(),
+            "windows": [
+                {"start": (start + window * index).isoformat(), **aggregate.to_dict()}
+                for index, aggregate in enumerate(windows)
+            ]
+        }
+
+    def session_telemetry(self, session_id: str, limit: int = 100) -> Dict[str, Any]:
+        """
+        单个会话最近 limit 个版本的遥测明细和精确百分位
+
+        明细超过保留期后会被清理，只能查到保留期内的版本。
+        """
+        rows = (
+            self.db.query(VersionTelemetry, Version.version_number)
+            .outerjoin(Version, Version.id == VersionTelemetry.version_id)
+            .filter(VersionTelemetry.session_id == str(session_id))
+            .order_by(VersionTelemetry.created_at.desc())
+            .limit(limit)
+            .all()
+        )
+        aggregate = _Aggregate()
+        for row, _ in rows:
+            aggregate.add_row(row)
+        summary = aggregate.to_dict()
+        for key, values in (
+            ("llm", [row.llm_ms for row, _ in rows if row.llm_calls]),
+            ("image", [row.image_ms for row, _ in rows if row.image_model])
+        ):
+            summary[key] = {
+                "count": len(values),
+                "p50_ms": _exact_percentile(values, 50),
+                "p95_ms": _exact_percentile(values, 95),
+                "p99_ms": _exact_percentile(values, 99)
+            }
+
+        return {
+            "session_id": str(session_id),
+            "summary": summary,
+            "versions": [
+                {
+                    "version": version_number,
+                    "kind": row.kind,
+                    "created_at": row.created_at.isoformat(),
+                    "llm_model": row.llm_model,
+                    "llm_ms": row.llm_ms,
+                    "llm_calls": row.llm_calls,
+                    "retries": row.retries,
+                    "prompt_tokens": row.prompt_tokens,
+                    "completion_tokens": row.completion_tokens,
+                    "image_model": row.image_model,
+                    "image_ms": row.image_ms,
+                    "image_bytes": row.image_bytes,
+                    "fallback": row.fallback
+                }
+                for row, version_number in rows
+            ]
+        }
+
+
+def roll_up_in_background():
+    """后台执行一次每小时汇总"""
+    from app.core.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        written = TelemetryStore(db).roll_up()
+        if written:
+            print(f"📈 遥测汇总完成，写入 {written} 行")
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️ 遥测汇总失败: {e}")
+    finally:
+        db.close()
+
+
+async def roll_up_periodically():
+    """按 TELEMETRY_ROLLUP_INTERVAL_SECONDS 定期汇总（启动时立即执行一次）"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await loop.run_in_executor(None, roll_up_in_background)
+        await asyncio.sleep(settings.telemetry_rollup_interval_seconds)
@@ -0,0 +1,74 @@
+"""
+Token 计数
+
+使用 tiktoken（pyproject.toml 中已声明）精确计数。环境中缺少 tiktoken、
+或编码表无法加载（首次使用需要下载）时退化为按字符估算：
+CJK 字符约 1 token/字，其余非空白字符约 4 字符/token。
+退化时打印一次警告，usage_stats 中记录每次调用使用的计数方式（见 token_counter_mode）。
+"""
+import math
+import re
+from functools import lru_cache
+from typing import Optional
+
+
+_CJK = re.compile(r"[぀-ヿ㐀-䶿一-鿿豈-﫿＀-￯]")
+
+
+@lru_cache(maxsize=1)
+def _load_tiktoken():
+    """按需导入 tiktoken，未安装时返回 None（只警告一次）"""
+    try:
+        import tiktoken
+        return tiktoken
+    except ImportError:
+        print("⚠️ 未安装 tiktoken，token 数按字符估算（请执行 uv sync 安装依赖）")
+        return None
+
+
+@lru_cache(maxsize=8)
+def _load_encoding(model: str):
+    """加载模型对应的编码（模型未知时使用 o200k_base），不可用时返回 None"""
+    tiktoken = _load_tiktoken()
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # 编码表首次使用需要下载，离线环境下会失败
+        print(f"⚠️ tiktoken 编码表加载失败，token 数按字符估算: {e}")
+        return None
+
+
+def _resolve_model(model: Optional[str]) -> str:
+    if model is None:
+        from app.config import settings
+        model = settings.openai_model
+    return model
+
+
+def token_counter_mode(model: Optional[str] = None) -> str:
+    """当前使用的计数方式：tiktoken（精确）或 heuristic（按字符估算）"""
+    return "tiktoken" if _load_encoding(_resolve_model(model)) is not None else "heuristic"
+
+
+def estimate_tokens(text: str) -> int:
+    """按字符估算 token 数"""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    other = sum(1 for char in text if not char.isspace()) - cjk
+    return cjk + math.ceil(other / 4)
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """计算文本的 token 数（model 默认为 OPENAI_MODEL）"""
+    if not text:
+        return 0
+    encoding = _load_encoding(_resolve_model(model))
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text))
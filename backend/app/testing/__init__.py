@@ -0,0 +1,3 @@
+"""
+测试与压测工具（不参与正式服务）
+"""
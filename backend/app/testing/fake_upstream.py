@@ -0,0 +1,326 @@
+"""
+Fake Upstream - 本地模拟的 OpenAI 兼容上游（Chat Completions + 图片生成）
+
+让 USE_REAL_API=true 时的真实代码路径（_generate_with_openai、_analyze_with_openai、
+流式生成、_generate_with_gemini）在离线环境下运行，用于验证重试、超时、解析和压测吞吐：
+- /chat/completions：按请求内容从 fixtures/upstream.json 返回 Schema 或 Diff，
+  支持 n（多个候选）和 stream（SSE，可配置每块大小和间隔以模拟慢速字节流）
+- /images/generations：返回图片 URL，图片由 procedural_image 按 Prompt 确定性生成
+- 可配置延迟分布、429 / 5xx 比例和返回非法 JSON 的比例
+- /_fake/stats 查看请求统计，/_fake/config 运行时修改配置
+
+路由同时挂在根路径和任意前缀下（如 /v1/chat/completions、/api/v3/images/generations），
+OPENAI_API_BASE / GEMINI_API_BASE 指向本服务的任意前缀即可。
+启动方式见 app/cli/fake_upstream.py。
+"""
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from uuid import uuid4
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from app.services.procedural_image import parse_size, render_image
+from app.services.token_counter import estimate_tokens
+
+
+# 不依赖 app.config / app.core：模拟上游无需数据库和 API Key 即可独立运行
+_SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+FIXTURES_PATH = Path(__file__).parent / "fixtures" / "upstream.json"
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "exponential")
+
+# 火山引擎的尺寸档位
+_SIZE_PRESETS = {"1K": (1024, 1024), "2K": (2048, 2048), "4K": (4096, 4096)}
+
+
+class FakeUpstreamConfig:
+    """模拟上游的行为配置（所有延迟单位为毫秒，比例为 0~1）"""
+
+    FIELDS = (
+        "latency_ms", "latency_jitter_ms", "latency_distribution",
+        "image_latency_ms", "rate_429", "rate_5xx", "malformed_rate",
+        "stream_chunk_chars", "stream_chunk_delay_ms", "image_size_cap", "seed"
+    )
+
+    def __init__(
+        self,
+        latency_ms: float = 0,
+        latency_jitter_ms: float = 0,
+        latency_distribution: str = "fixed",
+        image_latency_ms: float = 0,
+        rate_429: float = 0.0,
+        rate_5xx: float = 0.0,
+        malformed_rate: float = 0.0,
+        stream_chunk_chars: int = 16,
+        stream_chunk_delay_ms: float = 0,
+        image_size_cap: int = 1024,
+        seed: Optional[int] = None
+    ):
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.latency_distribution = latency_distribution
+        self.image_latency_ms = image_latency_ms
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.malformed_rate = malformed_rate
+        self.stream_chunk_chars = stream_chunk_chars
+        self.stream_chunk_delay_ms = stream_chunk_delay_ms
+        # 生成图片的长边上限（避免 4K 图片拖慢压测）
+        self.image_size_cap = image_size_cap
+        self.seed = seed
+        self.validate()
+
+    def validate(self):
+        if self.latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"latency_distribution 必须是 {'/'.join(LATENCY_DISTRIBUTIONS)} 之一")
+        for name in ("rate_429", "rate_5xx", "malformed_rate"):
+            if not 0 <= getattr(self, name) <= 1:
+                raise ValueError(f"{name} 必须在 0~1 之间")
+        if self.stream_chunk_chars < 1:
+            raise ValueError("stream_chunk_chars 必须大于 0")
+
+    def update(self, values: Dict[str, Any]):
+        unknown = set(values) - set(self.FIELDS)
+        if unknown:
+            raise ValueError(f"未知配置项: {', '.join(sorted(unknown))}")
+        previous = self.to_dict()
+        for key, value in values.items():
+            setattr(self, key, value)
+        try:
+            self.validate()
+        except ValueError:
+            for key, value in previous.items():
+                setattr(self, key, value)
+            raise
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+
+class FakeUpstream:
+    """模拟上游的状态：配置、随机数、fixtures、已生成的图片和统计"""
+
+    def __init__(self, config: Optional[FakeUpstreamConfig] = None, fixtures_path: Path = FIXTURES_PATH):
+        self.config = config or FakeUpstreamConfig()
+        self.random = random.Random(self.config.seed)
+        self.fixtures = json.loads(fixtures_path.read_text(encoding="utf-8"))
+        # 图片 ID → (Prompt, 宽, 高)，下载时再渲染
+        self.images: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "chat_requests": 0,
+            "stream_requests": 0,
+            "image_requests": 0,
+            "image_downloads": 0,
+            "reference_images": 0,
+            "errors_429": 0,
+            "errors_5xx": 0,
+            "malformed": 0,
+            "choices": 0
+        }
+
+    def count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def latency(self, base_ms: float) -> float:
+        """按配置的分布抽样一次延迟（秒）"""
+        config = self.config
+        if config.latency_distribution == "uniform":
+            value = base_ms + self.random.uniform(-config.latency_jitter_ms, config.latency_jitter_ms)
+        elif config.latency_distribution == "exponential":
+            value = base_ms + (self.random.expovariate(1 / config.latency_jitter_ms) if config.latency_jitter_ms else 0)
+        else:
+            value = base_ms
+        return max(value, 0) / 1000
+
+    def injected_error(self) -> Optional[JSONResponse]:
+        """按配置比例注入 429 / 5xx"""
+        roll = self.random.random()
+        if roll < self.config.rate_429:
+            self.count("errors_429")
+            return JSONResponse(
+                status_code=429,
+                headers={"retry-after": "1"},
+                content={"error": {"message": "Rate limit exceeded (fake)", "type": "rate_limit_error", "code": "rate_limit"}}
+            )
+        if roll < self.config.rate_429 + self.config.rate_5xx:
+            self.count("errors_5xx")
+            status = self.random.choice((500, 502, 503))
+            return JSONResponse(
+                status_code=status,
+                content={"error": {"message": f"Upstream error {status} (fake)", "type": "server_error"}}
+            )
+        return None
+
+    def content_for(self, messages: List[Dict[str, Any]], index: int) -> str:
+        """按请求内容挑选 fixture：带 "当前 Schema" 的是反馈分析，返回 Diff；否则返回 Schema"""
+        user_text = "\n".join(
+            message.get("content") or "" for message in messages
+            if message.get("role") == "user" and isinstance(message.get("content"), str)
+        )
+        kind = "diffs" if "当前 Schema" in user_text else "schemas"
+        candidates = self.fixtures[kind]
+        # 相同输入的第 index 个候选固定，不同候选之间不同
+        digest = int(hashlib.sha256(user_text.encode("utf-8")).hexdigest(), 16)
+        content = json.dumps(candidates[(digest + index) % len(candidates)], ensure_ascii=False)
+        if self.random.random() < self.config.malformed_rate:
+            self.count("malformed")
+            # 截断的 JSON：客户端能收到响应，但解析失败
+            content = content[:max(len(content) // 2, 1)]
+        return content
+
+
+def create_app(upstream: Optional[FakeUpstream] = None) -> FastAPI:
+    """创建模拟上游应用"""
+    upstream = upstream or FakeUpstream()
+    app = FastAPI(title="PRISM Fake Upstream")
+    app.state.upstream = upstream
+
+    async def chat_completions(request: Request):
+        body = await request.json()
+        upstream.count("chat_requests")
+        await asyncio.sleep(upstream.latency(upstream.config.latency_ms))
+        error = upstream.injected_error()
+        if error is not None:
+            return error
+
+        messages = body.get("messages") or []
+        n = max(int(body.get("n") or 1), 1)
+        model = body.get("model", "fake-model")
+        contents = [upstream.content_for(messages, index) for index in range(n)]
+        upstream.count("choices", n)
+
+        prompt_tokens = sum(estimate_tokens(message.get("content") or "") for message in messages)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": sum(estimate_tokens(content) for content in contents),
+            "total_tokens": prompt_tokens + sum(estimate_tokens(content) for content in contents),
+            "prompt_tokens_details": {"cached_tokens": 0}
+        }
+        completion_id = f"chatcmpl-{uuid4().hex}"
+        created = int(time.time())
+
+        if body.get("stream"):
+            upstream.count("stream_requests")
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+            return StreamingResponse(
+                _stream_chunks(upstream, completion_id, created, model, contents, usage if include_usage else None),
+                media_type="text/event-stream",
+                headers=_SSE_HEADERS
+            )
+
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [
+                {
+                    "index": index,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop"
+                }
+                for index, content in enumerate(contents)
+            ],
+            "usage": usage
+        }
+
+    async def image_generations(request: Request):
+        body = await request.json()
+        upstream.count("image_requests")
+        if body.get("image"):
+            upstream.count("reference_images")
+        await asyncio.sleep(upstream.latency(upstream.config.image_latency_ms))
+        error = upstream.injected_error()
+        if error is not None:
+            return error
+
+        size = str(body.get("size") or "1K")
+        width, height = _SIZE_PRESETS.get(size.upper()) or parse_size(size)
+        scale = min(upstream.config.image_size_cap / max(width, height), 1)
+        width, height = max(int(width * scale), 1), max(int(height * scale), 1)
+
+        image_id = uuid4().hex
+        upstream.images[image_id] = (body.get("prompt") or "", width, height)
+        base_url = str(request.base_url).rstrip("/")
+        return {
+            "created": int(time.time()),
+            "data": [{"url": f"{base_url}/_fake/images/{image_id}.png", "size": f"{width}x{height}"}]
+        }
+
+    for prefix in ("", "/{prefix:path}"):
+        app.add_api_route(f"{prefix}/chat/completions", chat_completions, methods=["POST"])
+        app.add_api_route(f"{prefix}/images/generations", image_generations, methods=["POST"])
+
+    @app.get("/_fake/images/{image_id}.png")
+    async def download_image(image_id: str):
+        entry = upstream.images.pop(image_id, None)
+        if entry is None:
+            return JSONResponse(status_code=404, content={"error": {"message": "image not found"}})
+        upstream.count("image_downloads")
+        prompt, width, height = entry
+        data = await asyncio.to_thread(render_image, prompt, width, height)
+        return Response(content=data, media_type="image/png")
+
+    @app.get("/_fake/stats")
+    async def fake_stats():
+        return {"stats": upstream.stats(), "config": upstream.config.to_dict()}
+
+    @app.post("/_fake/config")
+    async def fake_config(request: Request):
+        try:
+            upstream.config.update(await request.json())
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"detail": str(e)})
+        return upstream.config.to_dict()
+
+    return app
+
+
+async def _stream_chunks(
+    upstream: FakeUpstream,
+    completion_id: str,
+    created: int,
+    model: str,
+    contents: List[str],
+    usage: Optional[Dict[str, Any]]
+):
+    """按 OpenAI 流式格式逐块输出（每块 stream_chunk_chars 个字符，块间隔 stream_chunk_delay_ms）"""
+
+    def chunk(choices: List[Dict[str, Any]], chunk_usage: Optional[Dict[str, Any]] = None) -> str:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": choices
+        }
+        if chunk_usage is not None:
+            payload["usage"] = chunk_usage
+        return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    size = upstream.config.stream_chunk_chars
+    delay = upstream.config.stream_chunk_delay_ms / 1000
+    for index, content in enumerate(contents):
+        yield chunk([{"index": index, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+        for start in range(0, len(content), size):
+            if delay:
+                await asyncio.sleep(delay)
+            yield chunk([{"index": index, "delta": {"content": content[start:start + size]}, "finish_reason": None}])
+        yield chunk([{"index": index, "delta": {}, "finish_reason": "stop"}])
+    if usage is not None:
+        yield chunk([], usage)
+    yield "data: [DONE]\n\n"
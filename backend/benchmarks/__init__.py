@@ -0,0 +1,6 @@
+"""
+性能基准测试（在 backend 目录下以 python -m benchmarks.<name> 运行）
+
+- e2e：启动后端和模拟上游，按配置的并发和请求比例压测 API
+- micro：引擎和 SessionManager 热点路径的微基准（synthetic 生成合成数据）
+"""
@@ -0,0 +1,119 @@
+"""
+基准测试结果的统计、保存和比较
+"""
+import json
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """线性插值百分位数（q 取 0~100）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(samples_ms: Sequence[float], digits: int = 3) -> Dict[str, float]:
+    """延迟样本（毫秒）的汇总：次数、均值、p50 / p95 / p99、最大值（保留 digits 位小数）"""
+    if not samples_ms:
+        return {"count": 0, "mean_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+    return {
+        "count": len(samples_ms),
+        "mean_ms": round(sum(samples_ms) / len(samples_ms), digits),
+        "p50_ms": round(percentile(samples_ms, 50), digits),
+        "p95_ms": round(percentile(samples_ms, 95), digits),
+        "p99_ms": round(percentile(samples_ms, 99), digits),
+        "max_ms": round(max(samples_ms), digits)
+    }
+
+
+def environment() -> Dict[str, Any]:
+    """运行环境信息（写入结果，便于比较时确认条件一致）"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": commit,
+        "python": sys.version.split()[0],
+        "platform": platform.platform()
+    }
+
+
+def save_results(results: Dict[str, Any], path: str):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    Path(path).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"💾 结果已保存: {path}")
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    return json.loads(Path(path).read_text(encoding="utf-8"))
+
+
+def compare_metrics(
+    current: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    metric: str,
+    threshold: float,
+    higher_is_better: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    逐项比较两次结果的同一指标
+
+    Returns:
+        [{"name", "baseline", "current", "change", "regression"}]，
+        change 为相对变化（0.1 表示变差 10%），超过 threshold 视为回归
+    """
+    rows = []
+    for name in sorted(set(current) & set(baseline)):
+        before = baseline[name].get(metric)
+        after = current[name].get(metric)
+        if not before or after is None:
+            continue
+        change = (before - after) / before if higher_is_better else (after - before) / before
+        rows.append({
+            "name": name,
+            "baseline": before,
+            "current": after,
+            "change": round(change, 4),
+            "regression": change > threshold
+        })
+    return rows
+
+
+def print_comparison(rows: List[Dict[str, Any]], metric: str, threshold: float) -> bool:
+    """打印比较结果，返回是否存在回归"""
+    print(f"\n{'名称':<32}{'基线 ' + metric:>16}{'当前':>14}{'变化':>10}")
+    for row in rows:
+        flag = "  ❌ 回归" if row["regression"] else ""
+        print(f"{row['name']:<32}{row['baseline']:>16.3f}{row['current']:>14.3f}{row['change']:>+10.1%}{flag}")
+    regressions = [row["name"] for row in rows if row["regression"]]
+    if regressions:
+        print(f"\n❌ {len(regressions)} 项超过回归阈值 {threshold:.0%}: {', '.join(regressions)}")
+    else:
+        print(f"\n✅ 无超过 {threshold:.0%} 的回归")
+    return bool(regressions)
+
+
+def format_table(summaries: Dict[str, Dict[str, float]], extra: Optional[List[str]] = None) -> str:
+    """延迟汇总表"""
+    columns = ["count", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"] + (extra or [])
+    lines = [f"{'名称':<32}" + "".join(f"{column:>12}" for column in columns)]
+    for name, summary in summaries.items():
+        cells = []
+        for column in columns:
+            value = summary.get(column, "")
+            cells.append(f"{value:>12.3f}" if isinstance(value, float) else f"{value!s:>12}")
+        lines.append(f"{name:<32}" + "".join(cells))
+    return "\n".join(lines)
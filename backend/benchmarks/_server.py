@@ -0,0 +1,79 @@
+"""
+压测用的后端进程：在 main.app 上增加事件循环延迟和内存探针后启动
+
+用法（由 benchmarks.e2e 自动启动，也可单独运行）：
+    python -m benchmarks._server --port 8100
+
+GET /_bench/probe 返回上次探测以来的事件循环延迟（最大值、p99、均值）和当前 RSS，
+然后清空延迟样本。
+"""
+import argparse
+import asyncio
+import resource
+import sys
+import time
+from collections import deque
+from pathlib import Path
+
+import uvicorn
+
+from benchmarks._report import percentile
+
+
+# 事件循环延迟采样间隔（秒）
+_LAG_INTERVAL = 0.02
+_lag_samples: deque = deque(maxlen=100000)
+
+
+def rss_bytes() -> int:
+    """当前常驻内存（Linux 读取 /proc，其他平台退化为峰值 RSS）"""
+    status = Path("/proc/self/status")
+    if status.exists():
+        for line in status.read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 单位为字节，Linux 为 KB
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+async def _monitor_loop_lag():
+    """定时 sleep，实际唤醒时间比预期晚多少即为事件循环被阻塞的时长"""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(_LAG_INTERVAL)
+        _lag_samples.append((time.perf_counter() - start - _LAG_INTERVAL) * 1000)
+
+
+def build_app():
+    from main import app
+
+    @app.on_event("startup")
+    async def start_probes():
+        app.state.lag_monitor = asyncio.get_running_loop().create_task(_monitor_loop_lag())
+
+    @app.get("/_bench/probe")
+    async def probe():
+        samples = list(_lag_samples)
+        _lag_samples.clear()
+        return {
+            "rss_bytes": rss_bytes(),
+            "loop_lag_samples": len(samples),
+            "loop_lag_max_ms": round(max(samples), 3) if samples else 0.0,
+            "loop_lag_p99_ms": round(percentile(samples, 99), 3),
+            "loop_lag_mean_ms": round(sum(samples) / len(samples), 3) if samples else 0.0
+        }
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="压测用后端进程")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+    uvicorn.run(build_app(), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
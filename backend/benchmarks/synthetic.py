@@ -0,0 +1,167 @@
+"""
+基准测试用的合成数据
+
+- random_schema / diff_chain：随机 Schema 和长 Diff 链（词表避开冲突规则中的词）
+- populate_version_tree：单个会话下批量写入 N 个版本（树形，按比例分叉）
+- populate_sessions：批量写入 N 个会话
+
+数据库写入使用 Core 批量 INSERT，不经过 SessionManager，10 万行可在数秒内完成。
+所有生成器接收 random.Random，相同种子生成相同数据。
+"""
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+from uuid import uuid4
+
+from sqlalchemy.orm import Session as SQLSession
+
+from app.models import Session, Version
+from app.schemas.prompt import LIST_FIELDS
+
+
+_ADJECTIVES = ["柔和", "细腻", "明亮", "清新", "温暖", "安静", "朦胧", "流畅", "精致", "自然", "通透", "厚重"]
+_NOUNS = {
+    "subject": ["橘猫", "少女", "旅人", "小狗", "骑士", "渔夫", "老人", "孩童"],
+    "appearance": ["长发", "围巾", "斗篷", "皮靴", "雀斑", "微笑", "短发", "草帽"],
+    "style": ["水彩", "油画", "插画", "半写实", "动漫风格", "电影感", "版画", "素描"],
+    "composition": ["特写", "远景", "俯拍", "仰拍", "三分构图", "对称构图", "浅景深", "广角"],
+    "lighting": ["侧光", "逆光", "暖色调", "冷色调", "体积光", "柔光", "轮廓光", "晨光"],
+    "background": ["森林", "海边", "窗边", "街角", "草地", "雪山", "书房", "站台"],
+    "quality": ["高清", "细节丰富", "16:9", "锐利", "高分辨率", "质感", "层次", "景深"],
+    "negative": ["模糊", "变形", "噪点", "多余肢体", "畸形手", "水印", "文字", "裁切"],
+}
+WEIGHT_KEYS = ["style", "realism", "lighting", "background", "composition"]
+
+
+def random_element(rng: random.Random, field: str) -> str:
+    return rng.choice(_ADJECTIVES) + rng.choice(_NOUNS[field])
+
+
+def random_schema(rng: random.Random, elements_per_field: int = 3) -> Dict[str, Any]:
+    schema = {
+        field: [random_element(rng, field) for _ in range(elements_per_field)]
+        for field in LIST_FIELDS
+    }
+    schema["weights"] = {key: round(rng.uniform(0.5, 1.2), 2) for key in WEIGHT_KEYS[:2]}
+    return schema
+
+
+def random_diff(rng: random.Random, schema: Dict[str, Any]) -> Dict[str, Any]:
+    """基于当前 Schema 的随机 Diff（1~4 个 add / remove / adjust 操作）"""
+    operations = []
+    for _ in range(rng.randint(1, 4)):
+        field = rng.choice(LIST_FIELDS)
+        kind = rng.random()
+        if kind < 0.55:
+            operations.append({
+                "action": "add",
+                "field": field,
+                "values": [random_element(rng, field) for _ in range(rng.randint(1, 2))]
+            })
+        elif kind < 0.8 and schema.get(field):
+            operations.append({"action": "remove", "field": field, "values": [rng.choice(schema[field])]})
+        else:
+            operations.append({
+                "action": "adjust",
+                "field": f"weights.{rng.choice(WEIGHT_KEYS)}",
+                "delta": round(rng.uniform(-0.3, 0.3), 2)
+            })
+    return {"operations": operations, "reasoning": "合成数据"}
+
+
+def diff_chain(rng: random.Random, schema: Dict[str, Any], length: int) -> List[Dict[str, Any]]:
+    """
+    生成可依次应用的 Diff 链
+
+    remove 只删除链上前面步骤后仍存在的元素（按不压缩的语义模拟 Schema 演进）
+    """
+    from app.schemas.prompt import Schema
+
+    current = Schema.from_dict(schema, strict=False)
+    chain = []
+    for _ in range(length):
+        diff = random_diff(rng, current.to_dict())
+        chain.append(diff)
+        current = current.apply_diff(diff)
+    return chain
+
+
+def populate_version_tree(
+    db: SQLSession,
+    rng: random.Random,
+    versions: int,
+    branch_rate: float = 0.3,
+    batch_size: int = 2000
+) -> str:
+    """
+    写入一个有 versions 个版本的会话
+
+    每个新版本以 1 - branch_rate 的概率接在最新版本之后（反馈迭代），
+    否则从任意已有版本分叉（回滚后再修改）。
+
+    Returns:
+        会话 ID
+    """
+    session_id = str(uuid4())
+    now = datetime.utcnow()
+    db.execute(Session.__table__.insert(), [{
+        "id": session_id, "name": "合成会话", "created_at": now, "updated_at": now
+    }])
+
+    schema = random_schema(rng)
+    ids: List[str] = []
+    rows = []
+    for number in range(1, versions + 1):
+        version_id = str(uuid4())
+        if not ids:
+            parent = None
+        elif rng.random() < branch_rate:
+            parent = rng.choice(ids)
+        else:
+            parent = ids[-1]
+        rows.append({
+            "id": version_id,
+            "session_id": session_id,
+            "version_number": number,
+            "parent_version_id": parent,
+            "user_input": "合成输入" if parent is None else None,
+            "user_feedback": None if parent is None else "合成反馈",
+            "schema": schema,
+            "prompt": "合成 Prompt",
+            "diff": None,
+            "image_url": f"http://localhost/images/{session_id}-v{number}.png",
+            "image_path": f"/tmp/{session_id}-v{number}.png",
+            "image_status": "final",
+            "created_at": now + timedelta(seconds=number)
+        })
+        ids.append(version_id)
+        if len(rows) >= batch_size:
+            db.execute(Version.__table__.insert(), rows)
+            rows = []
+    if rows:
+        db.execute(Version.__table__.insert(), rows)
+    db.commit()
+    return session_id
+
+
+def populate_sessions(db: SQLSession, rng: random.Random, count: int, batch_size: int = 5000) -> int:
+    """写入 count 个会话（更新时间随机分布在过去一年内，约 5% 为已删除）"""
+    now = datetime.utcnow()
+    rows = []
+    for index in range(count):
+        updated = now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+        rows.append({
+            "id": str(uuid4()),
+            "name": f"合成项目 {index}",
+            "description": None,
+            "created_at": updated - timedelta(hours=1),
+            "updated_at": updated,
+            "deleted_at": now if rng.random() < 0.05 else None
+        })
+        if len(rows) >= batch_size:
+            db.execute(Session.__table__.insert(), rows)
+            rows = []
+    if rows:
+        db.execute(Session.__table__.insert(), rows)
+    db.commit()
+    return count
@@ -1,13 +1,22 @@
 """
 PRISM 后端服务主入口
 """
+import asyncio
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 from app.config import settings
 from app.api.v1 import api_router
 from app.core.database import init_db
+from app.core.metrics import ServerTimingMiddleware, render_metrics
+from app.services.conflict_detector import get_conflict_detector
+from app.services.image_utils import downscale_enabled
+from app.services.token_counter import token_counter_mode
+from app.services.session_purger import purge_pending_in_background
+from app.services.speculation import sweep_periodically
+from app.services.telemetry import roll_up_periodically
 
 app = FastAPI(
     title="PRISM API",
@@ -23,8 +32,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+# 分阶段计时：Server-Timing 响应头和请求耗时直方图
+app.add_middleware(ServerTimingMiddleware)
+
 # 挂载静态文件（图片）
 storage_path = Path(settings.storage_path)
 storage_path.mkdir(parents=True, exist_ok=True)
@@ -42,6 +55,26 @@ async def startup_event():
         init_db()
         print("✅ 数据库初始化完成")
 
+    # 预编译冲突检测规则（规则表有误时启动即报错）
+    get_conflict_detector()
+
+    # 缺少 Pillow 时启动即警告（图片缩放会被跳过）
+    downscale_enabled()
+
+    # 缺少 tiktoken 时启动即警告（上下文预算按字符估算）
+    token_counter_mode()
+
+    # 补偿清理上次未完成的删除任务（不阻塞启动）
+    asyncio.get_running_loop().run_in_executor(None, purge_pending_in_background)
+
+    # 过期投机任务和遗留图片的清理
+    if settings.speculative_generation_enabled:
+        asyncio.create_task(sweep_periodically())
+
+    # 版本遥测的每小时汇总
+    if settings.telemetry_enabled:
+        asyncio.create_task(roll_up_periodically())
+
 
 @app.get("/")
 async def root():
@@ -49,6 +82,12 @@ async def root():
     return {"message": "PRISM API is running"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus 指标"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.get("/health")
 async def health():
     """健康检查"""
@@ -0,0 +1,47 @@
+"""
+测试公共配置
+
+在导入 app 之前设置环境变量（优先于 .env）：不调用真实 API，数据库使用临时目录下的 SQLite。
+"""
+import os
+import tempfile
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+os.environ.update({
+    "OPENAI_API_KEY": "test",
+    "GEMINI_API_KEY": "test",
+    "USE_REAL_API": "false",
+    "DATABASE_URL": f"sqlite:///{os.path.join(tempfile.gettempdir(), 'prism-test.db')}",
+    "DEBUG": "false",
+})
+
+from app.config import settings  # noqa: E402  环境变量设置后再导入
+
+
+@pytest.fixture
+def db(tmp_path):
+    """独立的 SQLite 数据库（每个测试一个文件）"""
+    from app.models import Base
+    from app.services.search_index import ensure_search_schema
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    Base.metadata.create_all(bind=engine)
+    ensure_search_schema(engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    """图片存储目录"""
+    path = tmp_path / "images"
+    path.mkdir()
+    monkeypatch.setattr(settings, "storage_path", str(path))
+    return path
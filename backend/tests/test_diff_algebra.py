@@ -0,0 +1,149 @@
+"""Diff Algebra：diff_schemas / compose / invert"""
+import random
+
+import pytest
+
+from app.schemas.prompt import LIST_FIELDS, Schema
+from app.services.diff_algebra import changed_fields, compose, diff_schemas, invert
+
+
+BASE = {
+    "subject": ["橘猫"],
+    "appearance": ["蓬松"],
+    "style": ["写实"],
+    "composition": [],
+    "lighting": ["暗光", "阴影"],
+    "background": ["窗边"],
+    "quality": [],
+    "negative": [],
+    "weights": {"lighting": 1.0, "style": 0.5},
+}
+
+
+def schema(**overrides):
+    return Schema.from_dict({**BASE, **overrides}, strict=False)
+
+
+def assert_round_trip(source, target):
+    # 规范化 Diff 的权重按键比较，不区分顺序
+    diff = diff_schemas(source, target)
+    assert source.apply_diff(diff).to_dict() == target.to_dict()
+    return diff
+
+
+def test_identical_schemas_have_empty_diff():
+    assert diff_schemas(schema(), schema())["operations"] == []
+
+
+def test_add_and_remove_are_minimal():
+    diff = assert_round_trip(schema(), schema(lighting=["阴影", "柔光"]))
+    assert diff["operations"] == [
+        {"action": "remove", "field": "lighting", "values": ["暗光"]},
+        {"action": "add", "field": "lighting", "values": ["柔光"]},
+    ]
+
+
+def test_reorder_falls_back_to_replace():
+    diff = assert_round_trip(schema(), schema(lighting=["阴影", "暗光"]))
+    assert diff["operations"] == [{"action": "replace", "field": "lighting", "value": ["阴影", "暗光"]}]
+
+
+def test_duplicate_values():
+    assert_round_trip(schema(lighting=["暗光", "暗光", "阴影"]), schema(lighting=["暗光", "阴影", "暗光"]))
+
+
+def test_weights_adjust_and_replace():
+    diff = assert_round_trip(schema(), schema(weights={"lighting": 1.3, "style": 0.5, "realism": 0.8}))
+    assert [(op["action"], op["field"]) for op in diff["operations"]] == [
+        ("adjust", "weights.lighting"),
+        ("replace", "weights.realism"),
+    ]
+
+
+def test_removed_weight_key_replaces_all_weights():
+    diff = assert_round_trip(schema(), schema(weights={"lighting": 1.0}))
+    assert diff["operations"] == [{"action": "replace", "field": "weights", "value": {"lighting": 1.0}}]
+
+
+def test_extra_list_field():
+    assert_round_trip(schema(mood=["平静"]), schema(mood=["平静", "温暖"]))
+    assert_round_trip(schema(), schema(mood=["温暖"]))
+
+
+def test_extra_scalar_to_list():
+    # 标量不能作为 add 的基础（会被拆成字符），必须整体替换
+    diff = assert_round_trip(schema(mood="平静"), schema(mood=["平静", "温暖"]))
+    assert diff["operations"] == [{"action": "replace", "field": "mood", "value": ["平静", "温暖"]}]
+
+
+def test_extra_list_to_scalar():
+    assert_round_trip(schema(mood=["平静"]), schema(mood="平静"))
+
+
+def test_extra_scalar_changed():
+    diff = assert_round_trip(schema(aspect_ratio="1:1"), schema(aspect_ratio="16:9"))
+    assert diff["operations"] == [{"action": "replace", "field": "aspect_ratio", "value": "16:9"}]
+
+
+def test_missing_extra_field_becomes_empty_list():
+    diff = diff_schemas(schema(mood=["平静"]), schema())
+    assert diff["operations"] == [{"action": "replace", "field": "mood", "value": []}]
+
+
+def test_compose_equals_sequential_application():
+    base = schema()
+    diffs = [
+        {"operations": [{"action": "add", "field": "lighting", "values": ["柔光"]}]},
+        {"operations": [{"action": "remove", "field": "lighting", "values": ["柔光"]}]},
+        {"operations": [{"action": "adjust", "field": "weights.lighting", "delta": 0.2}]},
+        {"operations": [{"action": "adjust", "field": "weights.lighting", "delta": 0.1}]},
+    ]
+    expected = base
+    for diff in diffs:
+        expected = expected.apply_diff(diff)
+
+    composed = compose(base, diffs, "合并")
+    assert base.apply_diff(composed).to_dict() == expected.to_dict()
+    assert composed["reasoning"] == "合并"
+    # 先加后删互相抵消，两次调整合并为一次
+    assert changed_fields(composed) == ["weights"]
+    assert len(composed["operations"]) == 1
+
+
+def test_invert_restores_base():
+    base = schema()
+    diff = {"operations": [
+        {"action": "remove", "field": "lighting", "values": ["暗光"]},
+        {"action": "adjust", "field": "weights.lighting", "delta": 0.5},
+        {"action": "replace", "field": "background", "value": ["纯色背景"]},
+    ]}
+    changed = base.apply_diff(diff)
+    assert changed.apply_diff(invert(base, diff)).to_dict() == base.to_dict()
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_round_trip(seed):
+    rng = random.Random(seed)
+    pool = ["柔光", "暗光", "阴影", "窗边", "写实", "油画", "特写", "高清"]
+
+    def random_schema():
+        data = {field: rng.sample(pool, rng.randint(0, 4)) for field in LIST_FIELDS}
+        data["weights"] = {key: round(rng.uniform(0.1, 1.5), 2) for key in rng.sample(["lighting", "style"], rng.randint(0, 2))}
+        if rng.random() < 0.5:
+            data["mood"] = rng.choice(["平静", rng.sample(pool, 2)])
+        return Schema.from_dict(data, strict=False)
+
+    source, target = random_schema(), random_schema()
+    if "mood" in dict(source.extra) and "mood" not in dict(target.extra):
+        # Diff 无法删除字段：目标中不存在的额外字段以空列表表示
+        target = target.apply({"action": "replace", "field": "mood", "value": []})
+    assert_round_trip(source, target)
+
+
+def test_changed_fields():
+    diff = {"operations": [
+        {"action": "add", "field": "lighting", "values": ["柔光"]},
+        {"action": "adjust", "field": "weights.lighting", "delta": 0.1},
+        {"action": "remove", "field": "lighting", "values": ["暗光"]},
+    ]}
+    assert changed_fields(diff) == ["lighting", "weights"]
@@ -0,0 +1,57 @@
+"""批量反馈合并"""
+import pytest
+
+from app.services.feedback_engine import FeedbackEngine
+
+
+SCHEMA = {
+    "subject": ["橘猫"],
+    "appearance": [],
+    "style": ["写实"],
+    "composition": [],
+    "lighting": ["暗光"],
+    "background": ["复杂背景"],
+    "quality": [],
+    "negative": [],
+    "weights": {"lighting": 1.0},
+}
+
+
+def mock_result(operations):
+    engine = FeedbackEngine(use_real_api=False)
+    diff = {"operations": operations, "reasoning": "合并"}
+    return {"diff": diff, "new_schema": engine._apply_diff(SCHEMA, diff).to_dict(), "prompt": ""}
+
+
+def test_batch_returns_net_diff(monkeypatch):
+    engine = FeedbackEngine(use_real_api=False)
+    monkeypatch.setattr(engine, "_analyze_mock", lambda feedback, schema: mock_result([
+        {"action": "add", "field": "lighting", "values": ["柔光", "逆光"]},
+        {"action": "remove", "field": "lighting", "values": ["逆光"]},
+        {"action": "adjust", "field": "weights.lighting", "delta": 0.2},
+        {"action": "adjust", "field": "weights.lighting", "delta": 0.1},
+    ]))
+    result = engine.analyze_feedback_batch(["更亮", "柔和一点", "更亮"], SCHEMA)
+    assert result["feedbacks"] == ["更亮", "柔和一点"]
+    assert [(op["action"], op["field"]) for op in result["diff"]["operations"]] == [
+        ("add", "lighting"),
+        ("adjust", "weights.lighting"),
+    ]
+    assert result["new_schema"]["lighting"] == ["暗光", "柔光"]
+
+
+def test_batch_that_cancels_out_is_rejected(monkeypatch):
+    engine = FeedbackEngine(use_real_api=False)
+    monkeypatch.setattr(engine, "_analyze_mock", lambda feedback, schema: mock_result([
+        {"action": "add", "field": "lighting", "values": ["柔光"]},
+        {"action": "remove", "field": "lighting", "values": ["柔光"]},
+        {"action": "adjust", "field": "weights.lighting", "delta": 0.2},
+        {"action": "adjust", "field": "weights.lighting", "delta": -0.2},
+    ]))
+    with pytest.raises(ValueError):
+        engine.analyze_feedback_batch(["更亮", "别那么亮"], SCHEMA)
+
+
+def test_empty_batch_is_rejected():
+    with pytest.raises(ValueError):
+        FeedbackEngine(use_real_api=False).analyze_feedback_batch(["", "  "], SCHEMA)
@@ -0,0 +1,33 @@
+"""多候选反馈"""
+import pytest
+
+from app.services.feedback_engine import FeedbackEngine
+
+
+SCHEMA = {
+    "subject": ["橘猫"],
+    "appearance": [],
+    "style": ["写实"],
+    "composition": [],
+    "lighting": ["暗光"],
+    "background": [],
+    "quality": [],
+    "negative": [],
+    "weights": {"lighting": 1.0},
+}
+
+
+@pytest.mark.parametrize("count", range(1, 6))
+def test_mock_returns_count_candidates(count):
+    candidates = FeedbackEngine(use_real_api=False).analyze_feedback_candidates("太暗了", SCHEMA, count)
+    assert len(candidates) == count
+    assert candidates[0]["diff"]["reasoning"].endswith("（标准）")
+    weights = {candidate["new_schema"]["weights"]["lighting"] for candidate in candidates}
+    assert len(weights) == count
+
+
+def test_duplicate_candidates_are_dropped(monkeypatch):
+    engine = FeedbackEngine(use_real_api=False)
+    diff = {"operations": [{"action": "add", "field": "lighting", "values": ["柔光"]}], "reasoning": "提亮"}
+    monkeypatch.setattr(engine, "_candidate_diffs_mock", lambda feedback, schema, count: [diff] * count)
+    assert len(engine.analyze_feedback_candidates("太暗了", SCHEMA, 5)) == 1
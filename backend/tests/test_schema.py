@@ -0,0 +1,133 @@
+"""不可变 Schema 的 Diff 应用与 Diff 校验"""
+import pytest
+
+from app.schemas.prompt import WEIGHT_DEFAULT, WEIGHT_MAX, Schema, validate_schema
+from app.services.feedback_engine import FeedbackEngine
+
+
+BASE = {
+    "subject": ["橘猫"],
+    "appearance": [],
+    "style": ["写实"],
+    "composition": [],
+    "lighting": ["暗光"],
+    "background": ["窗边"],
+    "quality": [],
+    "negative": [],
+    "weights": {"lighting": 1.0},
+}
+
+
+@pytest.fixture
+def schema():
+    return Schema.from_dict(BASE)
+
+
+def test_round_trip(schema):
+    assert schema.to_dict() == BASE
+
+
+def test_apply_shares_untouched_fields(schema):
+    new = schema.apply({"action": "add", "field": "lighting", "values": ["柔光"]})
+    assert new.lighting == ("暗光", "柔光")
+    assert new.subject is schema.subject
+    assert schema.lighting == ("暗光",)
+
+
+def test_schema_is_immutable(schema):
+    with pytest.raises(AttributeError):
+        schema.subject = ("狗",)
+
+
+def test_adjust_clamps_and_defaults(schema):
+    new = schema.apply_diff({"operations": [
+        {"action": "adjust", "field": "weights.lighting", "delta": 1.0},
+        {"action": "adjust", "field": "weights.style", "delta": 0.2},
+    ]})
+    assert new.weight("lighting") == WEIGHT_MAX
+    assert new.weight("style") == pytest.approx(WEIGHT_DEFAULT + 0.2)
+
+
+def test_remove_missing_values_is_noop(schema):
+    assert schema.apply({"action": "remove", "field": "lighting", "values": ["不存在"]}) == schema
+
+
+def test_add_to_scalar_extra_field_keeps_value_whole():
+    # 标量额外字段按单元素列表处理，不能被拆成字符
+    schema = Schema.from_dict({**BASE, "mood": "calm"})
+    new = schema.apply({"action": "add", "field": "mood", "values": ["happy"]})
+    assert new.to_dict()["mood"] == ["calm", "happy"]
+
+
+def test_remove_from_scalar_extra_field():
+    schema = Schema.from_dict({**BASE, "mood": "calm"})
+    assert schema.apply({"action": "remove", "field": "mood", "values": ["calm"]}).to_dict()["mood"] == []
+    assert schema.apply({"action": "remove", "field": "mood", "values": ["c"]}).to_dict()["mood"] == ["calm"]
+
+
+def test_add_to_new_extra_field():
+    new = Schema.from_dict(BASE).apply({"action": "add", "field": "mood", "values": ["happy"]})
+    assert new.to_dict()["mood"] == ["happy"]
+
+
+@pytest.mark.parametrize("op", [
+    {"action": "add", "field": "weights", "values": ["x"]},
+    {"action": "add", "field": "weights.lighting", "values": ["x"]},
+    {"action": "add", "field": "lighting.extra", "values": ["x"]},
+    {"action": "adjust", "field": "weights", "delta": 0.1},
+    {"action": "adjust", "field": "lighting", "delta": 0.1},
+    {"action": "adjust", "field": "weights.lighting.extra", "delta": 0.1},
+    {"action": "replace", "field": "lighting.extra", "value": ["x"]},
+    {"action": "rename", "field": "lighting"},
+])
+def test_apply_diff_rejects_invalid_ops(schema, op):
+    with pytest.raises(ValueError):
+        schema.apply_diff({"operations": [op]})
+
+
+@pytest.mark.parametrize("data", [
+    {**BASE, "subject": "橘猫"},
+    {**BASE, "weights": {"lighting": "高"}},
+    {**BASE, "weights": {"lighting": True}},
+    {key: value for key, value in BASE.items() if key != "style"},
+])
+def test_validate_schema_rejects(data):
+    with pytest.raises(ValueError):
+        validate_schema(data)
+
+
+@pytest.mark.parametrize("diff", [
+    {"operations": [{"action": "add", "field": "lighting", "values": ["柔光"]}]},
+    {"operations": [{"action": "remove", "field": "background", "values": ["窗边"]}]},
+    {"operations": [{"action": "adjust", "field": "weights.lighting", "delta": 0.3}]},
+    {"operations": [{"action": "replace", "field": "weights", "value": {"lighting": 1.2}}]},
+    {"operations": [{"action": "replace", "field": "weights.style", "value": 0.8}]},
+    {"operations": [{"action": "replace", "field": "background", "value": ["纯色背景"]}]},
+])
+def test_validate_diff_accepts(diff):
+    FeedbackEngine(use_real_api=False)._validate_diff(diff)
+
+
+@pytest.mark.parametrize("diff", [
+    [],
+    {},
+    {"operations": []},
+    {"operations": [{"action": "rename", "field": "lighting"}]},
+    {"operations": [{"action": "add", "field": "lighting", "values": []}]},
+    {"operations": [{"action": "add", "field": "lighting", "values": [""]}]},
+    {"operations": [{"action": "add", "field": "weights", "values": ["x"]}]},
+    {"operations": [{"action": "add", "field": "weights.lighting", "values": ["x"]}]},
+    {"operations": [{"action": "remove", "field": "weights.lighting", "values": ["x"]}]},
+    {"operations": [{"action": "add", "field": "lighting.extra", "values": ["x"]}]},
+    {"operations": [{"action": "adjust", "field": "lighting", "delta": 0.1}]},
+    {"operations": [{"action": "adjust", "field": "weights", "delta": 0.1}]},
+    {"operations": [{"action": "adjust", "field": "weights.lighting", "delta": "0.1"}]},
+    {"operations": [{"action": "adjust", "field": "weights.lighting", "delta": True}]},
+    {"operations": [{"action": "adjust", "field": "weights.lighting", "delta": 0.9}]},
+    {"operations": [{"action": "replace", "field": "lighting"}]},
+    {"operations": [{"action": "replace", "field": "weights.lighting", "value": "高"}]},
+    {"operations": [{"action": "replace", "field": "weights", "value": {"lighting": "高"}}]},
+])
+def test_validate_diff_rejects(diff):
+    with pytest.raises(ValueError):
+        FeedbackEngine(use_real_api=False)._validate_diff(diff)
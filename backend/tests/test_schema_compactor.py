@@ -0,0 +1,117 @@
+"""Schema Compactor：去重、近似去重、字段上限、长度预算"""
+from app.schemas.prompt import Schema
+from app.services.prompt_engine import PromptEngine
+from app.services.schema_compactor import CompactionStats, SchemaCompactor, normalize_element
+
+
+def make_schema(**fields):
+    data = {
+        "subject": ["橘猫"],
+        "appearance": [],
+        "style": ["写实"],
+        "composition": [],
+        "lighting": [],
+        "background": [],
+        "quality": [],
+        "negative": [],
+        "weights": {},
+    }
+    data.update(fields)
+    return Schema.from_dict(data)
+
+
+def compactor(similarity_threshold=0.7, field_caps=None, char_budget=0):
+    return SchemaCompactor(
+        similarity_threshold=similarity_threshold,
+        field_caps=field_caps or {},
+        char_budget=char_budget
+    )
+
+
+def test_normalize_element():
+    assert normalize_element("ＨＤ 高清！") == normalize_element("hd高清")
+
+
+def test_exact_duplicates():
+    schema, report = compactor().compact(make_schema(lighting=["柔光", "柔光 ", "ＨＤ", "hd"]))
+    assert schema.lighting == ("柔光", "ＨＤ")
+    assert report["duplicates"] == 2
+    assert report["near_duplicates"] == 0
+
+
+def test_near_duplicates():
+    schema, report = compactor().compact(make_schema(lighting=["更亮的环境光", "更亮环境光", "逆光"]))
+    assert schema.lighting == ("更亮的环境光", "逆光")
+    assert report["near_duplicates"] == 1
+
+
+def test_near_duplicates_disabled():
+    values = ["更亮的环境光", "更亮的环境光线"]
+    schema, report = compactor(similarity_threshold=0).compact(make_schema(lighting=values))
+    assert schema.lighting == tuple(values)
+    assert report["near_duplicates"] == 0
+
+
+def test_field_cap_keeps_newest():
+    schema, report = compactor(field_caps={"lighting": 2}).compact(
+        make_schema(lighting=["逆光", "柔光", "侧光"])
+    )
+    assert schema.lighting == ("柔光", "侧光")
+    assert report["capped"] == 1
+
+
+def test_field_cap_keeps_subject():
+    schema, _ = compactor(field_caps={"subject": 2}).compact(make_schema(subject=["橘猫", "窗台", "阳光"]))
+    assert schema.subject == ("橘猫", "阳光")
+
+
+def test_budget_trims_lowest_weight_field_first():
+    schema = make_schema(
+        lighting=["逆光", "柔光", "侧光"],
+        background=["城市夜景", "雨后街道", "霓虹灯牌"],
+        weights={"lighting": 1.2, "background": 0.3}
+    )
+    budget = len(PromptEngine()._render_prompt(schema)) - 1
+    compacted, report = compactor(similarity_threshold=0, char_budget=budget).compact(schema)
+    assert len(PromptEngine()._render_prompt(compacted)) <= budget
+    assert compacted.background == ("雨后街道", "霓虹灯牌")
+    assert compacted.lighting == schema.lighting
+    assert report["trimmed"] == 1
+    assert report["chars_saved"] > 0
+
+
+def test_budget_keeps_one_element_per_field():
+    schema = make_schema(subject=["橘猫", "窗台"], lighting=["逆光", "柔光"])
+    compacted, _ = compactor(similarity_threshold=0, char_budget=1).compact(schema)
+    assert compacted.subject == ("橘猫",)
+    assert compacted.lighting == ("柔光",)
+    assert compacted.style == ("写实",)
+
+
+def test_operations_replay_to_compacted_schema():
+    schema = make_schema(lighting=["柔光", "柔光", "逆光", "侧光"], background=["窗边", "窗边"])
+    compacted, report = compactor(field_caps={"lighting": 2}).compact(schema)
+    assert [op["field"] for op in report["operations"]] == ["lighting", "background"]
+    assert schema.apply_diff({"operations": report["operations"]}) == compacted
+
+
+def test_clean_schema_is_unchanged():
+    schema = make_schema(lighting=["柔光"])
+    compacted, report = compactor(field_caps={"lighting": 4}, char_budget=10000).compact(schema)
+    assert compacted == schema
+    assert report["operations"] == []
+    assert report["chars_saved"] == 0
+    assert report["tokens_saved"] == 0
+
+
+def test_stats_record():
+    stats = CompactionStats()
+    _, first = compactor().compact(make_schema(lighting=["柔光", "柔光"]))
+    _, second = compactor().compact(make_schema())
+    stats.record(first)
+    stats.record(second)
+    snapshot = stats.snapshot()
+    assert snapshot["runs"] == 2
+    assert snapshot["compacted"] == 1
+    assert snapshot["removed"]["duplicates"] == 1
+    assert snapshot["chars_saved"] == first["chars_saved"] > 0
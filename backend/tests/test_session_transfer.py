@@ -0,0 +1,76 @@
+"""会话导入：图片放置与回滚"""
+import hashlib
+import io
+import json
+import tarfile
+
+from app.models import Session, Version
+from app.services.session_transfer import SessionImporter
+
+SESSION_ID = "00000000-0000-0000-0000-000000000001"
+VERSION_ID = "00000000-0000-0000-0000-000000000002"
+
+
+def build_archive(image: bytes, image_name: str) -> io.BytesIO:
+    digest = hashlib.sha256(image).hexdigest()
+    records = [
+        {"type": "session", "id": SESSION_ID, "name": "导入会话"},
+        {
+            "type": "version",
+            "id": VERSION_ID,
+            "session_id": SESSION_ID,
+            "version_number": 1,
+            "user_input": "橘猫",
+            "schema": {"subject": ["橘猫"]},
+            "prompt": "橘猫",
+            "image_name": image_name,
+            "image_file": f"images/{digest}.png",
+        },
+    ]
+    members = [
+        (f"images/{digest}.png", image),
+        ("records-000001.ndjson", "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode()),
+    ]
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    buffer.seek(0)
+    return buffer
+
+
+def test_import_places_image(db, storage):
+    stats = SessionImporter(db).import_archive(build_archive(b"imported", "shared.png"))
+    assert stats["versions_imported"] == 1
+    assert (storage / "shared.png").read_bytes() == b"imported"
+
+
+def test_import_reuses_identical_image(db, storage):
+    (storage / "shared.png").write_bytes(b"imported")
+    stats = SessionImporter(db).import_archive(build_archive(b"imported", "shared.png"))
+    assert stats["images_skipped"] == 1
+    assert db.get(Version, VERSION_ID).image_path == str(storage / "shared.png")
+
+
+def test_import_does_not_overwrite_differing_image(db, storage):
+    existing = storage / "shared.png"
+    existing.write_bytes(b"other session")
+
+    importer = SessionImporter(db, commit=False)
+    importer.import_archive(build_archive(b"imported", "shared.png"))
+
+    version = db.get(Version, VERSION_ID)
+    placed = storage / version.image_path.rsplit("/", 1)[-1]
+    assert placed != existing
+    assert placed.read_bytes() == b"imported"
+    assert version.image_url.endswith(f"/images/{placed.name}")
+    assert existing.read_bytes() == b"other session"
+
+    # 回滚只删除本次新放置的图片，已有图片保持不变
+    importer.discard()
+    assert not placed.exists()
+    assert existing.read_bytes() == b"other session"
+    assert db.get(Session, SESSION_ID) is None
+    assert sorted(path.name for path in storage.iterdir()) == ["shared.png"]